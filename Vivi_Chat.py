@@ -1,8 +1,9 @@
-import time
+import os
 
 import streamlit as st
 
 from modelo_com_rag import RAGPipeline 
+from servidor_de_inferencia import ServidorDeInferencia
 
 AZUL_TRANSPARENTE = '#5BCEFA'
 ROSA_TRANSPARENTE = '#F5A9B8'
@@ -108,16 +109,29 @@ def tela_3():
     """, unsafe_allow_html=True)
 
 
+@st.cache_resource
+def obter_servidor_de_inferencia():
+    # Um único modelo por processo, compartilhado por todas as sessões do Streamlit
+    rag = RAGPipeline(
+        nome_modelo="CEIA-UFG/Gemma-3-Gaia-PT-BR-4b-it",
+        nome_modelo_ollama_avaliador = "llama2",
+        caminho_faiss="faiss.index",
+        caminho_id_texto="id_para_texto.json",
+        # Backend de geração: hf, hf_bf16, hf_int8 ou llama_cpp (este último com VIVI_GGUF apontando para o modelo)
+        backend=os.environ.get("VIVI_BACKEND", "hf"),
+        caminho_gguf=os.environ.get("VIVI_GGUF"),
+        # Métricas de latência por etapa em http://127.0.0.1:<porta>/metrics e/ou despejadas num arquivo
+        porta_metricas=int(os.environ["VIVI_PORTA_METRICAS"]) if os.environ.get("VIVI_PORTA_METRICAS") else None,
+        arquivo_metricas=os.environ.get("VIVI_ARQUIVO_METRICAS"),
+        # Fração das respostas avaliadas em segundo plano com as referências de referencias_avaliacao.json
+        taxa_amostragem_avaliacao=float(os.environ.get("VIVI_TAXA_AVALIACAO", "0.1"))
+    )
+    return ServidorDeInferencia(rag).iniciar()
+
+
 class InterfaceVivi:
     def __init__(self):
-        if "rag" not in st.session_state:
-            st.session_state.rag = RAGPipeline(
-                nome_modelo="CEIA-UFG/Gemma-3-Gaia-PT-BR-4b-it",
-                nome_modelo_ollama_avaliador = "llama2",
-                caminho_faiss="faiss.index",
-                caminho_id_texto="id_para_texto.json"
-            )
-        self.rag = st.session_state.rag
+        self.rag = obter_servidor_de_inferencia()
         self._configurar_pagina()
         self._inicializar_historico()
 
@@ -153,8 +167,8 @@ class InterfaceVivi:
             unsafe_allow_html=True,
         )
 
-    def mensagem_bot(self, texto):
-        st.markdown(
+    def mensagem_bot(self, texto, espaco=None):
+        (espaco or st).markdown(
             f"""
             <div style='
                 background-color: #A9E2F3;
@@ -175,7 +189,20 @@ class InterfaceVivi:
             unsafe_allow_html=True,
         )
 
+    def exibir_estado_de_carregamento(self):
+        if self.rag.pronto():
+            return
+        estados = self.rag.estado_recursos()
+        carregados = sum(1 for estado in estados.values() if estado == "pronto")
+        st.info(f"A Vivi ainda está se preparando ({carregados}/{len(estados)} recursos carregados). Você já pode enviar sua mensagem, ela será respondida assim que tudo estiver pronto.")
+        for recurso, estado in estados.items():
+            if estado.startswith("erro"):
+                st.error(f"Falha ao carregar '{recurso}': {estado}")
+
+
     def executar(self):
+        self.exibir_estado_de_carregamento()
+
         for message in st.session_state.messages:
             if message["role"] == "user":
                 self.mensagem_usuario(message["content"])
@@ -188,22 +215,40 @@ class InterfaceVivi:
             st.session_state.messages.append({"role": "user", "content": user_input})
             self.mensagem_usuario(user_input)
 
-            with st.spinner("Pensando..."):
-                time.sleep(0.5) # Pequeno atraso para simular processamento
-                try:
-                    resposta = self.rag.gerar_resposta(user_input)
-                except Exception as e:
-                    resposta = f"Desculpe, ocorreu um erro ao gerar a resposta: {e}"
-                    st.error(resposta)
+            espaco_resposta = st.empty()
+            resposta = ""
+
+            try:
+                with st.spinner("Pensando..."):
+                    fluxo = self.rag.iter_resposta(user_input)
+                    primeiro_pedaco = next(fluxo, None)
+
+                if primeiro_pedaco is not None:
+                    resposta = primeiro_pedaco
+                    self.mensagem_bot(resposta, espaco_resposta)
+                    while True:
+                        try:
+                            resposta += next(fluxo)
+                        except StopIteration as fim:
+                            # O gerador devolve a resposta pós-processada, que é a que fica no histórico
+                            resposta = fim.value or resposta
+                            break
+                        self.mensagem_bot(resposta, espaco_resposta)
+            except Exception as e:
+                resposta = f"Desculpe, ocorreu um erro ao gerar a resposta: {e}"
+                st.error(resposta)
 
             st.session_state.messages.append({"role": "bot", "content": resposta})
-            self.mensagem_bot(resposta)
+            self.mensagem_bot(resposta, espaco_resposta)
 
 
 def main():
     if "tela" not in st.session_state:
         st.session_state.tela = 1
 
+    # Dispara o carregamento dos modelos em segundo plano enquanto as telas de apresentação são exibidas
+    obter_servidor_de_inferencia()
+
     estilizacao_com_css()
 
     if st.session_state.tela == 1:
@@ -0,0 +1,195 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import random
+import time
+from threading import Lock, Thread
+
+from indice_lexical import normalizar_texto
+from registro_de_eventos import RegistradorDeEventos, ler_eventos
+
+_metricas_opik = None
+_trava_opik = Lock()
+
+
+def configurar_opik():
+    # O opik é importado e configurado no primeiro uso, e não na importação do módulo
+    global _metricas_opik
+    with _trava_opik:
+        if _metricas_opik is None:
+            import opik
+            from opik.evaluation.metrics import Equals, Contains, LevenshteinRatio
+
+            opik.configure(workspace="chatbot_vivi", use_local=True, automatic_approvals=True)
+
+            _metricas_opik = {
+                "e_igual_a": Equals(),
+                "contem": Contains(case_sensitive=False),
+                "levenshtein": LevenshteinRatio()
+            }
+    return _metricas_opik
+
+
+class ReferenciasDeAvaliacao:
+    # Conjuntos de referências por intenção: cada conjunto vale para as perguntas roteadas para uma
+    # das suas intenções ou que contêm um dos seus gatilhos, e traz a referência de cada métrica
+    # (e_igual_a, contem, regex, levenshtein). Perguntas sem conjunto são registradas sem pontuação.
+    def __init__(self, conjuntos: list):
+        self.conjuntos = conjuntos
+        for conjunto in conjuntos:
+            conjunto["gatilhos"] = [normalizar_texto(gatilho) for gatilho in conjunto.get("gatilhos", [])]
+
+
+    @classmethod
+    def carregar(cls, caminho: str):
+        if not os.path.exists(caminho):
+            print(f"Referências de avaliação '{caminho}' não encontradas; as respostas serão registradas sem pontuação.")
+            return cls([])
+        with open(caminho, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["conjuntos"])
+
+
+    def selecionar(self, pergunta: str, intencao: str = None):
+        pergunta_normalizada = normalizar_texto(pergunta)
+        for conjunto in self.conjuntos:
+            if intencao is not None and intencao in conjunto.get("intencoes", []):
+                return conjunto
+            if any(gatilho in pergunta_normalizada for gatilho in conjunto["gatilhos"]):
+                return conjunto
+        return None
+
+
+def pontuar(metricas: dict, resposta: str, conjunto: dict) -> dict:
+    pontuacoes = {}
+    if "e_igual_a" in conjunto:
+        pontuacoes["e_igual_a"] = metricas["e_igual_a"].score(output=resposta, reference=conjunto["e_igual_a"]).value
+    if "contem" in conjunto:
+        pontuacoes["contem"] = metricas["contem"].score(output=resposta, reference=conjunto["contem"]).value
+    if "regex" in conjunto:
+        if ("regex", conjunto["regex"]) not in metricas:
+            from opik.evaluation.metrics import RegexMatch
+            metricas[("regex", conjunto["regex"])] = RegexMatch(regex=conjunto["regex"])
+        pontuacoes["regex"] = metricas[("regex", conjunto["regex"])].score(output=resposta).value
+    if "levenshtein" in conjunto:
+        pontuacoes["levenshtein"] = metricas["levenshtein"].score(output=resposta, reference=conjunto["levenshtein"]).value
+    return pontuacoes
+
+
+class AvaliadorEmSegundoPlano:
+    # Avaliação fora do caminho da resposta: a requisição só sorteia (taxa de amostragem) e põe
+    # (pergunta, resposta, contexto) numa fila limitada; uma thread pontua em lotes com as métricas
+    # do opik e grava os resultados em bloco. Com a fila cheia, a avaliação é descartada, nunca esperada.
+    def __init__(self, referencias: ReferenciasDeAvaliacao, arquivo_avaliacoes: str, taxa_amostragem: float = 0.1, tamanho_lote: int = 32, max_fila: int = 1000, semente: int = None):
+        self.referencias = referencias
+        self.taxa_amostragem = taxa_amostragem
+        self.tamanho_lote = tamanho_lote
+        self.registrador = RegistradorDeEventos.para_arquivo(arquivo_avaliacoes)
+
+        self.fila = queue.Queue(maxsize=max_fila)
+        self.aleatorio = random.Random(semente)
+        self.trava = Lock()
+        self.amostradas = 0
+        self.descartadas = 0
+        self.avaliadas = 0
+        self.metricas_indisponiveis = False
+
+        self.thread = Thread(target=self._laco, name="avaliador-de-respostas", daemon=True)
+        self.thread.start()
+        atexit.register(self.fechar)
+
+
+    def enfileirar(self, pergunta: str, resposta: str, contexto: str = None, intencao: str = None) -> bool:
+        with self.trava:
+            if self.aleatorio.random() >= self.taxa_amostragem:
+                return False
+            self.amostradas += 1
+        try:
+            self.fila.put_nowait({"pergunta": pergunta, "resposta": resposta, "contexto": contexto, "intencao": intencao, "timestamp": time.time()})
+            return True
+        except queue.Full:
+            with self.trava:
+                self.descartadas += 1
+            return False
+
+
+    def _laco(self):
+        while True:
+            item = self.fila.get()
+            if item is None:
+                return
+            lote = [item]
+            while len(lote) < self.tamanho_lote:
+                try:
+                    item = self.fila.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.avaliar_lote(lote)
+                    return
+                lote.append(item)
+            self.avaliar_lote(lote)
+
+
+    def _metricas(self):
+        if self.metricas_indisponiveis:
+            return None
+        try:
+            return configurar_opik()
+        except Exception as e:
+            print(f"Métricas do opik indisponíveis ({e}); as avaliações serão registradas sem pontuação.")
+            self.metricas_indisponiveis = True
+            return None
+
+
+    def avaliar_lote(self, lote: list):
+        metricas = self._metricas()
+        for item in lote:
+            conjunto = self.referencias.selecionar(item["pergunta"], item.get("intencao"))
+            pontuacoes = {}
+            if conjunto is not None and metricas is not None:
+                try:
+                    pontuacoes = pontuar(metricas, item["resposta"], conjunto)
+                except Exception as e:
+                    pontuacoes = {"erro": str(e)}
+            self.registrador.registrar({**item, "referencias": conjunto["nome"] if conjunto else None, "pontuacoes": pontuacoes, "avaliado_em": time.strftime("%Y-%m-%d %H:%M:%S")})
+        with self.trava:
+            self.avaliadas += len(lote)
+
+
+    def fechar(self):
+        # Avalia o que ainda está na fila antes de o processo terminar
+        if not self.thread.is_alive():
+            return
+        self.fila.put(None)
+        self.thread.join(timeout=30)
+        self.registrador.descarregar()
+
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            return {
+                "amostradas": self.amostradas,
+                "descartadas": self.descartadas,
+                "avaliadas": self.avaliadas,
+                "na_fila": self.fila.qsize()
+            }
+
+
+if __name__ == "__main__":
+    # Avaliação em lote, fora do servidor: pontua as respostas já registradas no log
+    parser = argparse.ArgumentParser(description="Avalia em lote as respostas geradas registradas no log.")
+    parser.add_argument("--log", default="log.jsonl")
+    parser.add_argument("--referencias", default="referencias_avaliacao.json")
+    parser.add_argument("--saida", default="avaliacoes_lote.jsonl")
+    parser.add_argument("--taxa-amostragem", type=float, default=1.0)
+    parser.add_argument("--tamanho-lote", type=int, default=256)
+    args = parser.parse_args()
+
+    avaliador = AvaliadorEmSegundoPlano(ReferenciasDeAvaliacao.carregar(args.referencias), args.saida, args.taxa_amostragem, args.tamanho_lote, max_fila=0)
+    for evento in ler_eventos(args.log):
+        if evento.get("evento") == "resposta_gerada":
+            avaliador.enfileirar(evento["pergunta"], evento["resposta"])
+    avaliador.fechar()
+    print(f"{avaliador.estatisticas()['avaliadas']} respostas avaliadas; resultados em '{args.saida}'.")
@@ -0,0 +1,95 @@
+from threading import Lock
+
+# Todo backend devolve um objeto com a interface de geração do transformers usada pelo RAGPipeline:
+# .device e .generate(input_ids, attention_mask, max_new_tokens, streamer, stopping_criteria, ...),
+# devolvendo prompt + tokens novos. Os backends "hf*" são o próprio modelo do transformers.
+BACKENDS = ("hf", "hf_bf16", "hf_int8", "llama_cpp")
+
+
+def criar_backend(nome_modelo: str, backend: str = "hf", caminho_gguf: str = None, threads: int = None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Backend de geração inválido: {backend}. Use um de {BACKENDS}.")
+    if backend == "llama_cpp":
+        return ModeloLlamaCpp(caminho_gguf, threads)
+
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    if threads:
+        torch.set_num_threads(threads)
+
+    if backend == "hf":
+        dispositivo = "cuda" if torch.cuda.is_available() else "cpu"
+        modelo = AutoModelForCausalLM.from_pretrained(
+            nome_modelo,
+            device_map="auto" if dispositivo == "cuda" else None,
+            torch_dtype=torch.float16 if dispositivo == "cuda" else torch.float32
+        )
+        modelo.to(dispositivo)
+
+    elif backend == "hf_bf16":
+        # Metade da memória do float32; rápido em CPUs com AVX512-BF16/AMX, funcional (mais lento) nas demais
+        modelo = AutoModelForCausalLM.from_pretrained(nome_modelo, torch_dtype=torch.bfloat16, low_cpu_mem_usage=True)
+
+    else:
+        # Quantização dinâmica: pesos das camadas lineares em int8, ativações quantizadas em tempo de execução
+        modelo = AutoModelForCausalLM.from_pretrained(nome_modelo, torch_dtype=torch.float32, low_cpu_mem_usage=True)
+        modelo = torch.ao.quantization.quantize_dynamic(modelo, {torch.nn.Linear}, dtype=torch.qint8)
+
+    modelo.eval()
+    return modelo
+
+
+def suporta_cache_de_prefixo(backend: str) -> bool:
+    # O llama.cpp já reaproveita sozinho o prefixo em comum com a avaliação anterior
+    return backend != "llama_cpp"
+
+
+def suporta_lote(modelo) -> bool:
+    return getattr(modelo, "suporta_lote", True)
+
+
+class ModeloLlamaCpp:
+    # Adaptador de um modelo GGUF (llama-cpp-python) para a interface de geração do transformers.
+    # O GGUF convertido do mesmo checkpoint mantém o vocabulário, então o tokenizer do HF continua
+    # valendo. Gera um prompt por vez; streamer e critério de parada são chamados a cada token.
+    suporta_lote = False
+
+    def __init__(self, caminho_gguf: str, threads: int = None, tamanho_contexto: int = 4096):
+        import torch
+        from llama_cpp import Llama
+
+        if not caminho_gguf:
+            raise ValueError("O backend llama_cpp precisa do caminho do modelo GGUF.")
+        self.llama = Llama(model_path=caminho_gguf, n_ctx=tamanho_contexto, n_threads=threads, logits_all=False, verbose=False)
+        self.device = torch.device("cpu")
+        self.trava = Lock()
+
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens: int = 200, streamer=None, stopping_criteria=None, do_sample: bool = False, temperature: float = 0.7, top_p: float = 0.9, repetition_penalty: float = 1.0, **ignorados):
+        import torch
+
+        if input_ids.shape[0] != 1:
+            raise ValueError("O backend llama_cpp gera um prompt por vez.")
+
+        ids_prompt = input_ids[0][attention_mask[0].bool()].tolist() if attention_mask is not None else input_ids[0].tolist()
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+
+        fim = self.llama.token_eos()
+        novos = []
+        with self.trava:
+            for token in self.llama.generate(ids_prompt, temp=temperature if do_sample else 0.0, top_p=top_p, repeat_penalty=repetition_penalty):
+                if token == fim:
+                    break
+                novos.append(token)
+                if streamer is not None:
+                    streamer.put(torch.tensor([token]))
+                if len(novos) >= max_new_tokens:
+                    break
+                if stopping_criteria is not None and bool(stopping_criteria(torch.tensor([ids_prompt + novos]), None).all()):
+                    break
+
+        if streamer is not None:
+            streamer.end()
+        return torch.tensor([input_ids[0].tolist() + novos])
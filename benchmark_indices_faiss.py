@@ -0,0 +1,113 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from fabrica_de_indices import TIPOS_INDICE, criar_indice_faiss
+
+
+def carregar_vetores_do_corpus(caminho_embeddings, caminho_textos, nome_modelo_embedding):
+    # Usa os embeddings já salvos pelo indexador; sem eles, codifica os textos do corpus
+    if os.path.exists(caminho_embeddings):
+        vetores = np.load(caminho_embeddings)['vetores'].astype('float32')
+    else:
+        from sentence_transformers import SentenceTransformer
+        with open(caminho_textos, 'r', encoding='utf-8') as f:
+            textos = list(json.load(f).values())
+        vetores = SentenceTransformer(nome_modelo_embedding).encode(textos, convert_to_numpy=True).astype('float32')
+    return normalizar(vetores)
+
+
+def normalizar(vetores):
+    normas = np.linalg.norm(vetores, axis=1, keepdims=True)
+    return vetores / np.maximum(normas, 1e-12)
+
+
+def ampliar_corpus(vetores, fator, ruido, gerador):
+    # Corpus sintético: cópias perturbadas dos vetores reais, preservando a estrutura de agrupamentos
+    if fator <= 1:
+        return vetores
+    copias = np.repeat(vetores, fator, axis=0)
+    return normalizar(copias + gerador.normal(0, ruido, copias.shape).astype('float32'))
+
+
+def percentil_ms(latencias, p):
+    return float(np.percentile(latencias, p) * 1000)
+
+
+def medir_indice(tipo, corpus, consultas, k, parametros, ids_exatos=None):
+    inicio = time.perf_counter()
+    indice, parametros_efetivos = criar_indice_faiss(corpus.shape[1], tipo=tipo, metrica="ip", vetores_treino=corpus, parametros=parametros)
+    indice.add(corpus)
+    tempo_construcao = time.perf_counter() - inicio
+
+    # Uma consulta por vez, como no atendimento real
+    latencias = []
+    resultados = []
+    for consulta in consultas:
+        inicio = time.perf_counter()
+        _, ids = indice.search(consulta[None, :], k)
+        latencias.append(time.perf_counter() - inicio)
+        resultados.append(ids[0])
+    resultados = np.vstack(resultados)
+
+    recall = None
+    if ids_exatos is not None:
+        acertos = [len(set(aprox) & set(exato)) / k for aprox, exato in zip(resultados, ids_exatos)]
+        recall = float(np.mean(acertos))
+
+    return {
+        "tipo": tipo,
+        "parametros": parametros_efetivos,
+        "construcao_s": tempo_construcao,
+        "p50_ms": percentil_ms(latencias, 50),
+        "p99_ms": percentil_ms(latencias, 99),
+        "recall_at_k": recall
+    }, resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara recall@k e latência dos índices FAISS contra a busca exata (flat).")
+    parser.add_argument("--embeddings", default="embeddings_segmentos.npz")
+    parser.add_argument("--textos", default="id_para_texto.json")
+    parser.add_argument("--modelo-embedding", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--fatores", type=int, nargs="+", default=[1, 100, 1000], help="Multiplicadores do corpus real (1 = corpus real).")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--ruido", type=float, default=0.05)
+    parser.add_argument("--tipos", nargs="+", default=list(TIPOS_INDICE), choices=TIPOS_INDICE)
+    parser.add_argument("--parametros", type=json.loads, default={}, help='Parâmetros por tipo em JSON, ex.: \'{"hnsw": {"ef_busca": 32}}\'.')
+    parser.add_argument("--saida", default=None, help="Arquivo JSON para salvar os resultados.")
+    args = parser.parse_args()
+
+    gerador = np.random.default_rng(42)
+    corpus_real = carregar_vetores_do_corpus(args.embeddings, args.textos, args.modelo_embedding)
+    print(f"Corpus real: {corpus_real.shape[0]} vetores de dimensão {corpus_real.shape[1]}")
+
+    todos_resultados = []
+    for fator in args.fatores:
+        corpus = ampliar_corpus(corpus_real, fator, args.ruido, gerador)
+        # Consultas: vetores do corpus com ruído, simulando perguntas próximas dos trechos
+        amostra = corpus[gerador.integers(0, len(corpus), args.consultas)]
+        consultas = normalizar(amostra + gerador.normal(0, args.ruido * 2, amostra.shape).astype('float32'))
+        k = min(args.k, len(corpus))
+
+        print(f"\n== {len(corpus)} vetores ({'real' if fator <= 1 else f'sintético x{fator}'}), k={k} ==")
+        print(f"{'tipo':>6} | {'recall@k':>8} | {'p50 (ms)':>9} | {'p99 (ms)':>9} | {'construção (s)':>14} | parâmetros")
+
+        resultado_flat, ids_exatos = medir_indice("flat", corpus, consultas, k, {})
+        for tipo in args.tipos:
+            if tipo == "flat":
+                resultado = dict(resultado_flat, recall_at_k=1.0)
+            else:
+                resultado, _ = medir_indice(tipo, corpus, consultas, k, args.parametros.get(tipo, {}), ids_exatos)
+            resultado.update({"vetores": len(corpus), "fator": fator, "k": k})
+            todos_resultados.append(resultado)
+            print(f"{tipo:>6} | {resultado['recall_at_k']:>8.3f} | {resultado['p50_ms']:>9.3f} | {resultado['p99_ms']:>9.3f} | {resultado['construcao_s']:>14.2f} | {resultado['parametros']}")
+
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as f:
+            json.dump(todos_resultados, f, ensure_ascii=False, indent=2)
+        print(f"\nResultados salvos em '{args.saida}'.")
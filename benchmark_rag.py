@@ -0,0 +1,436 @@
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+from threading import Lock
+
+import numpy as np
+
+from carregador_de_recursos import RegistroDeRecursos, carregar_pacote_de_indice
+from indice_lexical import normalizar_texto, tokenizar
+from metricas_de_latencia import ColetorDeMetricas
+from modelo_com_rag import RAGPipeline
+from registro_de_eventos import ler_eventos
+
+PADRAO_TOKEN = re.compile(r"\s*\S+|\s+")
+
+# Métrica, direção (1 = maior é melhor) e rótulo, na comparação com um resultado anterior
+METRICAS_COMPARADAS = [
+    ("vazao_perguntas_por_segundo", 1, "vazão (perguntas/s)"),
+    ("latencia_ms.p50", -1, "latência p50 (ms)"),
+    ("latencia_ms.p95", -1, "latência p95 (ms)"),
+    ("latencia_ms.p99", -1, "latência p99 (ms)"),
+    ("primeiro_pedaco_ms.p95", -1, "primeiro pedaço p95 (ms)"),
+    ("recuperacao.recall_at_k", 1, "recall@k"),
+    ("recuperacao.mrr", 1, "MRR"),
+    ("respostas.f1", 1, "F1 das respostas"),
+    ("respostas.cobertura_termos", 1, "cobertura de termos"),
+    ("caminhos_corretos", 1, "caminhos esperados")
+]
+
+
+class TokenizerDePalavras:
+    # Tokenizer mínimo para os modelos substitutos: cada palavra (com o espaço à esquerda) é um
+    # token, o que torna encode/decode exatos. Tem só a interface usada pelo pipeline.
+    eos_token_id = 0
+    pad_token_id = 0
+
+    def __init__(self):
+        self.vocabulario = {"<eos>": 0}
+        self.tokens = ["<eos>"]
+        self.trava = Lock()
+
+
+    def _id(self, token: str) -> int:
+        with self.trava:
+            if token not in self.vocabulario:
+                self.vocabulario[token] = len(self.tokens)
+                self.tokens.append(token)
+            return self.vocabulario[token]
+
+
+    def encode(self, texto: str, add_special_tokens: bool = False) -> list:
+        return [self._id(token) for token in PADRAO_TOKEN.findall(texto)]
+
+
+    def __call__(self, texto: str, add_special_tokens: bool = True) -> dict:
+        return {"input_ids": self.encode(texto)}
+
+
+    def decode(self, ids, skip_special_tokens: bool = True) -> str:
+        ids = ids.tolist() if hasattr(ids, "tolist") else ids
+        return "".join(self.tokens[i] for i in ids if not (skip_special_tokens and i == self.eos_token_id))
+
+
+    def batch_decode(self, lista_ids, skip_special_tokens: bool = True) -> list:
+        return [self.decode(ids, skip_special_tokens) for ids in lista_ids]
+
+
+    def get_vocab(self) -> dict:
+        with self.trava:
+            return dict(self.vocabulario)
+
+
+class ModeloExtrativo:
+    # Modelo de linguagem substituto: "responde" copiando o início do contexto do prompt, um token
+    # por passo, com atrasos fixos por token de prompt (prefill) e por token gerado. Respeita
+    # streamer, critério de parada e padding à esquerda, então mede o pipeline inteiro sem GPU.
+    def __init__(self, obter_tamanho_prefixo, segundos_por_token_prompt: float = 0.00002, segundos_por_token: float = 0.005):
+        self.obter_tamanho_prefixo = obter_tamanho_prefixo
+        self.segundos_por_token_prompt = segundos_por_token_prompt
+        self.segundos_por_token = segundos_por_token
+
+
+    @property
+    def device(self):
+        import torch
+        return torch.device("cpu")
+
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens: int = 200, streamer=None, stopping_criteria=None, pad_token_id: int = 0, **ignorados):
+        import torch
+
+        if streamer is not None:
+            streamer.put(input_ids.cpu())
+        time.sleep(self.segundos_por_token_prompt * input_ids.numel())
+
+        lote, tamanho = input_ids.shape
+        preenchimento = (attention_mask == 0).sum(dim=1).tolist() if attention_mask is not None else [0] * lote
+        inicio = self.obter_tamanho_prefixo()
+        sequencias = input_ids
+        terminadas = torch.zeros(lote, dtype=torch.bool)
+
+        for passo in range(max_new_tokens):
+            time.sleep(self.segundos_por_token)
+            novos = []
+            for i in range(lote):
+                posicao = preenchimento[i] + inicio + passo
+                if terminadas[i] or posicao >= tamanho:
+                    terminadas[i] = True
+                    novos.append(pad_token_id)
+                else:
+                    novos.append(int(input_ids[i, posicao]))
+            novos = torch.tensor(novos, dtype=torch.long)
+            sequencias = torch.cat([sequencias, novos[:, None]], dim=1)
+            if streamer is not None:
+                streamer.put(novos)
+            if stopping_criteria is not None:
+                terminadas |= stopping_criteria(sequencias, None).cpu()
+            if bool(terminadas.all()):
+                break
+
+        if streamer is not None:
+            streamer.end()
+        return sequencias
+
+
+class EmbeddingPorHash:
+    # Modelo de embedding substituto: saco de radicais com hashing numa dimensão fixa, normalizado
+    def __init__(self, dimensao: int = 256):
+        self.dimensao = dimensao
+
+
+    def encode(self, textos, batch_size: int = 32, convert_to_numpy: bool = True, show_progress_bar: bool = False, **ignorados):
+        vetores = np.zeros((len(textos), self.dimensao), dtype=np.float32)
+        for i, texto in enumerate(textos):
+            for termo in tokenizar(texto):
+                vetores[i, zlib.crc32(termo.encode("utf-8")) % self.dimensao] += 1.0
+        return vetores / np.maximum(np.linalg.norm(vetores, axis=1, keepdims=True), 1e-12)
+
+
+class IndiceExato:
+    # Busca exata por produto interno, com a mesma interface de search do FAISS
+    def __init__(self, ids: list, vetores):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vetores = vetores
+        self.ntotal = len(ids)
+
+
+    def search(self, consultas, k: int):
+        similaridades = consultas @ self.vetores.T
+        ordem = np.argsort(-similaridades, axis=1)[:, :k]
+        return np.take_along_axis(similaridades, ordem, axis=1), self.ids[ordem]
+
+
+class RegistroComSubstitutos(RegistroDeRecursos):
+    # Troca o carregador dos recursos de alguns tipos (o prefixo do nome, ex.: "modelo") por substitutos
+    def __init__(self, substitutos: dict):
+        super().__init__()
+        self.substitutos = substitutos
+
+
+    def registrar(self, nome: str, carregador):
+        return super().registrar(nome, self.substitutos.get(nome.split(":", 1)[0], carregador))
+
+
+def substitutos_leves(args, obter_rag):
+    embedding = EmbeddingPorHash()
+
+    def indice_exato():
+        pacote = carregar_pacote_de_indice(args.pacote, args.textos)
+        ids, textos = zip(*pacote.itens())
+        return IndiceExato(list(ids), embedding.encode(list(textos)))
+
+    return {
+        "tokenizer": TokenizerDePalavras,
+        "modelo": lambda: ModeloExtrativo(lambda: len(obter_rag().empacotador.ids_prefixo()), args.segundos_por_token_prompt, args.segundos_por_token),
+        "embedding": lambda: embedding,
+        "faiss": indice_exato,
+        "metadados": lambda: {"normalizado": True, "metrica": "ip"}
+    }
+
+
+def criar_pipeline(args, diretorio_logs: str):
+    criado = {}
+    registro = RegistroComSubstitutos(substitutos_leves(args, lambda: criado["rag"])) if args.modelos == "leves" else RegistroDeRecursos()
+
+    criado["rag"] = RAGPipeline(
+        nome_modelo=args.modelo,
+        nome_modelo_ollama_avaliador="llama2",
+        caminho_faiss=args.faiss,
+        caminho_id_texto=args.textos,
+        caminho_pacote=args.pacote,
+        redis_host=args.redis_host,
+        arquivo_log=os.path.join(diretorio_logs, "log.jsonl"),
+        arquivo_avaliacoes=os.path.join(diretorio_logs, "avaliacoes.jsonl"),
+        reordenacao=args.reordenacao,
+        reusar_prefixo=args.modelos == "reais",
+        backend=args.backend,
+        caminho_gguf=args.gguf,
+        registro=registro
+    )
+    return criado["rag"]
+
+
+def responder(alvo, pergunta: str, top_k: int, perfil: str) -> dict:
+    inicio = time.perf_counter()
+    primeiro = None
+    fluxo = alvo.iter_resposta(pergunta, top_k, perfil=perfil)
+    while True:
+        try:
+            next(fluxo)
+        except StopIteration as fim:
+            resposta = fim.value
+            break
+        if primeiro is None:
+            primeiro = time.perf_counter()
+    termino = time.perf_counter()
+    return {"resposta": resposta, "latencia_s": termino - inicio, "primeiro_pedaco_s": (primeiro or termino) - inicio}
+
+
+def percentis_ms(valores: list) -> dict:
+    if not valores:
+        return {}
+    valores = np.asarray(valores) * 1000
+    return {"p50": float(np.percentile(valores, 50)), "p95": float(np.percentile(valores, 95)), "p99": float(np.percentile(valores, 99)), "media": float(valores.mean())}
+
+
+def f1_de_tokens(resposta: str, referencia: str) -> float:
+    tokens_resposta, tokens_referencia = tokenizar(resposta), tokenizar(referencia)
+    comuns = sum(min(tokens_resposta.count(t), tokens_referencia.count(t)) for t in set(tokens_resposta))
+    if comuns == 0:
+        return 0.0
+    precisao, cobertura = comuns / len(tokens_resposta), comuns / len(tokens_referencia)
+    return 2 * precisao * cobertura / (precisao + cobertura)
+
+
+def avaliar_resposta(resposta: str, item: dict) -> dict:
+    resposta_normalizada = normalizar_texto(resposta or "")
+    termos = item.get("termos_esperados", [])
+    return {
+        "similaridade": SequenceMatcher(None, resposta_normalizada, normalizar_texto(item["resposta_referencia"])).ratio(),
+        "f1": f1_de_tokens(resposta or "", item["resposta_referencia"]),
+        "cobertura_termos": sum(normalizar_texto(termo) in resposta_normalizada for termo in termos) / len(termos) if termos else 1.0
+    }
+
+
+def avaliar_recuperacao(rag, perguntas: list, top_k: int) -> dict:
+    # recall@k limitado a min(relevantes, k), para que 1.0 seja alcançável com poucos slots
+    recalls, reciprocos = [], []
+    for item in perguntas:
+        relevantes = set(item.get("ids_relevantes", []))
+        if not relevantes or item["caminho_esperado"] == "intencao":
+            continue
+        ids = [id_doc for id_doc, _ in rag.recuperar_trechos(item["pergunta"], top_k)]
+        recalls.append(len(relevantes & set(ids)) / min(len(relevantes), top_k))
+        reciprocos.append(next((1 / posicao for posicao, id_doc in enumerate(ids, 1) if id_doc in relevantes), 0.0))
+    return {"k": top_k, "perguntas": len(recalls), "recall_at_k": float(np.mean(recalls)) if recalls else None, "mrr": float(np.mean(reciprocos)) if reciprocos else None}
+
+
+def caminhos_por_pergunta(caminho_log: str) -> dict:
+    caminhos = {}
+    for evento in ler_eventos(caminho_log):
+        if evento.get("evento") == "latencia_por_etapa":
+            caminhos.setdefault(evento["pergunta"], []).append(evento["caminho"])
+    return caminhos
+
+
+def obter_valor(resultado: dict, chave: str):
+    for parte in chave.split("."):
+        if not isinstance(resultado, dict):
+            return None
+        resultado = resultado.get(parte)
+    return resultado
+
+
+def comparar_com_base(resultado: dict, base: dict, tolerancia: float) -> list:
+    if base.get("versao_perguntas") != resultado["versao_perguntas"]:
+        print(f"Aviso: versão das perguntas diferente ({base.get('versao_perguntas')} x {resultado['versao_perguntas']}); a comparação não é direta.")
+
+    regressoes = []
+    print(f"\n{'métrica':>26} | {'base':>10} | {'atual':>10} | {'variação':>9}")
+    for chave, direcao, rotulo in METRICAS_COMPARADAS:
+        anterior, atual = obter_valor(base, chave), obter_valor(resultado, chave)
+        if anterior is None or atual is None:
+            continue
+        variacao = (atual - anterior) / abs(anterior) if anterior else 0.0
+        piorou = direcao * variacao < -tolerancia
+        if piorou:
+            regressoes.append(rotulo)
+        print(f"{rotulo:>26} | {anterior:>10.3f} | {atual:>10.3f} | {variacao:>+8.1%}{'  <- regressão' if piorou else ''}")
+    return regressoes
+
+
+def commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark e teste de carga do RAG: repete um conjunto versionado de perguntas com gabarito e mede vazão, latência, caches, recuperação e qualidade das respostas.")
+    parser.add_argument("--perguntas", default="perguntas_benchmark.json")
+    parser.add_argument("--modelos", choices=["leves", "reais"], default="leves", help="leves: tokenizer, modelo, embeddings e índice substitutos, sem GPU nem downloads; reais: os do pipeline.")
+    parser.add_argument("--modelo", default="CEIA-UFG/Gemma-3-Gaia-PT-BR-4b-it")
+    parser.add_argument("--backend", default="hf")
+    parser.add_argument("--gguf", default=None)
+    parser.add_argument("--faiss", default="faiss.index")
+    parser.add_argument("--textos", default="id_para_texto.json")
+    parser.add_argument("--pacote", default="indice_vivi.pacote")
+    parser.add_argument("--reordenacao", choices=["lexical", "cross-encoder"], default=None)
+    parser.add_argument("--redis-host", default=None, help="Sem host, usa o Redis em memória.")
+    parser.add_argument("--servidor", action="store_true", help="Passa pelo ServidorDeInferencia (geração em lote), como no Streamlit.")
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--repeticoes", type=int, default=2, help="Passadas pelo conjunto; a partir da segunda, as respostas vêm dos caches.")
+    parser.add_argument("--perfil", default=None)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--segundos-por-token", type=float, default=0.005, help="Atraso por token gerado do modelo leve.")
+    parser.add_argument("--segundos-por-token-prompt", type=float, default=0.00002, help="Atraso por token de prompt (prefill) do modelo leve.")
+    parser.add_argument("--saida", default="resultado_benchmark.json", help="Arquivo JSON com o resultado, para comparar entre commits.")
+    parser.add_argument("--comparar", default=None, help="Resultado anterior (JSON) para comparar com o atual.")
+    parser.add_argument("--tolerancia", type=float, default=0.1, help="Piora relativa aceita antes de apontar regressão.")
+    parser.add_argument("--falhar-em-regressao", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.perguntas, "r", encoding="utf-8") as f:
+        conjunto = json.load(f)
+    perguntas = conjunto["perguntas"]
+
+    diretorio_logs = tempfile.mkdtemp(prefix="benchmark_rag_")
+    inicio = time.perf_counter()
+    rag = criar_pipeline(args, diretorio_logs)
+    for nome in rag.recursos.values():
+        rag.registro.obter(nome)
+    tempo_carregamento = time.perf_counter() - inicio
+    print(f"Pipeline ({args.modelos}) pronto em {tempo_carregamento:.1f}s; logs em '{diretorio_logs}'.")
+
+    servidor = None
+    alvo = rag
+    if args.servidor:
+        from servidor_de_inferencia import ServidorDeInferencia
+        servidor = alvo = ServidorDeInferencia(rag).iniciar()
+
+    passadas = []
+    respostas = {}
+    inicio_carga = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        for passada in range(args.repeticoes):
+            inicio_passada = time.perf_counter()
+            resultados = list(executor.map(lambda item: responder(alvo, item["pergunta"], args.top_k, args.perfil), perguntas))
+            duracao = time.perf_counter() - inicio_passada
+            passadas.append({
+                "passada": passada + 1,
+                "vazao_perguntas_por_segundo": len(perguntas) / duracao,
+                "latencia_ms": percentis_ms([r["latencia_s"] for r in resultados])
+            })
+            for item, resultado in zip(perguntas, resultados):
+                respostas.setdefault(item["id"], []).append(resultado)
+            print(f"Passada {passada + 1}: {passadas[-1]['vazao_perguntas_por_segundo']:.2f} perguntas/s, p50 {passadas[-1]['latencia_ms']['p50']:.1f} ms, p95 {passadas[-1]['latencia_ms']['p95']:.1f} ms")
+    duracao_carga = time.perf_counter() - inicio_carga
+
+    if servidor is not None:
+        servidor.parar()
+
+    # Recuperação medida à parte, depois da carga, para não aquecer os caches antes da primeira passada
+    recuperacao = avaliar_recuperacao(rag, perguntas, args.top_k)
+    rag.registrador.descarregar()
+    caminhos = caminhos_por_pergunta(rag.arquivo_log)
+
+    # Qualidade e caminho avaliados na primeira resposta de cada pergunta (caches ainda frios)
+    por_pergunta = []
+    for item in perguntas:
+        primeira = respostas[item["id"]][0]
+        caminhos_item = caminhos.get(item["pergunta"], [])
+        por_pergunta.append({
+            "id": item["id"],
+            "caminho_esperado": item["caminho_esperado"],
+            "caminhos": caminhos_item,
+            "caminho_correto": bool(caminhos_item) and caminhos_item[0] == item["caminho_esperado"],
+            "latencia_ms": [r["latencia_s"] * 1000 for r in respostas[item["id"]]],
+            "resposta": primeira["resposta"],
+            **avaliar_resposta(primeira["resposta"], item)
+        })
+
+    todas = [r for lista in respostas.values() for r in lista]
+    resumo_metricas = ColetorDeMetricas.instancia().resumo()
+    etapas = {chave.split('"')[1]: valores for chave, valores in resumo_metricas["histogramas"].items() if chave.startswith("vivi_etapa_segundos")}
+    tokens_por_segundo = resumo_metricas["histogramas"].get("vivi_tokens_por_segundo")
+
+    resultado = {
+        "versao_perguntas": conjunto["versao"],
+        "commit": commit_atual(),
+        "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "configuracao": {chave: valor for chave, valor in vars(args).items() if chave not in ("saida", "comparar")},
+        "carregamento_s": tempo_carregamento,
+        "requisicoes": len(todas),
+        "vazao_perguntas_por_segundo": len(todas) / duracao_carga,
+        "latencia_ms": percentis_ms([r["latencia_s"] for r in todas]),
+        "primeiro_pedaco_ms": percentis_ms([r["primeiro_pedaco_s"] for r in todas]),
+        "passadas": passadas,
+        "etapas_s": etapas,
+        "tokens_por_segundo": tokens_por_segundo,
+        "taxas_de_acerto_cache": resumo_metricas["taxas_de_acerto_cache"],
+        "cache_de_respostas": rag.cache_de_respostas.estatisticas(),
+        "cache_de_embeddings": rag.cache_de_embeddings.estatisticas(),
+        "recuperacao": recuperacao,
+        "respostas": {metrica: float(np.mean([p[metrica] for p in por_pergunta])) for metrica in ("similaridade", "f1", "cobertura_termos")},
+        "caminhos_corretos": sum(p["caminho_correto"] for p in por_pergunta) / len(por_pergunta),
+        "por_pergunta": por_pergunta
+    }
+
+    print(f"\nVazão: {resultado['vazao_perguntas_por_segundo']:.2f} perguntas/s | latência p50 {resultado['latencia_ms']['p50']:.1f} ms, "
+          f"p95 {resultado['latencia_ms']['p95']:.1f} ms, p99 {resultado['latencia_ms']['p99']:.1f} ms | primeiro pedaço p95 {resultado['primeiro_pedaco_ms']['p95']:.1f} ms")
+    print(f"Caches: {resultado['taxas_de_acerto_cache']} | recall@{args.top_k}: {recuperacao['recall_at_k']} | MRR: {recuperacao['mrr']}")
+    print(f"Respostas: {resultado['respostas']} | caminhos esperados: {resultado['caminhos_corretos']:.0%}")
+    print(f"\n{'etapa':>18} | {'n':>5} | {'p50 (ms)':>9} | {'p95 (ms)':>9}")
+    for etapa, valores in sorted(etapas.items(), key=lambda item: -(item[1]["p50"] or 0)):
+        print(f"{etapa:>18} | {valores['contagem']:>5} | {valores['p50'] * 1000:>9.2f} | {valores['p95'] * 1000:>9.2f}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, ensure_ascii=False, indent=2)
+        print(f"\nResultado salvo em '{args.saida}'.")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            regressoes = comparar_com_base(resultado, json.load(f), args.tolerancia)
+        if regressoes and args.falhar_em_regressao:
+            sys.exit(f"Regressões em relação a '{args.comparar}': {', '.join(regressoes)}")
@@ -0,0 +1,63 @@
+import argparse
+import json
+import time
+
+from indice_lexical import normalizar_texto
+from roteador_de_intencoes import RoteadorDeIntencoes
+
+PERGUNTAS_EXEMPLO = [
+    "Quem é você?",
+    "qual o significado do seu nome",
+    "De onde vem essa informação?",
+    "qual o telefone do centro Laura Vermont?",
+    "O que fazer em caso de violência doméstica durante o isolamento?",
+    "como registrar um boletim de ocorrência online",
+    "Estou sofrendo ameaças do meu vizinho, o que eu faço?",
+    "o que é lgbtifobia"
+]
+
+
+def rotear_por_varredura_linear(intencoes, pergunta):
+    # Forma anterior: uma cadeia de any(p in pergunta for p in [...]) por intenção
+    pergunta_normalizada = normalizar_texto(pergunta)
+    for intencao in intencoes:
+        if any(normalizar_texto(gatilho) in pergunta_normalizada for gatilho in intencao["gatilhos"]):
+            return intencao
+    return None
+
+
+def intencoes_sinteticas(intencoes, quantidade):
+    # Replica as intenções reais com gatilhos únicos para ver como o custo cresce com o número de intenções
+    extras = []
+    for i in range(quantidade):
+        base = intencoes[i % len(intencoes)]
+        extras.append({"nome": f"{base['nome']}_{i}", "gatilhos": [f"{gatilho} variante {i}" for gatilho in base["gatilhos"]]})
+    return extras + [dict(intencao) for intencao in intencoes]
+
+
+def medir(funcao, perguntas, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        for pergunta in perguntas:
+            funcao(pergunta)
+    duracao = time.perf_counter() - inicio
+    return repeticoes * len(perguntas) / duracao
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mede a vazão do roteador de intenções.")
+    parser.add_argument("--intencoes", default="intencoes.json")
+    parser.add_argument("--repeticoes", type=int, default=2000)
+    parser.add_argument("--sinteticas", type=int, nargs="*", default=[0, 100, 1000])
+    args = parser.parse_args()
+
+    with open(args.intencoes, "r", encoding="utf-8") as f:
+        intencoes_reais = json.load(f)["intencoes"]
+
+    print(f"{'intenções':>10} | {'regex única (perguntas/s)':>26} | {'varredura linear (perguntas/s)':>31}")
+    for quantidade in args.sinteticas:
+        intencoes = intencoes_sinteticas(intencoes_reais, quantidade)
+        roteador = RoteadorDeIntencoes([dict(intencao) for intencao in intencoes])
+        vazao_roteador = medir(roteador.rotear, PERGUNTAS_EXEMPLO, args.repeticoes)
+        vazao_linear = medir(lambda pergunta: rotear_por_varredura_linear(intencoes, pergunta), PERGUNTAS_EXEMPLO, max(1, args.repeticoes // (1 + quantidade // 50)))
+        print(f"{len(intencoes):>10} | {vazao_roteador:>26,.0f} | {vazao_linear:>31,.0f}")
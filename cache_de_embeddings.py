@@ -0,0 +1,144 @@
+import hashlib
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Lock
+
+import numpy as np
+
+
+def normalizar_consulta(texto: str) -> str:
+    # O all-MiniLM-L6-v2 não diferencia maiúsculas, então caixa e espaços extras não mudam o embedding
+    return " ".join(texto.lower().split())
+
+
+class CacheDeEmbeddings:
+    # Embeddings de perguntas, com três níveis: LRU no processo, Redis opcional (float32 empacotado,
+    # com TTL) e, na falta, o modelo. Pedidos concorrentes que chegam dentro de uma janela curta
+    # são codificados juntos numa única chamada de encode; perguntas repetidas na mesma janela
+    # são codificadas uma vez só.
+    def __init__(self, codificar_lote, identificador: str, capacidade: int = 10000, obter_redis=None, tempo_expiracao: int = 86400, janela_segundos: float = 0.003):
+        self.codificar_lote = codificar_lote
+        self.identificador = identificador
+        self.capacidade = capacidade
+        self.obter_redis = obter_redis
+        self.tempo_expiracao = tempo_expiracao
+        self.janela_segundos = janela_segundos
+
+        self.vetores = OrderedDict()
+        self.trava = Lock()
+        self.pendentes = {}
+        self.lote_em_formacao = False
+
+        self.acertos_memoria = 0
+        self.acertos_redis = 0
+        self.codificados = 0
+        self.chamadas_encode = 0
+
+
+    def _chave_redis(self, chave: str) -> str:
+        return f"embedding:{self.identificador}:{hashlib.md5(chave.encode()).hexdigest()}"
+
+
+    def _guardar(self, chave: str, vetor):
+        with self.trava:
+            self.vetores[chave] = vetor
+            self.vetores.move_to_end(chave)
+            while len(self.vetores) > self.capacidade:
+                self.vetores.popitem(last=False)
+
+
+    def _buscar_redis(self, chave: str):
+        if self.obter_redis is None:
+            return None
+        cliente = self.obter_redis()
+        if cliente is None:
+            return None
+        try:
+            dados = cliente.get(self._chave_redis(chave))
+        except Exception:
+            return None
+        return np.frombuffer(dados, dtype=np.float32) if dados else None
+
+
+    def _salvar_redis(self, chaves: list, vetores):
+        cliente = self.obter_redis() if self.obter_redis is not None else None
+        if cliente is None:
+            return
+        try:
+            pipeline = cliente.pipeline(transaction=False)
+            for chave, vetor in zip(chaves, vetores):
+                pipeline.setex(self._chave_redis(chave), self.tempo_expiracao, np.asarray(vetor, dtype=np.float32).tobytes())
+            pipeline.execute()
+        except Exception:
+            pass
+
+
+    def codificar(self, texto: str):
+        chave = normalizar_consulta(texto)
+
+        with self.trava:
+            vetor = self.vetores.get(chave)
+            if vetor is not None:
+                self.vetores.move_to_end(chave)
+                self.acertos_memoria += 1
+                return vetor
+
+        vetor = self._buscar_redis(chave)
+        if vetor is not None:
+            self._guardar(chave, vetor)
+            with self.trava:
+                self.acertos_redis += 1
+            return vetor
+
+        with self.trava:
+            if chave in self.pendentes:
+                futuro = self.pendentes[chave][1]
+                lider = False
+            else:
+                futuro = Future()
+                self.pendentes[chave] = (texto, futuro)
+                # O primeiro pedido da janela fica responsável por codificar o lote inteiro
+                lider = not self.lote_em_formacao
+                self.lote_em_formacao = True
+
+        if lider:
+            self._codificar_lote_pendente()
+        return futuro.result()
+
+
+    def _codificar_lote_pendente(self):
+        if self.janela_segundos > 0:
+            time.sleep(self.janela_segundos)
+
+        with self.trava:
+            lote = self.pendentes
+            self.pendentes = {}
+            self.lote_em_formacao = False
+
+        chaves = list(lote)
+        try:
+            vetores = np.asarray(self.codificar_lote([texto for texto, _ in lote.values()]), dtype=np.float32)
+        except Exception as e:
+            for _, futuro in lote.values():
+                futuro.set_exception(e)
+            return
+
+        with self.trava:
+            self.codificados += len(chaves)
+            self.chamadas_encode += 1
+        for chave, vetor in zip(chaves, vetores):
+            self._guardar(chave, vetor)
+            lote[chave][1].set_result(vetor)
+        self._salvar_redis(chaves, vetores)
+
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            return {
+                "itens": len(self.vetores),
+                "acertos_memoria": self.acertos_memoria,
+                "acertos_redis": self.acertos_redis,
+                "codificados": self.codificados,
+                "chamadas_encode": self.chamadas_encode
+            }
@@ -0,0 +1,53 @@
+import copy
+import hashlib
+from array import array
+from threading import Lock
+
+
+class CacheDePrefixo:
+    # Guarda os past_key_values do bloco fixo de instruções da Vivi, que abre todos os prompts.
+    # A chave é o hash do modelo e dos ids do prefixo: se o template mudar, os ids mudam e o
+    # prefixo é recalculado na próxima geração, sem configuração extra. Cada geração recebe
+    # uma cópia, porque o generate estende o cache que recebe.
+    def __init__(self):
+        self.chave = None
+        self.past_key_values = None
+        self.tamanho = 0
+        self.trava = Lock()
+        self.reusos = 0
+
+
+    @staticmethod
+    def calcular_chave(nome_modelo: str, ids_prefixo: list) -> str:
+        sha = hashlib.sha256(nome_modelo.encode("utf-8"))
+        sha.update(array("q", ids_prefixo).tobytes())
+        return sha.hexdigest()
+
+
+    def preparar(self, modelo, nome_modelo: str, ids_prefixo: list):
+        import torch
+
+        chave = self.calcular_chave(nome_modelo, ids_prefixo)
+        with self.trava:
+            if chave != self.chave:
+                with torch.no_grad():
+                    saida = modelo(input_ids=torch.tensor([ids_prefixo], device=modelo.device), use_cache=True)
+                self.past_key_values = saida.past_key_values
+                self.tamanho = len(ids_prefixo)
+                self.chave = chave
+                print(f"Cache de prefixo calculado: {self.tamanho} tokens.")
+        return self
+
+
+    def argumentos_geracao(self, modelo, nome_modelo: str, ids_prefixo: list, ids_prompt: list) -> dict:
+        # Só vale para prompts que começam exatamente pelo prefixo e trazem algo depois dele
+        if len(ids_prompt) <= len(ids_prefixo) or ids_prompt[:len(ids_prefixo)] != ids_prefixo:
+            return {}
+        self.preparar(modelo, nome_modelo, ids_prefixo)
+        with self.trava:
+            self.reusos += 1
+            return {"past_key_values": copy.deepcopy(self.past_key_values)}
+
+
+    def estatisticas(self) -> dict:
+        return {"tokens_prefixo": self.tamanho, "reusos": self.reusos, "chave": self.chave}
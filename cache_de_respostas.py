@@ -0,0 +1,217 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class Disjuntor:
+    # Circuit breaker: depois de algumas falhas seguidas o Redis deixa de ser consultado por um
+    # tempo, e uma única tentativa decide se ele volta. Assim um Redis fora do ar custa um timeout
+    # curto a cada intervalo, e não um timeout por pergunta.
+    def __init__(self, limite_falhas: int = 3, tempo_aberto_segundos: float = 30.0):
+        self.limite_falhas = limite_falhas
+        self.tempo_aberto_segundos = tempo_aberto_segundos
+        self.falhas = 0
+        self.aberto_ate = 0.0
+        self.testando = False
+        self.trava = Lock()
+
+
+    def permitir(self) -> bool:
+        with self.trava:
+            if self.falhas < self.limite_falhas:
+                return True
+            if time.monotonic() < self.aberto_ate or self.testando:
+                return False
+            self.testando = True
+            return True
+
+
+    def sucesso(self):
+        with self.trava:
+            self.falhas = 0
+            self.testando = False
+
+
+    def falha(self):
+        with self.trava:
+            self.falhas += 1
+            self.testando = False
+            if self.falhas >= self.limite_falhas:
+                self.aberto_ate = time.monotonic() + self.tempo_aberto_segundos
+
+
+    def estado(self) -> str:
+        with self.trava:
+            if self.falhas < self.limite_falhas:
+                return "fechado"
+            return "meio-aberto" if time.monotonic() >= self.aberto_ate else "aberto"
+
+
+class RedisEmMemoria:
+    # Substituto mínimo do cliente redis (get, setex, pipeline) para testes e para rodar sem servidor
+    def __init__(self):
+        self.dados = {}
+        self.trava = Lock()
+
+
+    def get(self, chave):
+        with self.trava:
+            valor, expira_em = self.dados.get(chave, (None, 0))
+            if valor is not None and expira_em < time.monotonic():
+                del self.dados[chave]
+                return None
+            return valor
+
+
+    def setex(self, chave, tempo_expiracao, valor):
+        if isinstance(valor, str):
+            valor = valor.encode("utf-8")
+        with self.trava:
+            self.dados[chave] = (valor, time.monotonic() + tempo_expiracao)
+        return True
+
+
+    def pipeline(self, transaction=True):
+        return _PipelineEmMemoria(self)
+
+
+class _PipelineEmMemoria:
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.comandos = []
+
+
+    def get(self, chave):
+        self.comandos.append((self.cliente.get, (chave,)))
+        return self
+
+
+    def setex(self, chave, tempo_expiracao, valor):
+        self.comandos.append((self.cliente.setex, (chave, tempo_expiracao, valor)))
+        return self
+
+
+    def execute(self):
+        resultados = [comando(*argumentos) for comando, argumentos in self.comandos]
+        self.comandos = []
+        return resultados
+
+
+class CacheDeRespostas:
+    # Cache de respostas exatas em dois níveis: LRU local (com o mesmo TTL) na frente do Redis.
+    # Resposta e metadados vão e voltam numa única ida ao Redis (pipeline). Qualquer erro do Redis
+    # vira falha no disjuntor e o cache segue só com o nível local, sem erro para quem pergunta.
+    def __init__(self, obter_cliente, tempo_expiracao: int = 3600, capacidade_local: int = 1000, disjuntor: Disjuntor = None):
+        self.obter_cliente = obter_cliente
+        self.tempo_expiracao = tempo_expiracao
+        self.capacidade_local = capacidade_local
+        self.disjuntor = disjuntor or Disjuntor()
+
+        self.locais = OrderedDict()
+        self.trava = Lock()
+        self.acertos_locais = 0
+        self.acertos_redis = 0
+        self.falhas = 0
+        self.erros_redis = 0
+
+
+    @staticmethod
+    def chaves(pergunta: str) -> tuple:
+        resumo = hashlib.md5(pergunta.encode()).hexdigest()
+        return f"resposta:{resumo}", f"resposta_meta:{resumo}"
+
+
+    def _obter_local(self, chave: str):
+        with self.trava:
+            item = self.locais.get(chave)
+            if item is None:
+                return None
+            if item[2] < time.monotonic():
+                del self.locais[chave]
+                return None
+            self.locais.move_to_end(chave)
+            return item[0], item[1]
+
+
+    def _salvar_local(self, chave: str, resposta: str, metadados: dict, tempo_expiracao: int):
+        with self.trava:
+            self.locais[chave] = (resposta, metadados, time.monotonic() + tempo_expiracao)
+            self.locais.move_to_end(chave)
+            while len(self.locais) > self.capacidade_local:
+                self.locais.popitem(last=False)
+
+
+    def cliente_disponivel(self):
+        # Cliente para outros usos do Redis (ex.: cache de embeddings), ou None com o disjuntor aberto
+        return self.obter_cliente() if self.disjuntor.estado() == "fechado" else None
+
+
+    def obter(self, pergunta: str):
+        # Devolve (resposta, metadados) ou None
+        chave, chave_meta = self.chaves(pergunta)
+
+        local = self._obter_local(chave)
+        if local is not None:
+            with self.trava:
+                self.acertos_locais += 1
+            return local
+
+        if self.disjuntor.permitir():
+            try:
+                resposta, metadados = self.obter_cliente().pipeline(transaction=False).get(chave).get(chave_meta).execute()
+                self.disjuntor.sucesso()
+            except Exception as e:
+                self._registrar_erro(e)
+            else:
+                if resposta:
+                    resposta = resposta.decode("utf-8")
+                    metadados = json.loads(metadados) if metadados else {}
+                    self._salvar_local(chave, resposta, metadados, self.tempo_expiracao)
+                    with self.trava:
+                        self.acertos_redis += 1
+                    return resposta, metadados
+
+        with self.trava:
+            self.falhas += 1
+        return None
+
+
+    def salvar(self, pergunta: str, resposta: str, metadados: dict = None, tempo_expiracao: int = None):
+        tempo_expiracao = tempo_expiracao or self.tempo_expiracao
+        metadados = metadados or {}
+        chave, chave_meta = self.chaves(pergunta)
+        self._salvar_local(chave, resposta, metadados, tempo_expiracao)
+
+        if not self.disjuntor.permitir():
+            return
+        try:
+            pipeline = self.obter_cliente().pipeline(transaction=False)
+            pipeline.setex(chave, tempo_expiracao, resposta)
+            pipeline.setex(chave_meta, tempo_expiracao, json.dumps(metadados, ensure_ascii=False))
+            pipeline.execute()
+            self.disjuntor.sucesso()
+        except Exception as e:
+            self._registrar_erro(e)
+
+
+    def _registrar_erro(self, erro: Exception):
+        estava_fechado = self.disjuntor.estado() == "fechado"
+        self.disjuntor.falha()
+        with self.trava:
+            self.erros_redis += 1
+        if estava_fechado and self.disjuntor.estado() != "fechado":
+            print(f"Redis indisponível ({erro}); usando só o cache local por {self.disjuntor.tempo_aberto_segundos:.0f}s.")
+
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            return {
+                "itens_locais": len(self.locais),
+                "acertos_locais": self.acertos_locais,
+                "acertos_redis": self.acertos_redis,
+                "falhas": self.falhas,
+                "erros_redis": self.erros_redis,
+                "disjuntor": self.disjuntor.estado()
+            }
@@ -0,0 +1,105 @@
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+class CacheSemantico:
+    # Cache de respostas indexado pelo embedding da pergunta: paráfrases de uma pergunta
+    # já respondida reaproveitam a resposta se a similaridade de cosseno passar do limiar.
+    def __init__(self, limiar_similaridade: float = 0.92, capacidade: int = 1000, tempo_expiracao: int = 3600):
+        self.limiar_similaridade = limiar_similaridade
+        self.capacidade = capacidade
+        self.tempo_expiracao = tempo_expiracao
+
+        self.vetores = None
+        self.ocupado = np.zeros(capacidade, dtype=bool)
+        self.perguntas = [None] * capacidade
+        self.respostas = [None] * capacidade
+        self.criado_em = np.zeros(capacidade, dtype=np.float64)
+        self.linhas_lru = OrderedDict()
+        self.linhas_livres = list(range(capacidade - 1, -1, -1))
+
+        self.acertos = 0
+        self.falhas = 0
+        self.expiradas = 0
+        self.removidas_lru = 0
+        self.trava = Lock()
+
+
+    @staticmethod
+    def _normalizar(embedding):
+        vetor = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma > 0 else vetor
+
+
+    def _liberar(self, linha):
+        self.ocupado[linha] = False
+        self.perguntas[linha] = None
+        self.respostas[linha] = None
+        self.linhas_lru.pop(linha, None)
+        self.linhas_livres.append(linha)
+
+
+    def buscar(self, embedding):
+        vetor = self._normalizar(embedding)
+
+        with self.trava:
+            if self.vetores is not None:
+                # Entradas expiradas saem antes da busca, para não esconderem outra entrada válida acima do limiar
+                for linha in np.flatnonzero(self.ocupado & (time.time() - self.criado_em > self.tempo_expiracao)):
+                    self._liberar(int(linha))
+                    self.expiradas += 1
+
+            if self.vetores is None or not self.ocupado.any():
+                self.falhas += 1
+                return None
+
+            similaridades = self.vetores @ vetor
+            similaridades[~self.ocupado] = -np.inf
+            linha = int(np.argmax(similaridades))
+            similaridade = float(similaridades[linha])
+
+            if similaridade < self.limiar_similaridade:
+                self.falhas += 1
+                return None
+
+            self.linhas_lru.move_to_end(linha)
+            self.acertos += 1
+            return {"pergunta": self.perguntas[linha], "resposta": self.respostas[linha], "similaridade": similaridade}
+
+
+    def salvar(self, embedding, pergunta: str, resposta: str):
+        vetor = self._normalizar(embedding)
+
+        with self.trava:
+            if self.vetores is None:
+                self.vetores = np.zeros((self.capacidade, vetor.shape[0]), dtype=np.float32)
+
+            if not self.linhas_livres:
+                linha_antiga, _ = self.linhas_lru.popitem(last=False)
+                self._liberar(linha_antiga)
+                self.removidas_lru += 1
+
+            linha = self.linhas_livres.pop()
+            self.vetores[linha] = vetor
+            self.ocupado[linha] = True
+            self.perguntas[linha] = pergunta
+            self.respostas[linha] = resposta
+            self.criado_em[linha] = time.time()
+            self.linhas_lru[linha] = True
+
+
+    def estatisticas(self):
+        with self.trava:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "taxa_acerto": self.acertos / consultas if consultas else 0.0,
+                "entradas": int(self.ocupado.sum()),
+                "expiradas": self.expiradas,
+                "removidas_lru": self.removidas_lru
+            }
@@ -0,0 +1,173 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+
+class RegistroDeRecursos:
+    # Registro único por processo dos recursos pesados (modelos, índice, dados, conexões).
+    # Cada recurso é carregado uma única vez, em segundo plano, e compartilhado por todas as sessões.
+    _instancia = None
+    _trava_instancia = Lock()
+
+    def __init__(self, max_threads: int = 4):
+        self.carregadores = {}
+        self.futuros = {}
+        self.tempos_carregamento = {}
+        self.trava = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="carregador-de-recursos")
+
+
+    @classmethod
+    def instancia(cls):
+        if cls._instancia is None:
+            with cls._trava_instancia:
+                if cls._instancia is None:
+                    cls._instancia = cls()
+        return cls._instancia
+
+
+    def registrar(self, nome: str, carregador):
+        with self.trava:
+            self.carregadores.setdefault(nome, carregador)
+        return nome
+
+
+    def _iniciar(self, nome: str):
+        with self.trava:
+            if nome not in self.futuros:
+                if nome not in self.carregadores:
+                    raise KeyError(f"Recurso não registrado: {nome}")
+                self.futuros[nome] = self.executor.submit(self._carregar, nome)
+            return self.futuros[nome]
+
+
+    def _carregar(self, nome: str):
+        print(f"\nCarregando recurso '{nome}'...\n")
+        inicio = time.time()
+        recurso = self.carregadores[nome]()
+        self.tempos_carregamento[nome] = time.time() - inicio
+        print(f"\nRecurso '{nome}' carregado em {self.tempos_carregamento[nome]:.1f}s.\n")
+        return recurso
+
+
+    def aquecer(self, *nomes):
+        for nome in nomes:
+            self._iniciar(nome)
+
+
+    def obter(self, nome: str):
+        return self._iniciar(nome).result()
+
+
+    def pronto(self, *nomes) -> bool:
+        with self.trava:
+            futuros = [self.futuros.get(nome) for nome in nomes]
+        return all(futuro is not None and futuro.done() and futuro.exception() is None for futuro in futuros)
+
+
+    def estado(self, *nomes) -> dict:
+        with self.trava:
+            nomes = nomes or tuple(self.carregadores)
+            futuros = {nome: self.futuros.get(nome) for nome in nomes}
+
+        estados = {}
+        for nome, futuro in futuros.items():
+            if futuro is None:
+                estados[nome] = "pendente"
+            elif not futuro.done():
+                estados[nome] = "carregando"
+            elif futuro.exception() is not None:
+                estados[nome] = f"erro: {futuro.exception()}"
+            else:
+                estados[nome] = "pronto"
+        return estados
+
+
+# Os imports pesados ficam dentro dos carregadores para que importar este módulo (e o da Vivi) seja instantâneo
+
+def carregar_tokenizer(nome_modelo: str):
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(nome_modelo)
+
+
+def carregar_modelo_de_linguagem(nome_modelo: str, backend: str = "hf", caminho_gguf: str = None, threads: int = None):
+    from backends_de_geracao import criar_backend
+    return criar_backend(nome_modelo, backend, caminho_gguf, threads)
+
+
+def carregar_modelo_de_embedding(nome_modelo: str):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(nome_modelo)
+
+
+def carregar_indice_faiss(caminho: str, caminho_metadados: str = None):
+    from fabrica_de_indices import ajustar_parametros_busca
+    from pacote_de_indice import abrir_indice_faiss_mmap
+
+    # Mapeado em memória: as páginas do índice são compartilhadas entre processos e carregadas sob demanda
+    indice = abrir_indice_faiss_mmap(caminho)
+    # efSearch/nprobe escolhidos na criação do índice (HNSW / IVF-PQ) ficam nos metadados
+    if caminho_metadados and os.path.exists(caminho_metadados):
+        ajustar_parametros_busca(indice, carregar_json(caminho_metadados).get("parametros_indice", {}))
+    return indice
+
+
+def carregar_metadados_indice(caminho: str):
+    # Índices antigos não têm metadados: vetores sem normalização e distância L2
+    if not os.path.exists(caminho):
+        return {"normalizado": False, "metrica": "l2"}
+    return carregar_json(caminho)
+
+
+def carregar_indice_lexical(caminho: str):
+    # Opcional: sem o arquivo, a recuperação usa só a busca vetorial
+    from indice_lexical import IndiceBM25
+
+    if not os.path.exists(caminho):
+        print(f"Índice BM25 '{caminho}' não encontrado, busca híbrida desativada.")
+        return None
+    return IndiceBM25.carregar(caminho)
+
+
+def carregar_indice_de_centros(caminho: str):
+    from indice_de_centros import IndiceDeCentros
+    return IndiceDeCentros.carregar(caminho)
+
+
+def carregar_pacote_de_indice(caminho_pacote: str, caminho_id_texto: str, caminho_indice: str = None):
+    from pacote_de_indice import PacoteDeIndice
+
+    if not os.path.exists(caminho_pacote):
+        print(f"Pacote '{caminho_pacote}' não encontrado, usando '{caminho_id_texto}'.")
+        return PacoteDeIndice.de_arquivos_json(caminho_id_texto)
+
+    pacote = PacoteDeIndice.abrir(caminho_pacote)
+    if caminho_indice and os.path.exists(caminho_indice) and not pacote.confere_com_indice(caminho_indice):
+        print(f"Aviso: o pacote '{caminho_pacote}' foi gerado para outra versão de '{caminho_indice}'. Regere-o com pacote_de_indice.py.")
+    return pacote
+
+
+def carregar_reordenador(tipo: str, nome_modelo: str, contar_tokens, max_candidatos: int, orcamento_segundos: float, orcamento_tokens: int):
+    from reordenador import PontuadorCrossEncoder, PontuadorLexical, Reordenador
+
+    pontuador = PontuadorCrossEncoder(nome_modelo) if tipo == "cross-encoder" else PontuadorLexical()
+    return Reordenador(pontuador, max_candidatos=max_candidatos, orcamento_segundos=orcamento_segundos, orcamento_tokens=orcamento_tokens, contar_tokens=contar_tokens)
+
+
+def carregar_json(caminho: str):
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def conectar_redis(host: str, porta: int, db: int, timeout_segundos: float = 0.1, max_conexoes: int = 32):
+    # Um pool por processo (o recurso é registrado uma vez) e timeouts curtos: um Redis lento ou
+    # fora do ar vira falha rápida no cache, não espera para o usuário. Sem host, usa o Redis em memória.
+    if not host:
+        from cache_de_respostas import RedisEmMemoria
+        return RedisEmMemoria()
+
+    import redis
+    pool = redis.ConnectionPool(host=host, port=porta, db=db, socket_timeout=timeout_segundos, socket_connect_timeout=timeout_segundos, max_connections=max_conexoes, health_check_interval=30)
+    return redis.Redis(connection_pool=pool)
@@ -0,0 +1,140 @@
+import threading
+import time
+from threading import Lock
+
+
+class StreamerObservado:
+    # Repassa put/end ao streamer do pedido e marca se algo (o prompt ou tokens) já foi transmitido
+    def __init__(self, interno):
+        self.interno = interno
+        self.transmitiu = False
+
+
+    def put(self, valor):
+        self.transmitiu = True
+        self.interno.put(valor)
+
+
+    def end(self):
+        self.interno.end()
+
+
+class DecodificacaoAssistida:
+    # Geração assistida (speculative decoding) do transformers: um modelo de rascunho pequeno propõe
+    # alguns tokens e o modelo principal os confere numa única passada. As chamadas de forward dos
+    # dois modelos são contadas por hooks, só na thread da geração em curso, e dão a taxa de
+    # aceitação: (tokens gerados - passadas do principal) / tokens propostos pelo rascunho.
+    # Se a taxa média cai abaixo do limiar, a assistência é pausada por algumas gerações e depois testada de novo.
+    def __init__(self, modelo, modelo_rascunho, tokenizer=None, tokenizer_rascunho=None, limiar_aceitacao: float = 0.3, suavizacao: float = 0.2, min_geracoes: int = 5, pausa_geracoes: int = 50):
+        self.modelo = modelo
+        self.modelo_rascunho = modelo_rascunho
+        self.limiar_aceitacao = limiar_aceitacao
+        self.suavizacao = suavizacao
+        self.min_geracoes = min_geracoes
+        self.pausa_geracoes = pausa_geracoes
+
+        # Vocabulários diferentes exigem a versão "universal", que retokeniza entre os dois modelos
+        self.argumentos_extras = {}
+        if tokenizer is not None and tokenizer_rascunho is not None and tokenizer.get_vocab() != tokenizer_rascunho.get_vocab():
+            self.argumentos_extras = {"tokenizer": tokenizer, "assistant_tokenizer": tokenizer_rascunho}
+
+        self.local = threading.local()
+        modelo.register_forward_hook(self._contar("principal"))
+        modelo_rascunho.register_forward_hook(self._contar("rascunho"))
+
+        self.trava = Lock()
+        self.geracoes = 0
+        self.geracoes_em_pausa = 0
+        self.pausas = 0
+        self.desativada = False
+        self.taxa_aceitacao_media = None
+        self.tokens_por_segundo_medio = None
+
+
+    def _contar(self, nome: str):
+        def hook(modulo, entradas, saida):
+            contadores = getattr(self.local, "contadores", None)
+            if contadores is not None:
+                contadores[nome] += 1
+        return hook
+
+
+    def ativa(self) -> bool:
+        with self.trava:
+            if self.desativada:
+                return False
+            if self.geracoes_em_pausa > 0:
+                self.geracoes_em_pausa -= 1
+                return False
+            return True
+
+
+    def argumentos_geracao(self) -> dict:
+        return {"assistant_model": self.modelo_rascunho, **self.argumentos_extras}
+
+
+    def gerar(self, argumentos: dict):
+        # Executa o generate assistido na thread atual e devolve (saída, métricas)
+        tamanho_prompt = argumentos["input_ids"].shape[1]
+        streamer = StreamerObservado(argumentos["streamer"]) if argumentos.get("streamer") is not None else None
+        argumentos_assistidos = dict(argumentos, streamer=streamer) if streamer is not None else argumentos
+        self.local.contadores = {"principal": 0, "rascunho": 0}
+        inicio = time.perf_counter()
+        try:
+            saida_ids = self.modelo.generate(**argumentos_assistidos, **self.argumentos_geracao())
+        except Exception as e:
+            # Combinação não suportada (cache, backend, versão do transformers): desliga de vez e segue sem rascunho.
+            # Só dá para gerar de novo se nada chegou ao streamer; senão o prompt e os tokens já
+            # transmitidos seriam repetidos (e o medidor contaria tudo duas vezes), então o erro sobe.
+            print(f"Geração assistida desativada: {e}")
+            with self.trava:
+                self.desativada = True
+            if streamer is not None and streamer.transmitiu:
+                raise
+            return self.modelo.generate(**argumentos), None
+        finally:
+            contadores = self.local.contadores
+            self.local.contadores = None
+
+        duracao = time.perf_counter() - inicio
+        tokens_gerados = saida_ids.shape[1] - tamanho_prompt
+        aceitos = max(tokens_gerados - contadores["principal"], 0)
+        metricas = {
+            "tokens_gerados": tokens_gerados,
+            "passadas_principal": contadores["principal"],
+            "tokens_propostos": contadores["rascunho"],
+            "taxa_aceitacao": min(aceitos / contadores["rascunho"], 1.0) if contadores["rascunho"] else 0.0,
+            "tokens_por_segundo": tokens_gerados / duracao if duracao > 0 else 0.0
+        }
+        self._atualizar(metricas)
+        return saida_ids, metricas
+
+
+    def _atualizar(self, metricas: dict):
+        with self.trava:
+            self.geracoes += 1
+            if self.taxa_aceitacao_media is None:
+                self.taxa_aceitacao_media = metricas["taxa_aceitacao"]
+                self.tokens_por_segundo_medio = metricas["tokens_por_segundo"]
+            else:
+                self.taxa_aceitacao_media += self.suavizacao * (metricas["taxa_aceitacao"] - self.taxa_aceitacao_media)
+                self.tokens_por_segundo_medio += self.suavizacao * (metricas["tokens_por_segundo"] - self.tokens_por_segundo_medio)
+
+            if self.geracoes >= self.min_geracoes and self.taxa_aceitacao_media < self.limiar_aceitacao:
+                print(f"Taxa de aceitação do rascunho em {self.taxa_aceitacao_media:.2f}; geração assistida pausada por {self.pausa_geracoes} gerações.")
+                self.geracoes_em_pausa = self.pausa_geracoes
+                self.pausas += 1
+                # Ao voltar, a média recomeça do zero
+                self.geracoes = 0
+                self.taxa_aceitacao_media = None
+
+
+    def estatisticas(self) -> dict:
+        with self.trava:
+            return {
+                "ativa": not self.desativada and self.geracoes_em_pausa == 0,
+                "taxa_aceitacao_media": self.taxa_aceitacao_media,
+                "tokens_por_segundo_medio": self.tokens_por_segundo_medio,
+                "pausas": self.pausas,
+                "desativada": self.desativada
+            }
@@ -0,0 +1,155 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from threading import Lock
+
+CABECALHO_CONTEXTO = "Contexto:\n"
+CABECALHO_PERGUNTA = "\n\nPergunta:\n"
+CABECALHO_RESPOSTA = "\n\nResposta:"
+
+# Fronteiras de frase: depois de pontuação final (o espaço fica no começo da frase seguinte,
+# como o tokenizer o veria no texto corrido) e depois de cada quebra de linha
+PADRAO_FRONTEIRA = re.compile(r"(?<=[.!?])(?=[ \t])|(?<=\n)")
+
+
+class EmpacotadorDeContexto:
+    # Monta o prompt direto em ids de token. Cada trecho recuperado é tokenizado uma única vez,
+    # frase a frase, e fica em cache pelo id do trecho; as instruções e os cabeçalhos são
+    # tokenizados uma vez só. O contexto respeita seu orçamento e é cortado em fronteira de
+    # trecho ou de frase, nunca no meio de uma palavra.
+    def __init__(self, obter_tokenizer, trava, instrucoes: str, orcamento_contexto: int = 1024, orcamento_pergunta: int = 256, deve_preservar=None, capacidade_cache: int = 4096):
+        self.obter_tokenizer = obter_tokenizer
+        self.trava = trava
+        self.instrucoes = instrucoes
+        self.orcamento_contexto = orcamento_contexto
+        self.orcamento_pergunta = orcamento_pergunta
+        self.deve_preservar = deve_preservar or (lambda linha: False)
+        self.capacidade_cache = capacidade_cache
+
+        self.cache_trechos = OrderedDict()
+        self.trava_cache = Lock()
+        self.fixos = None
+        # Tempo gasto no tokenizer durante o empacotamento em curso, por thread
+        self.local = threading.local()
+
+
+    def _codificar(self, texto: str) -> list:
+        inicio = time.perf_counter()
+        with self.trava:
+            ids = self.obter_tokenizer().encode(texto, add_special_tokens=False)
+        self.local.segundos_tokenizacao = getattr(self.local, "segundos_tokenizacao", 0.0) + time.perf_counter() - inicio
+        return ids
+
+
+    def _ids_fixos(self) -> dict:
+        if self.fixos is None:
+            tokenizer = self.obter_tokenizer()
+            with self.trava:
+                especiais = [token for token in tokenizer("", add_special_tokens=True)["input_ids"] if token != tokenizer.eos_token_id]
+            self.fixos = {
+                "prefixo": especiais + self._codificar(self.instrucoes + CABECALHO_CONTEXTO),
+                "pergunta": self._codificar(CABECALHO_PERGUNTA),
+                "resposta": self._codificar(CABECALHO_RESPOSTA),
+                "quebra": self._codificar("\n")
+            }
+        return self.fixos
+
+
+    def ids_prefixo(self) -> list:
+        # Tokens especiais + instruções + cabeçalho do contexto: o trecho fixo que abre todo prompt
+        return self._ids_fixos()["prefixo"]
+
+
+    def _linhas_removiveis(self, texto: str) -> list:
+        # Linhas do contexto que o pós-processamento tira da resposta caso o modelo as repita
+        return [linha.strip() for linha in texto.split("\n") if linha.strip() and not self.deve_preservar(linha.strip())]
+
+
+    def trecho(self, id_doc: int, texto: str) -> dict:
+        with self.trava_cache:
+            entrada = self.cache_trechos.get(id_doc)
+            if entrada is not None and entrada["texto"] == texto:
+                self.cache_trechos.move_to_end(id_doc)
+                return entrada
+
+        frases = [frase for frase in PADRAO_FRONTEIRA.split(texto) if frase]
+        ids_frases = [self._codificar(frase) for frase in frases]
+        entrada = {
+            "texto": texto,
+            "frases": frases,
+            "ids_frases": ids_frases,
+            "total": sum(len(ids) for ids in ids_frases),
+            "linhas_removiveis": self._linhas_removiveis(texto)
+        }
+
+        with self.trava_cache:
+            self.cache_trechos[id_doc] = entrada
+            self.cache_trechos.move_to_end(id_doc)
+            while len(self.cache_trechos) > self.capacidade_cache:
+                self.cache_trechos.popitem(last=False)
+        return entrada
+
+
+    def contar_tokens(self, id_doc: int, texto: str) -> int:
+        return self.trecho(id_doc, texto)["total"]
+
+
+    def empacotar(self, pergunta: str, trechos: list) -> dict:
+        # trechos: lista de (id, texto), do mais para o menos relevante
+        self.local.segundos_tokenizacao = 0.0
+        fixos = self._ids_fixos()
+        quebra = fixos["quebra"]
+
+        ids_contexto = []
+        textos = []
+        linhas_removiveis = []
+        usados = []
+        restante = self.orcamento_contexto
+
+        for id_doc, texto in trechos:
+            entrada = self.trecho(id_doc, texto)
+            separador = quebra if ids_contexto else []
+            if len(separador) + entrada["total"] <= restante:
+                ids_contexto += separador + [token for ids in entrada["ids_frases"] for token in ids]
+                textos.append(texto)
+                linhas_removiveis += entrada["linhas_removiveis"]
+                usados.append(id_doc)
+                restante -= len(separador) + entrada["total"]
+                continue
+
+            # Não cabe inteiro: entra só com as frases iniciais que couberem e o contexto termina aqui
+            ids_parciais = list(separador)
+            frases_parciais = []
+            for frase, ids in zip(entrada["frases"], entrada["ids_frases"]):
+                if len(ids_parciais) + len(ids) > restante:
+                    break
+                ids_parciais += ids
+                frases_parciais.append(frase)
+
+            if not frases_parciais and not ids_contexto:
+                # Primeira frase maior que o orçamento inteiro: único caso em que o corte é por token
+                with self.trava:
+                    parcial = self.obter_tokenizer().decode(entrada["ids_frases"][0][:restante], skip_special_tokens=True)
+                parcial = parcial.rsplit(" ", 1)[0]
+                ids_parciais = self._codificar(parcial)[:restante]
+                frases_parciais = [parcial]
+
+            if frases_parciais:
+                texto_parcial = "".join(frases_parciais)
+                ids_contexto += ids_parciais
+                textos.append(texto_parcial)
+                linhas_removiveis += self._linhas_removiveis(texto_parcial)
+                usados.append(id_doc)
+            break
+
+        ids_pergunta = self._codificar(pergunta)[:self.orcamento_pergunta]
+
+        return {
+            "ids": fixos["prefixo"] + ids_contexto + fixos["pergunta"] + ids_pergunta + fixos["resposta"],
+            "contexto": "\n".join(textos),
+            "linhas_removiveis": linhas_removiveis,
+            "trechos": usados,
+            "tokens_contexto": len(ids_contexto),
+            "segundos_tokenizacao": self.local.segundos_tokenizacao
+        }
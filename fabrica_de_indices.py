@@ -0,0 +1,95 @@
+import math
+
+import faiss
+
+TIPOS_INDICE = ("flat", "hnsw", "ivfpq")
+
+PARAMETROS_PADRAO = {
+    "flat": {},
+    "hnsw": {"M": 32, "ef_construcao": 200, "ef_busca": 64},
+    "ivfpq": {"nlist": None, "m": 16, "nbits": 8, "nprobe": 8}
+}
+
+
+def metrica_faiss(metrica: str):
+    return faiss.METRIC_INNER_PRODUCT if metrica == "ip" else faiss.METRIC_L2
+
+
+def tipo_quantizador(armazenamento: str):
+    return faiss.ScalarQuantizer.QT_fp16 if armazenamento == "float16" else faiss.ScalarQuantizer.QT_8bit
+
+
+def resolver_armazenamento(tipo: str, armazenamento: str) -> str:
+    # O IVF-PQ já comprime os vetores com a quantização por produto: a precisão pedida não se aplica
+    # e fica registrada como float32, para índices iguais não parecerem incompatíveis nos metadados
+    return "float32" if tipo == "ivfpq" else armazenamento
+
+
+def resolver_parametros(tipo: str, dim: int, total_vetores: int, parametros: dict = None) -> dict:
+    # Completa os parâmetros com os padrões e os ajusta ao tamanho do corpus,
+    # para que o treino do IVF-PQ funcione mesmo com poucas dezenas de vetores
+    if tipo not in TIPOS_INDICE:
+        raise ValueError(f"Tipo de índice inválido: {tipo}. Use um de {TIPOS_INDICE}.")
+
+    resolvidos = dict(PARAMETROS_PADRAO[tipo])
+    resolvidos.update({chave: valor for chave, valor in (parametros or {}).items() if valor is not None})
+
+    if tipo == "ivfpq":
+        if resolvidos["nlist"] is None:
+            resolvidos["nlist"] = int(4 * math.sqrt(max(total_vetores, 1)))
+        # O k-means precisa de pelo menos ~39 pontos por centróide
+        resolvidos["nlist"] = max(1, min(resolvidos["nlist"], total_vetores // 39))
+        resolvidos["nbits"] = max(1, min(resolvidos["nbits"], int(math.log2(max(total_vetores, 2)))))
+        while dim % resolvidos["m"]:
+            resolvidos["m"] -= 1
+        resolvidos["nprobe"] = min(resolvidos["nprobe"], resolvidos["nlist"])
+
+    return resolvidos
+
+
+def criar_indice_faiss(dim: int, tipo: str = "flat", metrica: str = "ip", armazenamento: str = "float32", vetores_treino=None, parametros: dict = None):
+    # Devolve o índice (já treinado, se for o caso) e os parâmetros efetivos, que vão para os metadados
+    total = 0 if vetores_treino is None else len(vetores_treino)
+    parametros = resolver_parametros(tipo, dim, total, parametros)
+    armazenamento = resolver_armazenamento(tipo, armazenamento)
+    metrica_indice = metrica_faiss(metrica)
+
+    if tipo == "flat":
+        if armazenamento == "float32":
+            indice = faiss.IndexFlatIP(dim) if metrica == "ip" else faiss.IndexFlatL2(dim)
+        else:
+            indice = faiss.IndexScalarQuantizer(dim, tipo_quantizador(armazenamento), metrica_indice)
+
+    elif tipo == "hnsw":
+        if armazenamento == "float32":
+            indice = faiss.IndexHNSWFlat(dim, parametros["M"], metrica_indice)
+        else:
+            indice = faiss.IndexHNSWSQ(dim, tipo_quantizador(armazenamento), parametros["M"], metrica_indice)
+        indice.hnsw.efConstruction = parametros["ef_construcao"]
+
+    else:
+        quantizador = faiss.IndexFlatIP(dim) if metrica == "ip" else faiss.IndexFlatL2(dim)
+        indice = faiss.IndexIVFPQ(quantizador, dim, parametros["nlist"], parametros["m"], parametros["nbits"], metrica_indice)
+
+    if not indice.is_trained:
+        if vetores_treino is None:
+            raise ValueError(f"O índice '{tipo}' com armazenamento '{armazenamento}' precisa de vetores de treino.")
+        indice.train(vetores_treino)
+
+    ajustar_parametros_busca(indice, parametros)
+    return indice, parametros
+
+
+def ajustar_parametros_busca(indice, parametros: dict):
+    # Parâmetros de busca (efSearch, nprobe) também são reaplicados depois de ler o índice do disco
+    base = faiss.downcast_index(indice.index) if isinstance(indice, (faiss.IndexIDMap, faiss.IndexIDMap2)) else indice
+    if hasattr(base, "hnsw") and "ef_busca" in parametros:
+        base.hnsw.efSearch = parametros["ef_busca"]
+    if hasattr(base, "nprobe") and "nprobe" in parametros:
+        base.nprobe = parametros["nprobe"]
+    return indice
+
+
+def suporta_remocao(tipo: str) -> bool:
+    # O HNSW do FAISS não implementa remove_ids
+    return tipo != "hnsw"
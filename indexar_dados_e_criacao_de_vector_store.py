@@ -1,3 +1,5 @@
+import argparse
+import hashlib
 import json
 import os
 
@@ -5,8 +7,13 @@ import faiss
 import numpy as np
 from sentence_transformers import SentenceTransformer
 
+from cache_de_embeddings import CacheDeEmbeddings
+from fabrica_de_indices import ajustar_parametros_busca, criar_indice_faiss, resolver_armazenamento, suporta_remocao
+from indice_lexical import IndiceBM25
+from pacote_de_indice import escrever_pacote
+
 class ArmazenadorVetorialFaiss:
-    def __init__(self, nome_modelo_embedding='all-MiniLM-L6-v2', caminho_indice='faiss.index', caminho_dados='id_para_texto.json', caminho_id_para_assunto='id_para_assunto.json'):
+    def __init__(self, nome_modelo_embedding='all-MiniLM-L6-v2', caminho_indice='faiss.index', caminho_dados='id_para_texto.json', caminho_id_para_assunto='id_para_assunto.json', caminho_embeddings='embeddings_segmentos.npz', caminho_bm25='indice_bm25.json', caminho_metadados='indice_metadados.json', caminho_pacote='indice_vivi.pacote', tamanho_lote=64, normalizar=True, armazenamento='float32', tipo_indice='flat', parametros_indice=None, arquivos_json=None):
         self.modelo = SentenceTransformer(nome_modelo_embedding)
         self.textos = []
         self.embeddings = None
@@ -16,11 +23,29 @@ class ArmazenadorVetorialFaiss:
         self.caminho_indice = caminho_indice
         self.caminho_dados = caminho_dados
         self.caminho_id_para_assunto = caminho_id_para_assunto
-
-        self.arquivos_json = [
-            r'dados_limpos_e_pre_processados\centros_LGBTI_limpo_e_pre_processado.json',
-            r'dados_limpos_e_pre_processados\como_agir_em_casos_de_violencia_domestica_durante_o_isolamento_social_etapa_2_limpo_e_pre_processado.json',
-            r'dados_limpos_e_pre_processados\o_que_fazer_em_caso_de_violencia_lgbtfobica_etapa_2_limpo_e_pre_processado.json'
+        self.caminho_embeddings = caminho_embeddings
+        self.caminho_bm25 = caminho_bm25
+        self.caminho_metadados = caminho_metadados
+        self.caminho_pacote = caminho_pacote
+        self.nome_modelo_embedding = nome_modelo_embedding
+
+        # Com normalizar=True os vetores têm norma 1 e a busca usa produto interno (similaridade de cosseno).
+        # armazenamento: 'float32' (exato), 'float16' ou 'int8' (IndexScalarQuantizer, 2x e 4x menor)
+        if armazenamento not in ('float32', 'float16', 'int8'):
+            raise ValueError(f"Armazenamento inválido: {armazenamento}")
+        self.tamanho_lote = tamanho_lote
+        self.normalizar = normalizar
+        self.armazenamento = resolver_armazenamento(tipo_indice, armazenamento)
+        # tipo_indice: 'flat' (busca exata), 'hnsw' ou 'ivfpq' (aproximados); ver fabrica_de_indices
+        self.tipo_indice = tipo_indice
+        self.parametros_indice = dict(parametros_indice or {})
+        # Consultas repetidas na interface iterativa não são codificadas de novo
+        self.cache_consultas = CacheDeEmbeddings(lambda textos: self.modelo.encode(textos, convert_to_numpy=True), nome_modelo_embedding, capacidade=1000, janela_segundos=0)
+
+        self.arquivos_json = list(arquivos_json) if arquivos_json is not None else [
+            os.path.join('dados_limpos_e_pre_processados', 'centros_LGBTI_limpo_e_pre_processado.json'),
+            os.path.join('dados_limpos_e_pre_processados', 'como_agir_em_casos_de_violencia_domestica_durante_o_isolamento_social_etapa_2_limpo_e_pre_processado.json'),
+            os.path.join('dados_limpos_e_pre_processados', 'o_que_fazer_em_caso_de_violencia_lgbtfobica_etapa_2_limpo_e_pre_processado.json')
         ]
 
 
@@ -98,19 +123,218 @@ class ArmazenadorVetorialFaiss:
         return self.textos, self.id_para_texto, self.id_para_assunto
 
 
+    @staticmethod
+    def calcular_hash_segmento(chave, texto):
+        return hashlib.sha256(f"{chave}\n{texto}".encode('utf-8')).hexdigest()
+
+
+    def segmentos_com_hash(self):
+        # Lista (hash, texto, assunto) dos segmentos carregados, sem repetir conteúdo idêntico
+        segmentos = []
+        vistos = set()
+        for id_str, texto in self.id_para_texto.items():
+            assunto = self.id_para_assunto.get(id_str, {})
+            chave = next(iter(assunto), "")
+            hash_segmento = self.calcular_hash_segmento(chave, texto)
+            if hash_segmento in vistos:
+                continue
+            vistos.add(hash_segmento)
+            segmentos.append((hash_segmento, texto, assunto))
+        return segmentos
+
+
+    def carregar_embeddings_persistidos(self):
+        # Embeddings já calculados, indexados pelo hash do conteúdo: {hash: (id, vetor)}
+        if not os.path.exists(self.caminho_embeddings):
+            return {}
+        dados = np.load(self.caminho_embeddings)
+        # Vetores salvos com outra normalização, outro modelo ou outra dimensão não servem para este índice
+        salvos = {chave: dados[chave].item() if chave in dados else None for chave in ('normalizado', 'modelo_embedding', 'dimensao')}
+        atuais = {'normalizado': self.normalizar, 'modelo_embedding': self.nome_modelo_embedding, 'dimensao': self.modelo.get_sentence_embedding_dimension()}
+        if any(salvos[chave] != atuais[chave] for chave in atuais):
+            return {}
+        return {str(h): (int(i), v) for h, i, v in zip(dados['hashes'], dados['ids'], dados['vetores'])}
+
+
+    def salvar_embeddings_persistidos(self, hashes, ids, vetores):
+        np.savez(
+            self.caminho_embeddings,
+            hashes=np.array(hashes, dtype=str),
+            ids=np.array(ids, dtype='int64'),
+            vetores=np.asarray(vetores, dtype='float32'),
+            normalizado=np.array(self.normalizar),
+            modelo_embedding=np.array(self.nome_modelo_embedding),
+            dimensao=np.array(self.modelo.get_sentence_embedding_dimension())
+        )
+
+
+    def codificar(self, textos):
+        # Ordena por tamanho para que cada lote tenha textos parecidos (menos padding) e codifica
+        # em blocos, gravando direto num array pré-alocado na ordem original
+        ordem = sorted(range(len(textos)), key=lambda i: len(textos[i]))
+        embeddings = None
+        tamanho_bloco = self.tamanho_lote * 16
+
+        for inicio in range(0, len(ordem), tamanho_bloco):
+            posicoes = ordem[inicio:inicio + tamanho_bloco]
+            bloco = self.modelo.encode(
+                [textos[i] for i in posicoes],
+                batch_size=self.tamanho_lote,
+                normalize_embeddings=self.normalizar,
+                convert_to_numpy=True,
+                show_progress_bar=len(textos) > tamanho_bloco
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(textos), bloco.shape[1]), dtype='float32')
+            embeddings[posicoes] = bloco
+
+        return embeddings
+
+
+    def codificar_consulta(self, consulta):
+        vetor = self.cache_consultas.codificar(consulta)
+        if self.normalizar:
+            vetor = vetor / max(float(np.linalg.norm(vetor)), 1e-12)
+        return vetor.reshape(1, -1).astype('float32')
+
+
+    def indice_tem_ids(self):
+        return isinstance(self.indice, (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+
+    def criar_indice_base(self, dim, embeddings):
+        indice, self.parametros_indice = criar_indice_faiss(
+            dim,
+            tipo=self.tipo_indice,
+            metrica="ip" if self.normalizar else "l2",
+            armazenamento=self.armazenamento,
+            vetores_treino=embeddings,
+            parametros=self.parametros_indice
+        )
+        return indice
+
+
+    def metadados(self):
+        return {
+            "modelo_embedding": self.nome_modelo_embedding,
+            "normalizado": self.normalizar,
+            "metrica": "ip" if self.normalizar else "l2",
+            "armazenamento": self.armazenamento,
+            "tipo_indice": self.tipo_indice,
+            "parametros_indice": self.parametros_indice,
+            "dimensao": int(self.indice.d) if self.indice is not None else None,
+            "total_vetores": int(self.indice.ntotal) if self.indice is not None else 0
+        }
+
+
+    def metadados_compativeis(self):
+        if not os.path.exists(self.caminho_metadados):
+            return False
+        with open(self.caminho_metadados, 'r', encoding='utf-8') as f:
+            salvos = json.load(f)
+        atuais = self.metadados()
+        if not all(salvos.get(chave) == atuais[chave] for chave in ("modelo_embedding", "normalizado", "armazenamento", "tipo_indice")):
+            return False
+        # Os parâmetros salvos já vêm completos (com os padrões da fábrica); basta que os pedidos coincidam
+        parametros_salvos = salvos.get("parametros_indice") or {}
+        return all(parametros_salvos.get(chave) == valor for chave, valor in self.parametros_indice.items())
+
+
+    def relatorio_memoria(self):
+        if self.indice is None:
+            raise ValueError("Índice não criado/carregado.")
+        total = int(self.indice.ntotal)
+        bytes_indice = int(faiss.serialize_index(self.indice).nbytes)
+        bytes_float32 = total * self.indice.d * 4
+        relatorio = {
+            "vetores": total,
+            "dimensao": int(self.indice.d),
+            "armazenamento": self.armazenamento,
+            "bytes_indice": bytes_indice,
+            "bytes_por_vetor": bytes_indice / total if total else 0.0,
+            "bytes_equivalente_float32": bytes_float32,
+            "economia": 1 - bytes_indice / bytes_float32 if bytes_float32 else 0.0
+        }
+        print(f"Memória do índice: {bytes_indice / 1024:.1f} KiB para {total} vetores ({relatorio['bytes_por_vetor']:.0f} bytes/vetor, "
+              f"{relatorio['economia']:.0%} abaixo do float32 puro de {bytes_float32 / 1024:.1f} KiB).")
+        return relatorio
+
+
     def criar_indice(self):
         if not self.textos:
             raise ValueError("Nenhum texto carregado para indexar.")
 
-        print("Criando embeddings...")
-        embeddings = self.modelo.encode(self.textos, show_progress_bar=True)
-        embeddings = np.array(embeddings).astype('float32')
+        segmentos = self.segmentos_com_hash()
+        persistidos = self.carregar_embeddings_persistidos()
+
+        # Só codifica o que ainda não tem embedding salvo para o mesmo conteúdo
+        pendentes = [texto for hash_segmento, texto, _ in segmentos if hash_segmento not in persistidos]
+        print(f"Criando embeddings ({len(pendentes)} novos, {len(segmentos) - len(pendentes)} reaproveitados)...")
+        novos = iter(self.codificar(pendentes)) if pendentes else iter(())
+
+        vetores = [persistidos[hash_segmento][1] if hash_segmento in persistidos else next(novos) for hash_segmento, _, _ in segmentos]
+        embeddings = np.vstack(vetores).astype('float32')
+        ids = np.arange(len(segmentos), dtype='int64')
 
         dim = embeddings.shape[1]
-        self.indice = faiss.IndexFlatL2(dim)
-        self.indice.add(embeddings)
+        self.indice = faiss.IndexIDMap(self.criar_indice_base(dim, embeddings))
+        self.indice.add_with_ids(embeddings, ids)
+
+        self.id_para_texto = {str(i): texto for i, (_, texto, _) in zip(ids, segmentos)}
+        self.id_para_assunto = {str(i): assunto for i, (_, _, assunto) in zip(ids, segmentos)}
+        self.textos = list(self.id_para_texto.values())
+        self.salvar_embeddings_persistidos([h for h, _, _ in segmentos], ids, embeddings)
+
+        # Os vetores ficam só no índice (e no arquivo de embeddings), sem cópia extra em memória
+        self.embeddings = None
+        self.relatorio_memoria()
+
 
-        self.embeddings = embeddings
+    def atualizar_indice_incremental(self):
+        # Recalcula só os segmentos novos ou alterados e remove do índice os que sumiram dos JSONs.
+        # Os ids são estáveis: um segmento mantém o mesmo id enquanto seu conteúdo não muda.
+        persistidos = self.carregar_embeddings_persistidos()
+
+        try:
+            self.carregar_indice()
+        except FileNotFoundError:
+            self.indice = None
+
+        if self.indice is None or not self.indice_tem_ids() or not persistidos or not self.metadados_compativeis() or not suporta_remocao(self.tipo_indice):
+            print("Índice com ids estáveis não encontrado, criando índice completo...")
+            self.carregar_textos_de_todas_chaves()
+            self.criar_indice()
+            return {"novos": len(self.textos), "removidos": 0, "mantidos": 0}
+
+        self.carregar_textos_de_todas_chaves()
+        segmentos = self.segmentos_com_hash()
+        hashes_atuais = {hash_segmento for hash_segmento, _, _ in segmentos}
+
+        removidos = [id_antigo for hash_segmento, (id_antigo, _) in persistidos.items() if hash_segmento not in hashes_atuais]
+        if removidos:
+            self.indice.remove_ids(np.array(removidos, dtype='int64'))
+
+        novos = [(hash_segmento, texto) for hash_segmento, texto, _ in segmentos if hash_segmento not in persistidos]
+        proximo_id = max(id_antigo for id_antigo, _ in persistidos.values()) + 1
+        ids_novos = {hash_segmento: proximo_id + i for i, (hash_segmento, _) in enumerate(novos)}
+        if novos:
+            vetores_novos = self.codificar([texto for _, texto in novos])
+            self.indice.add_with_ids(vetores_novos, np.array(list(ids_novos.values()), dtype='int64'))
+            for (hash_segmento, _), vetor in zip(novos, vetores_novos):
+                persistidos[hash_segmento] = (ids_novos[hash_segmento], vetor)
+
+        hashes = [hash_segmento for hash_segmento, _, _ in segmentos]
+        ids = [persistidos[hash_segmento][0] for hash_segmento in hashes]
+        self.id_para_texto = {str(i): texto for i, (_, texto, _) in zip(ids, segmentos)}
+        self.id_para_assunto = {str(i): assunto for i, (_, _, assunto) in zip(ids, segmentos)}
+        self.textos = list(self.id_para_texto.values())
+        self.salvar_embeddings_persistidos(hashes, ids, [persistidos[hash_segmento][1] for hash_segmento in hashes])
+
+        self.relatorio_memoria()
+
+        resumo = {"novos": len(novos), "removidos": len(removidos), "mantidos": len(segmentos) - len(novos)}
+        print(f"Índice atualizado de forma incremental: {resumo}")
+        return resumo
 
 
     def salvar_indice(self):
@@ -121,13 +345,23 @@ class ArmazenadorVetorialFaiss:
             json.dump(self.id_para_texto, f, ensure_ascii=False, indent=2)
         with open(self.caminho_id_para_assunto, 'w', encoding='utf-8') as f:
             json.dump(self.id_para_assunto, f, ensure_ascii=False, indent=2)
-        print(f"Índice salvo em '{self.caminho_indice}', dados em '{self.caminho_dados}' e mapeamento de assunto em '{self.caminho_id_para_assunto}'.")
+        with open(self.caminho_metadados, 'w', encoding='utf-8') as f:
+            json.dump(self.metadados(), f, ensure_ascii=False, indent=2)
+        # O índice lexical é reconstruído junto, com os mesmos ids do índice FAISS
+        IndiceBM25().construir(self.id_para_texto).salvar(self.caminho_bm25)
+        # Pacote mapeável em memória lido pelo chatbot; os JSONs continuam servindo à atualização incremental
+        escrever_pacote(self.caminho_pacote, self.id_para_texto, self.id_para_assunto, self.caminho_indice)
+        print(f"Índice salvo em '{self.caminho_indice}', dados em '{self.caminho_dados}', mapeamento de assunto em '{self.caminho_id_para_assunto}', índice BM25 em '{self.caminho_bm25}' e pacote em '{self.caminho_pacote}'.")
 
 
     def carregar_indice(self):
         if not os.path.exists(self.caminho_indice) or not os.path.exists(self.caminho_dados) or not os.path.exists(self.caminho_id_para_assunto):
             raise FileNotFoundError("Arquivos de índice, dados ou mapeamento de assunto não encontrados.")
         self.indice = faiss.read_index(self.caminho_indice)
+        if os.path.exists(self.caminho_metadados):
+            with open(self.caminho_metadados, 'r', encoding='utf-8') as f:
+                parametros_salvos = json.load(f).get("parametros_indice", {})
+            ajustar_parametros_busca(self.indice, parametros_salvos)
         with open(self.caminho_dados, 'r', encoding='utf-8') as f:
             self.id_para_texto = json.load(f)
         with open(self.caminho_id_para_assunto, 'r', encoding='utf-8') as f:
@@ -153,12 +387,14 @@ class ArmazenadorVetorialFaiss:
             print("Nenhum texto válido para atualização encontrado.")
             return
 
-        novos_embeddings = self.modelo.encode(textos_para_embedding, show_progress_bar=True)
-        novos_embeddings = np.array(novos_embeddings).astype('float32')
-
-        self.indice.add(novos_embeddings)
+        novos_embeddings = self.codificar(textos_para_embedding)
 
         max_id = max(map(int, self.id_para_texto.keys())) if self.id_para_texto else -1
+        if self.indice_tem_ids():
+            self.indice.add_with_ids(novos_embeddings, np.arange(max_id + 1, max_id + 1 + len(novos_embeddings), dtype='int64'))
+        else:
+            self.indice.add(novos_embeddings)
+
         for i, texto_concatenado in enumerate(textos_para_embedding, start=max_id + 1):
             id_str = str(i)
             self.id_para_texto[id_str] = texto_concatenado
@@ -171,7 +407,7 @@ class ArmazenadorVetorialFaiss:
         if self.indice is None:
             raise ValueError("Índice FAISS não carregado/criado.")
 
-        vetor_consulta = self.modelo.encode([consulta]).astype('float32')
+        vetor_consulta = self.codificar_consulta(consulta)
         distancias, indices = self.indice.search(vetor_consulta, top_k)
 
         resultados = []
@@ -212,7 +448,8 @@ class ArmazenadorVetorialFaiss:
                             print(f"{i}. Distância: {res['distancia']:.4f}")
                             print(json.dumps(output_dict, ensure_ascii=False, indent=2))
                         else:
-                            print(f"{i}. Distância: {res['distancia']:.4f} - Texto concatenado: {res['texto_concatenado'][:300].replace('\n', ' ')}{'...' if len(res['texto_concatenado']) > 300 else ''}")
+                            texto_resumido = res['texto_concatenado'][:300].replace('\n', ' ')
+                            print(f"{i}. Distância: {res['distancia']:.4f} - Texto concatenado: {texto_resumido}{'...' if len(res['texto_concatenado']) > 300 else ''}")
                 else:
                     print("Nenhum resultado encontrado.")
             except Exception as e:
@@ -220,15 +457,46 @@ class ArmazenadorVetorialFaiss:
 
 
 if __name__ == '__main__':
-    armazenador = ArmazenadorVetorialFaiss(caminho_id_para_assunto='id_para_assunto.json')
-
-    try:
-        armazenador.carregar_indice()
-    except Exception as e:
-        print(f"Não foi possível carregar índice salvo: {e}")
-        print("Carregando textos dos arquivos JSON e criando índice...")
-        armazenador.carregar_textos_de_todas_chaves()
-        armazenador.criar_indice()
+    parser = argparse.ArgumentParser(description="Cria ou atualiza o índice FAISS da Vivi.")
+    parser.add_argument('--incremental', action='store_true', help="Recalcula apenas os segmentos novos ou alterados e remove os excluídos.")
+    parser.add_argument('--tamanho-lote', type=int, default=64, help="Tamanho do lote na geração de embeddings.")
+    parser.add_argument('--sem-normalizar', action='store_true', help="Mantém vetores sem normalizar e busca por distância L2.")
+    parser.add_argument('--tipo-indice', choices=['flat', 'hnsw', 'ivfpq'], default='flat', help="Tipo de índice FAISS (flat é exato; hnsw e ivfpq são aproximados).")
+    parser.add_argument('--parametros-indice', type=json.loads, default=None, help='Parâmetros do índice em JSON, ex.: \'{"M": 32, "ef_busca": 64}\' ou \'{"nlist": 64, "nprobe": 8}\'.')
+    parser.add_argument('--armazenamento', choices=['float32', 'float16', 'int8'], default='float32', help="Precisão dos vetores guardados no índice.")
+    parser.add_argument('--reconstruir', action='store_true', help="Recria o índice a partir dos JSONs mesmo que exista um índice salvo.")
+    args = parser.parse_args()
+
+    armazenador = ArmazenadorVetorialFaiss(
+        caminho_id_para_assunto='id_para_assunto.json',
+        tamanho_lote=args.tamanho_lote,
+        normalizar=not args.sem_normalizar,
+        armazenamento=args.armazenamento,
+        tipo_indice=args.tipo_indice,
+        parametros_indice=args.parametros_indice
+    )
+
+    if args.incremental:
+        armazenador.atualizar_indice_incremental()
         armazenador.salvar_indice()
+    else:
+        # Um índice salvo com outra configuração (ou sem metadados, como o índice L2 original) não
+        # serve: as consultas seriam codificadas de um jeito e o índice guardado de outro
+        reconstruir = args.reconstruir
+        if not reconstruir and os.path.exists(armazenador.caminho_indice) and not armazenador.metadados_compativeis():
+            print("Índice salvo sem metadados ou com configuração diferente da pedida; ele será recriado.")
+            reconstruir = True
+        indice_carregado = False
+        if not reconstruir:
+            try:
+                armazenador.carregar_indice()
+                indice_carregado = True
+            except Exception as e:
+                print(f"Não foi possível carregar índice salvo: {e}")
+        if not indice_carregado:
+            print("Carregando textos dos arquivos JSON e criando índice...")
+            armazenador.carregar_textos_de_todas_chaves()
+            armazenador.criar_indice()
+            armazenador.salvar_indice()
 
     armazenador.interface_consulta_iterativa()
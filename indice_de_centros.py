@@ -0,0 +1,164 @@
+import json
+import re
+
+from indice_lexical import normalizar_texto
+
+PADRAO_NOME_CENTRO = re.compile(r"Centro de Refer[eê]ncia LGBTI\+?\s*(.*?)\s*\((.*?)\)", re.IGNORECASE)
+
+# Intenções de campo, testadas sobre a pergunta já sem acentos
+PADROES_CAMPOS = {
+    "telefone": re.compile(r"\b(telefone|fone|ligar|whatsapp|zap|numero)\b"),
+    "email": re.compile(r"\be-?mail\b"),
+    "endereco": re.compile(r"\b(endereco|onde fica|localiza\w*|como chego|como chegar)\b"),
+    "horario": re.compile(r"\b(horario|funcionamento|abre|fecha|atende\w*)\b"),
+    "contato": re.compile(r"\bcontato\b")
+}
+
+ALIASES_ZONA = {
+    "zona oeste": ["zona oeste"],
+    "zona leste": ["zona leste"],
+    "zona norte": ["zona norte"],
+    "zona sul": ["zona sul"],
+    "centro": ["regiao central", "zona central", "centro da cidade"]
+}
+
+# Zona, bairro ou só o primeiro/último nome não bastam: "delegacia da zona leste" não é um centro
+PADRAO_MENCAO_CENTRO = re.compile(r"\bcentros?\b(?! da cidade)")
+
+
+def _separar_registros_mesclados(centro: dict) -> list:
+    # O pré-processamento às vezes junta dois centros num registro só (o horário traz as linhas do
+    # centro seguinte e o telefone/e-mail do registro pertencem ao último deles). Aqui eles são separados.
+    linhas = [linha.strip() for linha in centro.get("horario", "").split("\n") if linha.strip()]
+    if len(linhas) <= 1:
+        return [centro]
+
+    registros = [{"nome": centro["nome"], "zona": centro.get("zona", ""), "endereco": centro.get("endereco", ""), "horario": linhas[0], "telefone": [], "email": ""}]
+    for linha in linhas[1:]:
+        atual = registros[-1]
+        if linha.lower().startswith("centro"):
+            zona = re.search(r"\((.*?)\)", linha)
+            registros.append({"nome": linha, "zona": zona.group(1) if zona else "Desconhecida", "endereco": "", "horario": "", "telefone": [], "email": ""})
+        elif linha.lower().startswith("telefone"):
+            atual["telefone"] = [linha.split(":", 1)[-1].strip()]
+        elif "@" in linha:
+            atual["email"] = linha
+        elif not atual["endereco"]:
+            atual["endereco"] = linha
+        elif not atual["horario"]:
+            atual["horario"] = linha
+
+    registros[-1]["telefone"] = registros[-1]["telefone"] or centro.get("telefone", [])
+    registros[-1]["email"] = registros[-1]["email"] or centro.get("email", "")
+    return registros
+
+
+class IndiceDeCentros:
+    # Consulta estruturada dos Centros de Referência: a pergunta é casada com nomes, apelidos, zonas
+    # e bairros numa única regex e a resposta sai de campos já formatados, sem passar pela busca vetorial.
+    # O nome completo identifica o centro sozinho; os demais apelidos só valem quando a pergunta fala em centro.
+    def __init__(self, centros: list):
+        self.centros = []
+        self.centro_por_alias = {}
+        self.aliases_completos = set()
+
+        for centro_bruto in centros:
+            for centro in _separar_registros_mesclados(centro_bruto):
+                self._adicionar(centro)
+
+        aliases = sorted(self.centro_por_alias, key=len, reverse=True)
+        self.padrao_aliases = re.compile(r"\b(" + "|".join(re.escape(alias) for alias in aliases) + r")\b") if aliases else None
+
+
+    @classmethod
+    def carregar(cls, caminho: str):
+        with open(caminho, "r", encoding="utf-8") as f:
+            return cls(json.load(f).get("centros", []))
+
+
+    def _adicionar(self, centro: dict):
+        nome = centro["nome"].strip()
+        correspondencia = PADRAO_NOME_CENTRO.search(nome)
+        nome_pessoa = correspondencia.group(1).strip() if correspondencia else nome
+        zona = centro.get("zona", "").strip()
+
+        telefones = " / ".join(t.strip() for t in centro.get("telefone", []) if t.strip())
+        email = re.search(r"[\w\.-]+@[\w\.-]+", centro.get("email", ""))
+
+        registro = {
+            "nome": re.sub(r"\s*\(.*?\)\s*$", "", nome),
+            "zona": zona,
+            "endereco": centro.get("endereco", "").strip(),
+            "horario": centro.get("horario", "").strip(),
+            "telefone": telefones,
+            "email": email.group() if email else ""
+        }
+        self.centros.append(registro)
+
+        self.aliases_completos.add(normalizar_texto(nome_pessoa))
+        aliases = {normalizar_texto(nome_pessoa)}
+        partes = normalizar_texto(nome_pessoa).split()
+        aliases.update(parte for parte in (partes[:1] + partes[-1:]) if len(parte) >= 4)
+        aliases.update(ALIASES_ZONA.get(normalizar_texto(zona), []))
+        bairro = re.split(r"\s[-–]\s|,\s(?=[^\d])", registro["endereco"])
+        if len(bairro) > 1:
+            aliases.add(normalizar_texto(bairro[-1]).strip())
+
+        for alias in aliases:
+            # Um apelido que aponta para dois centros é ambíguo e fica de fora
+            if alias in self.centro_por_alias and self.centro_por_alias[alias] is not registro:
+                self.centro_por_alias[alias] = None
+            else:
+                self.centro_por_alias.setdefault(alias, registro)
+
+
+    def identificar_centro(self, pergunta_normalizada: str):
+        if self.padrao_aliases is None:
+            return None
+        menciona_centro = PADRAO_MENCAO_CENTRO.search(pergunta_normalizada) is not None
+        for correspondencia in self.padrao_aliases.finditer(pergunta_normalizada):
+            alias = correspondencia.group(1)
+            if alias not in self.aliases_completos and not menciona_centro:
+                continue
+            centro = self.centro_por_alias.get(alias)
+            if centro is not None:
+                return centro
+        return None
+
+
+    @staticmethod
+    def identificar_campos(pergunta_normalizada: str) -> list:
+        return [campo for campo, padrao in PADROES_CAMPOS.items() if padrao.search(pergunta_normalizada)]
+
+
+    def formatar(self, centro: dict, campo: str) -> str:
+        if campo == "telefone":
+            return f"Telefone: {centro['telefone']}" if centro["telefone"] else "Telefone não encontrado."
+        if campo == "email":
+            return f"E-mail: {centro['email']}" if centro["email"] else "E-mail não encontrado."
+        if campo == "endereco":
+            return f"Endereço: {centro['endereco']}" if centro["endereco"] else "Endereço não encontrado."
+        if campo == "horario":
+            return f"Horário: {centro['horario']}" if centro["horario"] else "Horário não encontrado."
+        return "\n".join([centro["nome"]] + [self.formatar(centro, c) for c in ("endereco", "horario", "telefone", "email")])
+
+
+    def responder(self, pergunta: str):
+        # Devolve None quando a pergunta não é de contato ou não cita um centro conhecido,
+        # para que o pipeline siga pelo caminho normal de recuperação.
+        pergunta_normalizada = normalizar_texto(pergunta)
+        campos = self.identificar_campos(pergunta_normalizada)
+        if not campos:
+            return None
+
+        centro = self.identificar_centro(pergunta_normalizada)
+        if centro is None:
+            return None
+
+        # A resposta sempre começa pelo nome do centro, para deixar claro de qual centro é o dado
+        if "contato" in campos:
+            campos = ["contato"]
+            resposta = self.formatar(centro, "contato")
+        else:
+            resposta = "\n".join([centro["nome"]] + [self.formatar(centro, campo) for campo in campos])
+        return {"centro": centro["nome"], "campos": campos, "resposta": resposta}
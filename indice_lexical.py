@@ -0,0 +1,133 @@
+import heapq
+import json
+import math
+import re
+import unicodedata
+from collections import Counter
+
+# Stopwords do português já sem acento, no mesmo formato produzido por normalizar_texto
+STOPWORDS = {
+    "a", "ao", "aos", "aquela", "aquele", "aqueles", "aquilo", "as", "ate", "com", "como", "da", "das", "de",
+    "dela", "dele", "deles", "depois", "do", "dos", "e", "ela", "elas", "ele", "eles", "em", "entre", "era",
+    "essa", "essas", "esse", "esses", "esta", "estas", "este", "estes", "eu", "foi", "ha", "isso", "isto", "ja",
+    "la", "lhe", "mais", "mas", "me", "mesmo", "meu", "minha", "muito", "na", "nas", "nem", "no", "nos", "num",
+    "numa", "o", "os", "ou", "para", "pela", "pelas", "pelo", "pelos", "por", "qual", "quando", "que", "quem",
+    "se", "seja", "sem", "ser", "seu", "seus", "so", "sua", "suas", "tambem", "te", "tem", "uma", "um", "umas",
+    "uns", "voce", "voces", "vos"
+}
+
+# Sufixos removidos em ordem (versão enxuta do RSLP): plural, feminino, advérbio, aumentativo, nominal e verbal
+SUFIXOS_PLURAL = [("oes", "ao"), ("aes", "ao"), ("ais", "al"), ("eis", "el"), ("ois", "ol"), ("is", "il"), ("ns", "m"), ("res", "r"), ("s", "")]
+SUFIXOS_FEMININO = [("ona", "ao"), ("ora", "or"), ("na", "no"), ("ica", "ico"), ("ada", "ado"), ("ida", "ido"), ("iva", "ivo"), ("eira", "eiro")]
+SUFIXOS_NOMINAIS = ["amente", "mente", "acoes", "acao", "icoes", "icao", "idade", "ismo", "ista", "avel", "ivel", "ancia", "encia", "mento", "ador", "edor", "idor", "oso", "osa", "ico", "ica"]
+SUFIXOS_VERBAIS = ["ariamos", "eriamos", "iriamos", "assemos", "essemos", "issemos", "aremos", "eremos", "iremos", "ando", "endo", "indo", "aram", "eram", "iram", "ava", "ado", "ido", "ar", "er", "ir"]
+
+PADRAO_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def normalizar_texto(texto: str) -> str:
+    decomposto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def reduzir_radical(palavra: str) -> str:
+    if len(palavra) <= 3 or palavra.isdigit():
+        return palavra
+
+    for sufixo, substituto in SUFIXOS_PLURAL:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            palavra = palavra[: -len(sufixo)] + substituto
+            break
+
+    for sufixo, substituto in SUFIXOS_FEMININO:
+        if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+            palavra = palavra[: -len(sufixo)] + substituto
+            break
+
+    for sufixos in (SUFIXOS_NOMINAIS, SUFIXOS_VERBAIS):
+        for sufixo in sufixos:
+            if palavra.endswith(sufixo) and len(palavra) - len(sufixo) >= 3:
+                return palavra[: -len(sufixo)]
+
+    if palavra[-1] in "aeo" and len(palavra) > 4:
+        return palavra[:-1]
+    return palavra
+
+
+def tokenizar(texto: str) -> list:
+    return [reduzir_radical(token) for token in PADRAO_TOKEN.findall(normalizar_texto(texto)) if token not in STOPWORDS]
+
+
+class IndiceBM25:
+    # Índice invertido BM25. Os pesos de cada termo por documento são calculados na construção,
+    # então a consulta é só a soma dos pesos das listas de postings dos termos da pergunta.
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.total_documentos = 0
+
+
+    def construir(self, id_para_texto: dict):
+        tokens_por_documento = {int(id_str): Counter(tokenizar(texto)) for id_str, texto in id_para_texto.items()}
+        self.total_documentos = len(tokens_por_documento)
+        if not self.total_documentos:
+            self.postings = {}
+            return self
+
+        comprimentos = {id_doc: sum(contagem.values()) for id_doc, contagem in tokens_por_documento.items()}
+        media_comprimento = sum(comprimentos.values()) / self.total_documentos or 1.0
+
+        frequencia_documentos = Counter()
+        for contagem in tokens_por_documento.values():
+            frequencia_documentos.update(contagem.keys())
+
+        postings = {}
+        for id_doc, contagem in tokens_por_documento.items():
+            normalizacao = self.k1 * (1 - self.b + self.b * comprimentos[id_doc] / media_comprimento)
+            for termo, tf in contagem.items():
+                df = frequencia_documentos[termo]
+                idf = math.log(1 + (self.total_documentos - df + 0.5) / (df + 0.5))
+                postings.setdefault(termo, {})[id_doc] = idf * tf * (self.k1 + 1) / (tf + normalizacao)
+
+        self.postings = postings
+        return self
+
+
+    def buscar(self, consulta: str, top_k: int = 10) -> list:
+        pontuacoes = {}
+        for termo in set(tokenizar(consulta)):
+            for id_doc, peso in self.postings.get(termo, {}).items():
+                pontuacoes[id_doc] = pontuacoes.get(id_doc, 0.0) + peso
+        return heapq.nlargest(top_k, pontuacoes.items(), key=lambda item: item[1])
+
+
+    def salvar(self, caminho: str):
+        dados = {
+            "k1": self.k1,
+            "b": self.b,
+            "total_documentos": self.total_documentos,
+            "postings": {termo: [[id_doc, round(peso, 6)] for id_doc, peso in docs.items()] for termo, docs in self.postings.items()}
+        }
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump(dados, f, ensure_ascii=False)
+
+
+    @classmethod
+    def carregar(cls, caminho: str):
+        with open(caminho, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        indice = cls(dados["k1"], dados["b"])
+        indice.total_documentos = dados["total_documentos"]
+        indice.postings = {termo: {int(id_doc): peso for id_doc, peso in docs} for termo, docs in dados["postings"].items()}
+        return indice
+
+
+def fusao_rrf(listas_ranqueadas: list, pesos: list = None, k: int = 60) -> list:
+    # Reciprocal Rank Fusion: cada lista contribui peso / (k + posição) para cada id que contém
+    pesos = pesos or [1.0] * len(listas_ranqueadas)
+    pontuacoes = {}
+    for lista, peso in zip(listas_ranqueadas, pesos):
+        for posicao, id_doc in enumerate(lista, start=1):
+            pontuacoes[id_doc] = pontuacoes.get(id_doc, 0.0) + peso / (k + posicao)
+    return sorted(pontuacoes.items(), key=lambda item: item[1], reverse=True)
@@ -1,24 +1,126 @@
-import fitz  # pymupdf
+import argparse
+import hashlib
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-def converter_pdfs_para_txt(pasta):
-    for arquivo in os.listdir(pasta):
-        if arquivo.endswith(".pdf"):
-            caminho_pdf = os.path.join(pasta, arquivo)
-            nome_base = os.path.splitext(arquivo)[0]
-            caminho_txt = os.path.join(pasta, nome_base + ".txt")
+NOME_MANIFESTO = "manifesto_pdfs.json"
 
-            with fitz.open(caminho_pdf) as doc:
-                texto_total = ""
-                for pagina in doc:
-                    texto_total += pagina.get_text()
 
-            with open(caminho_txt, "w", encoding="utf-8") as f:
-                f.write(texto_total)
+def iterar_paginas(caminho_pdf):
+    # Gerador de (número da página, texto): o documento nunca fica inteiro na memória
+    import fitz  # pymupdf
 
-            print(f"Salvo: {caminho_txt}")
+    with fitz.open(caminho_pdf) as doc:
+        for numero, pagina in enumerate(doc, start=1):
+            yield numero, pagina.get_text()
+
+
+def hash_de_arquivo(caminho, tamanho_bloco=1024 * 1024):
+    resumo = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(tamanho_bloco), b""):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def converter_pdf(caminho_pdf, caminho_txt):
+    # Grava cada página assim que é extraída e guarda onde ela começa e termina no .txt bruto
+    # (em caracteres). Os offsets valem só para esse .txt: a limpeza reescreve o texto depois.
+    inicio = time.perf_counter()
+    temporario = caminho_txt + ".tmp"
+    paginas = []
+    posicao = 0
+    with open(temporario, "w", encoding="utf-8") as f:
+        for numero, texto in iterar_paginas(caminho_pdf):
+            f.write(texto)
+            paginas.append({"pagina": numero, "inicio": posicao, "fim": posicao + len(texto)})
+            posicao += len(texto)
+    os.replace(temporario, caminho_txt)
+    return {"txt": caminho_txt, "paginas": paginas, "caracteres": posicao, "segundos": time.perf_counter() - inicio}
+
+
+def carregar_manifesto(caminho):
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salvar_manifesto(caminho, manifesto):
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(manifesto, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def pdfs_alterados(pasta, manifesto):
+    # Tamanho e mtime iguais ao do manifesto: não muda, sem nem ler o arquivo. Se mudaram mas o
+    # hash é o mesmo (arquivo copiado ou tocado), só o manifesto é atualizado.
+    alterados = []
+    for arquivo in sorted(os.listdir(pasta)):
+        if not arquivo.endswith(".pdf"):
+            continue
+        caminho_pdf = os.path.join(pasta, arquivo)
+        caminho_txt = os.path.join(pasta, os.path.splitext(arquivo)[0] + ".txt")
+        estado = os.stat(caminho_pdf)
+        registro = manifesto.get(arquivo)
+
+        if registro is not None and os.path.exists(caminho_txt):
+            if registro["tamanho"] == estado.st_size and registro["mtime"] == estado.st_mtime:
+                continue
+            hash_atual = hash_de_arquivo(caminho_pdf)
+            if registro["sha256"] == hash_atual:
+                registro.update(tamanho=estado.st_size, mtime=estado.st_mtime)
+                continue
+        else:
+            hash_atual = hash_de_arquivo(caminho_pdf)
+
+        alterados.append((arquivo, caminho_pdf, caminho_txt, {"sha256": hash_atual, "tamanho": estado.st_size, "mtime": estado.st_mtime}))
+    return alterados
+
+
+def converter_pdfs_para_txt(pasta, processos=None, forcar=False):
+    # Devolve o manifesto e os PDFs que falharam ({arquivo: mensagem}); o .txt de um PDF que
+    # falhou fica como estava e o manifesto não é atualizado para ele
+    caminho_manifesto = os.path.join(pasta, NOME_MANIFESTO)
+    manifesto = {} if forcar else carregar_manifesto(caminho_manifesto)
+    pdfs = {arquivo for arquivo in os.listdir(pasta) if arquivo.endswith(".pdf")}
+    for removido in set(manifesto) - pdfs:
+        del manifesto[removido]
+    alterados = pdfs_alterados(pasta, manifesto)
+    falhas = {}
+
+    print(f"{len(alterados)} de {len(pdfs)} PDFs novos ou alterados em '{pasta}'.")
+
+    if alterados:
+        inicio = time.perf_counter()
+        # Um processo por PDF: a extração é CPU-bound e cada documento é independente
+        with ProcessPoolExecutor(max_workers=processos) as executor:
+            futuros = [(arquivo, identidade, executor.submit(converter_pdf, caminho_pdf, caminho_txt)) for arquivo, caminho_pdf, caminho_txt, identidade in alterados]
+            for arquivo, identidade, futuro in futuros:
+                try:
+                    resultado = futuro.result()
+                except Exception as e:
+                    print(f"Erro ao converter '{arquivo}': {e}")
+                    falhas[arquivo] = str(e)
+                    continue
+                manifesto[arquivo] = {**identidade, **resultado}
+                print(f"Salvo: {resultado['txt']} ({len(resultado['paginas'])} páginas em {resultado['segundos']:.1f}s)")
+        print(f"Conversão concluída em {time.perf_counter() - inicio:.1f}s.")
+
+    salvar_manifesto(caminho_manifesto, manifesto)
+    return manifesto, falhas
 
 
 if __name__ == "__main__":
-    pasta = "fonte_de_dados"
-    converter_pdfs_para_txt(pasta)
+    parser = argparse.ArgumentParser(description="Extrai o texto dos PDFs de uma pasta para .txt, em paralelo e só para os PDFs novos ou alterados.")
+    parser.add_argument("pasta", nargs="?", default="fonte_de_dados")
+    parser.add_argument("--processos", type=int, default=None, help="Número de processos (padrão: um por CPU).")
+    parser.add_argument("--forcar", action="store_true", help="Ignora o manifesto e converte todos os PDFs.")
+    args = parser.parse_args()
+
+    _, falhas = converter_pdfs_para_txt(args.pasta, args.processos, args.forcar)
+    if falhas:
+        raise SystemExit(f"{len(falhas)} PDF(s) não convertidos: {', '.join(sorted(falhas))}")
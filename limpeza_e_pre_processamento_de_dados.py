@@ -133,7 +133,7 @@ class PreProcessadorEtapa2ComoAgirEmCasosDeViolenciaDomestica:
     def __init__(self, caminho_arquivo):
         self.caminho_arquivo = caminho_arquivo
         self.nome_arquivo = os.path.basename(caminho_arquivo)
-        self.nome_json = "como_agir_em_casos_de_violencia_domestica_durante_o_isolamento_social_etapa_2_limpo_e_pre_processado"
+        self.nome_json = "como_agir_em_casos_de_violencia_domestica_durante_o_isolamento_social_etapa_2_limpo_e_pre_processado.json"
         self.pasta_saida = "dados_limpos_e_pre_processados"
         os.makedirs(self.pasta_saida, exist_ok=True)
 
@@ -459,8 +459,9 @@ class PreProcessadorEtapa2OQueFazerEmCasoDeViolenciaLgbtfobica:
 
 
 if __name__ == "__main__":
-    caminho_do_arquivo_txt = "dados_limpos_e_pre_processados\o_que_fazer_em_caso_de_violencia_lgbtfobica_etapa_1_limpo.txt"
-    nome_do_arquivo_json_saida = "dados_limpos_e_pre_processados\o_que_fazer_em_caso_de_violencia_lgbtfobica_etapa_2_limpo_e_pre_processado.json"
+    # Para rodar todas as etapas de todos os documentos, com cache por etapa: python pipeline_de_ingestao.py
+    caminho_do_arquivo_txt = os.path.join("dados_limpos_e_pre_processados", "o_que_fazer_em_caso_de_violencia_lgbtfobica_etapa_1_limpo.txt")
+    nome_do_arquivo_json_saida = os.path.join("dados_limpos_e_pre_processados", "o_que_fazer_em_caso_de_violencia_lgbtfobica_etapa_2_limpo_e_pre_processado.json")
 
     try:
         processador = PreProcessadorEtapa2OQueFazerEmCasoDeViolenciaLgbtfobica(caminho_do_arquivo_txt)
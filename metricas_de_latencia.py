@@ -0,0 +1,272 @@
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+LIMITES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTIS = (0.5, 0.95, 0.99)
+
+
+class Histograma:
+    # Contagens por faixa (formato Prometheus) e uma janela das observações recentes para os percentis
+    def __init__(self, limites: tuple = LIMITES_PADRAO, tamanho_janela: int = 4096):
+        self.limites = limites
+        self.contagens = [0] * (len(limites) + 1)
+        self.soma = 0.0
+        self.total = 0
+        self.recentes = deque(maxlen=tamanho_janela)
+
+
+    def observar(self, valor: float):
+        posicao = next((i for i, limite in enumerate(self.limites) if valor <= limite), len(self.limites))
+        self.contagens[posicao] += 1
+        self.soma += valor
+        self.total += 1
+        self.recentes.append(valor)
+
+
+    def percentis(self) -> dict:
+        ordenados = sorted(self.recentes)
+        if not ordenados:
+            return {quantil: None for quantil in QUANTIS}
+        return {quantil: ordenados[min(int(quantil * len(ordenados)), len(ordenados) - 1)] for quantil in QUANTIS}
+
+
+def _rotulos(rotulos: tuple, extra: dict = None) -> str:
+    pares = list(rotulos) + list((extra or {}).items())
+    return "{" + ",".join(f'{chave}="{valor}"' for chave, valor in pares) + "}" if pares else ""
+
+
+class ColetorDeMetricas:
+    # Histogramas e contadores do processo, com rótulos. Exporta em texto do Prometheus (por HTTP
+    # ou em arquivo, periodicamente) e em resumo JSON com p50/p95/p99, sem depender do opik.
+    _instancia = None
+    _trava_instancia = Lock()
+
+    def __init__(self):
+        self.histogramas = {}
+        self.contadores = {}
+        self.trava = Lock()
+        self.servidor_http = None
+        self.thread_dump = None
+
+
+    @classmethod
+    def instancia(cls):
+        if cls._instancia is None:
+            with cls._trava_instancia:
+                if cls._instancia is None:
+                    cls._instancia = cls()
+        return cls._instancia
+
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self.trava:
+            if chave not in self.histogramas:
+                self.histogramas[chave] = Histograma(limites=(1, 2, 5, 10, 20, 50, 100, 200) if nome.endswith("por_segundo") else LIMITES_PADRAO)
+            self.histogramas[chave].observar(valor)
+
+
+    def contar(self, nome: str, valor: float = 1, **rotulos):
+        chave = (nome, tuple(sorted(rotulos.items())))
+        with self.trava:
+            self.contadores[chave] = self.contadores.get(chave, 0) + valor
+
+
+    def resumo(self) -> dict:
+        with self.trava:
+            histogramas = {f"{nome}{_rotulos(rotulos)}": {"contagem": h.total, "media": h.soma / h.total if h.total else None, **{f"p{int(q * 100)}": v for q, v in h.percentis().items()}} for (nome, rotulos), h in self.histogramas.items()}
+            contadores = {f"{nome}{_rotulos(rotulos)}": valor for (nome, rotulos), valor in self.contadores.items()}
+
+            # Taxa de acerto de cada cache, a partir dos contadores de acerto/falha
+            consultas = {}
+            for (nome, rotulos), valor in self.contadores.items():
+                if nome == "vivi_cache_consultas_total":
+                    rotulos = dict(rotulos)
+                    consultas.setdefault(rotulos["cache"], {}).setdefault(rotulos["resultado"], valor)
+            taxas = {cache: c.get("acerto", 0) / (c.get("acerto", 0) + c.get("falha", 0)) for cache, c in consultas.items() if c.get("acerto", 0) + c.get("falha", 0)}
+
+        return {"histogramas": histogramas, "contadores": contadores, "taxas_de_acerto_cache": taxas}
+
+
+    def texto_prometheus(self) -> str:
+        linhas = []
+        with self.trava:
+            nomes_vistos = set()
+            for (nome, rotulos), h in sorted(self.histogramas.items()):
+                if nome not in nomes_vistos:
+                    linhas.append(f"# TYPE {nome} histogram")
+                    nomes_vistos.add(nome)
+                acumulado = 0
+                for limite, contagem in zip(list(h.limites) + ["+Inf"], h.contagens):
+                    acumulado += contagem
+                    linhas.append(f"{nome}_bucket{_rotulos(rotulos, {'le': limite})} {acumulado}")
+                linhas.append(f"{nome}_sum{_rotulos(rotulos)} {h.soma}")
+                linhas.append(f"{nome}_count{_rotulos(rotulos)} {h.total}")
+
+            # Percentis da janela recente como gauges à parte, já que um histograma não os carrega
+            for (nome, rotulos), h in sorted(self.histogramas.items()):
+                for quantil, valor in h.percentis().items():
+                    if valor is not None:
+                        if f"{nome}_quantil" not in nomes_vistos:
+                            linhas.append(f"# TYPE {nome}_quantil gauge")
+                            nomes_vistos.add(f"{nome}_quantil")
+                        linhas.append(f"{nome}_quantil{_rotulos(rotulos, {'quantile': quantil})} {valor}")
+
+            for (nome, rotulos), valor in sorted(self.contadores.items()):
+                if nome not in nomes_vistos:
+                    linhas.append(f"# TYPE {nome} counter")
+                    nomes_vistos.add(nome)
+                linhas.append(f"{nome}{_rotulos(rotulos)} {valor}")
+        return "\n".join(linhas) + "\n"
+
+
+    def servir_http(self, porta: int, host: str = "127.0.0.1"):
+        # /metrics no formato do Prometheus e /resumo em JSON; um servidor por processo
+        if self.servidor_http is not None:
+            return self.servidor_http
+        coletor = self
+
+        class Manipulador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith("/metrics"):
+                    corpo, tipo = coletor.texto_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+                elif self.path.startswith("/resumo"):
+                    corpo, tipo = json.dumps(coletor.resumo(), ensure_ascii=False).encode("utf-8"), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", tipo)
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, formato, *args):
+                pass
+
+        self.servidor_http = ThreadingHTTPServer((host, porta), Manipulador)
+        Thread(target=self.servidor_http.serve_forever, name="metricas-http", daemon=True).start()
+        print(f"Métricas disponíveis em http://{host}:{porta}/metrics")
+        return self.servidor_http
+
+
+    def iniciar_dump_periodico(self, caminho: str, intervalo_segundos: float = 60.0):
+        if self.thread_dump is not None:
+            return
+
+        def laco():
+            while True:
+                time.sleep(intervalo_segundos)
+                self.salvar(caminho)
+
+        self.thread_dump = Thread(target=laco, name="metricas-dump", daemon=True)
+        self.thread_dump.start()
+
+
+    def salvar(self, caminho: str):
+        temporario = caminho + ".tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            f.write(self.texto_prometheus())
+        os.replace(temporario, caminho)
+
+
+class Rastro:
+    # Spans de uma requisição: cada etapa guarda início relativo e duração e alimenta o histograma
+    # vivi_etapa_segundos{etapa=...}. No encerramento, o total vai para vivi_requisicao_segundos{caminho=...}.
+    def __init__(self, coletor: ColetorDeMetricas):
+        self.coletor = coletor
+        self.inicio = time.perf_counter()
+        self.etapas = []
+
+
+    @contextmanager
+    def etapa(self, nome: str):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.registrar(nome, inicio, time.perf_counter())
+
+
+    def registrar(self, nome: str, inicio: float, fim: float):
+        self.etapas.append({"etapa": nome, "inicio_ms": round((inicio - self.inicio) * 1000, 3), "duracao_ms": round((fim - inicio) * 1000, 3)})
+        self.coletor.observar("vivi_etapa_segundos", fim - inicio, etapa=nome)
+
+
+    def encerrar(self, caminho: str) -> dict:
+        total = time.perf_counter() - self.inicio
+        self.coletor.observar("vivi_requisicao_segundos", total, caminho=caminho)
+        self.coletor.contar("vivi_requisicoes_total", caminho=caminho)
+        return {"caminho": caminho, "total_ms": round(total * 1000, 3), "etapas": self.etapas}
+
+
+class RastroNulo:
+    # Para chamadas fora de uma requisição (ex.: recuperar_documentos direto)
+    def etapa(self, nome: str):
+        return nullcontext()
+
+
+    def registrar(self, nome: str, inicio: float, fim: float):
+        pass
+
+
+RASTRO_NULO = RastroNulo()
+
+
+class MedidorDeGeracao:
+    # Streamer que marca o início do generate (chegada do prompt), o primeiro token e o fim, e conta
+    # os tokens; repassa tudo a um streamer interno, se houver. Separa prefill de decodificação,
+    # e a espera entre a criação do medidor e o início do generate (fila do servidor, montagem das entradas).
+    def __init__(self, interno=None):
+        self.interno = interno
+        self.criado_em = time.perf_counter()
+        self.inicio = None
+        self.primeiro_token_em = None
+        self.fim = None
+        self.tokens = 0
+
+
+    def iniciar(self):
+        self.inicio = time.perf_counter()
+
+
+    def registrar_tokens(self, quantidade: int):
+        if self.primeiro_token_em is None:
+            self.primeiro_token_em = time.perf_counter()
+        self.tokens += quantidade
+
+
+    def encerrar(self):
+        self.fim = time.perf_counter()
+
+
+    def put(self, valor):
+        if self.inicio is None:
+            self.iniciar()
+        else:
+            self.registrar_tokens(valor.numel())
+        if self.interno is not None:
+            self.interno.put(valor)
+
+
+    def end(self):
+        self.encerrar()
+        if self.interno is not None:
+            self.interno.end()
+
+
+    def registrar_em(self, rastro: Rastro, coletor: ColetorDeMetricas):
+        if self.inicio is None or self.fim is None:
+            return
+        primeiro = self.primeiro_token_em or self.fim
+        rastro.registrar("espera", self.criado_em, self.inicio)
+        rastro.registrar("prefill", self.inicio, primeiro)
+        rastro.registrar("decodificacao", primeiro, self.fim)
+        coletor.contar("vivi_tokens_gerados_total", self.tokens)
+        if self.fim > primeiro and self.tokens > 1:
+            coletor.observar("vivi_tokens_por_segundo", (self.tokens - 1) / (self.fim - primeiro))
@@ -1,135 +1,299 @@
-import hashlib
-import json
+import functools
 import os
 import re
 import time
-from difflib import SequenceMatcher
+from threading import Lock, Thread
+
+import numpy as np
+
+from avaliador_de_respostas import AvaliadorEmSegundoPlano, ReferenciasDeAvaliacao, configurar_opik
+from backends_de_geracao import suporta_cache_de_prefixo
+from cache_de_prefixo import CacheDePrefixo
+from cache_de_embeddings import CacheDeEmbeddings
+from cache_de_respostas import CacheDeRespostas
+from cache_semantico import CacheSemantico
+from decodificacao_assistida import DecodificacaoAssistida
+from empacotador_de_contexto import EmpacotadorDeContexto
+from indice_lexical import fusao_rrf
+from metricas_de_latencia import RASTRO_NULO, ColetorDeMetricas, MedidorDeGeracao, Rastro
+from perfis_de_decodificacao import ParadaPorCaracteres, ParadaPorTokens, argumentos_generate, obter_perfil
+from roteador_de_intencoes import RoteadorDeIntencoes
+from registro_de_eventos import RegistradorDeEventos
+from carregador_de_recursos import RegistroDeRecursos, carregar_indice_de_centros, carregar_indice_faiss, carregar_indice_lexical, carregar_metadados_indice, carregar_pacote_de_indice, carregar_modelo_de_embedding, carregar_modelo_de_linguagem, carregar_reordenador, carregar_tokenizer, conectar_redis
+
+PADRAO_PRESERVAR = re.compile(
+    "|".join([
+        r"Centro de Referência LGBTI\+.*",
+        r"Zona (Oeste|Leste|Sul|Norte|Centro)",
+        r"(Rua|Avenida|Av\.|Travessa|Alameda|Praça|Estrada)\s+.*[0-9]+.*",
+        r"Segunda a sexta-feira.*",
+        r"\(?\d{2}\)?\s?\d{4,5}-?\d{4}",
+        r"E-?mail:?\s?[^\s]+@[^\s]+",
+    ]),
+    re.IGNORECASE
+)
+PADRAO_NOMES_CENTROS = re.compile(r"laura vermont|claudia wonder|luana barbosa|edson neris|brunna valin")
+PADRAO_TELEFONE = re.compile(r"\(?\d{2}\)? ?\d{4,5}-\d{4}")
+PADRAO_EMAIL = re.compile(r"[\w\.-]+@[\w\.-]+")
+PADRAO_ENDERECO = re.compile(r"\n([^\n]*\d+[^\n]*)\n")
+PADRAO_HORARIO = re.compile(r"segunda.*\d+h.*\d+h")
+
+INSTRUCOES_PROMPT = (
+    "A seguir está uma pergunta respondida por Vivi, uma assistente virtual brasileira, empática, amigável e respeitosa.\n"
+    "Ela responde com base no contexto fornecido, sem inventar informações e sem repetir trechos do contexto.\n"
+    "Caso a informação não esteja presente, ela explica educadamente que não foi possível encontrar a resposta.\n\n"
+    "A resposta deve ter no máximo 500 caracteres. Se for necessário ultrapassar esse limite, Vivi deve perguntar ao usuário se deseja mais detalhes antes de continuar.\n"
+)
+
+
+def rastrear_com_opik(funcao):
+    funcao_rastreada = None
+
+    @functools.wraps(funcao)
+    def envolucro(*args, **kwargs):
+        nonlocal funcao_rastreada
+        if funcao_rastreada is None:
+            configurar_opik()
+            import opik
+            funcao_rastreada = opik.track(funcao)
+        return funcao_rastreada(*args, **kwargs)
+
+    return envolucro
 
-import faiss
-import redis
-import torch
 
-from sentence_transformers import SentenceTransformer
-from transformers import AutoTokenizer, AutoModelForCausalLM, AutoProcessor, AutoModelForImageTextToText
+class RAGPipeline:
+    
+    def __init__(self, nome_modelo: str, nome_modelo_ollama_avaliador: str, caminho_faiss: str, caminho_id_texto: str, modelo_embedding: str = "sentence-transformers/all-MiniLM-L6-v2", redis_host='localhost', redis_port=6379, redis_db=0, arquivo_log="log.jsonl", arquivo_avaliacoes="avaliacoes_ollama.jsonl", caminho_referencias_avaliacao: str = "referencias_avaliacao.json", taxa_amostragem_avaliacao: float = 0.1, limiar_cache_semantico: float = 0.92, capacidade_cache_semantico: int = 1000, tempo_expiracao_cache_semantico: int = 3600, caminho_bm25: str = "indice_bm25.json", peso_vetorial: float = 1.0, peso_lexical: float = 1.0, caminho_centros: str = os.path.join("dados_limpos_e_pre_processados", "centros_LGBTI_limpo_e_pre_processado.json"), caminho_intencoes: str = "intencoes.json", caminho_metadados_indice: str = "indice_metadados.json", caminho_pacote: str = "indice_vivi.pacote", reordenacao: str = None, modelo_reordenador: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", candidatos_reordenacao: int = 20, orcamento_reordenacao_segundos: float = 0.2, orcamento_tokens_contexto: int = 1024, orcamento_tokens_pergunta: int = 256, reusar_prefixo: bool = True, backend: str = "hf", caminho_gguf: str = None, threads_geracao: int = None, modelo_rascunho: str = None, persistir_embeddings_no_redis: bool = True, porta_metricas: int = None, arquivo_metricas: str = None, intervalo_metricas_segundos: float = 60.0, registro: RegistroDeRecursos = None):
+        self.nome_modelo = nome_modelo
+        self.nome_modelo_ollama_avaliador = nome_modelo_ollama_avaliador
+        self.backend = backend
+
+        # Os recursos pesados vêm do registro do processo: são carregados em paralelo, em segundo
+        # plano, e compartilhados entre pipelines. Cada atributo bloqueia só quando é usado.
+        self.registro = registro or RegistroDeRecursos.instancia()
+        self.recursos = {
+            "tokenizer": self.registro.registrar(f"tokenizer:{nome_modelo}", functools.partial(carregar_tokenizer, nome_modelo)),
+            "modelo": self.registro.registrar(f"modelo:{nome_modelo}:{backend}", functools.partial(carregar_modelo_de_linguagem, nome_modelo, backend, caminho_gguf, threads_geracao)),
+            "embedding_model": self.registro.registrar(f"embedding:{modelo_embedding}", functools.partial(carregar_modelo_de_embedding, modelo_embedding)),
+            "indice": self.registro.registrar(f"faiss:{caminho_faiss}", functools.partial(carregar_indice_faiss, caminho_faiss, caminho_metadados_indice)),
+            "metadados_indice": self.registro.registrar(f"metadados:{caminho_metadados_indice}", functools.partial(carregar_metadados_indice, caminho_metadados_indice)),
+            "indice_lexical": self.registro.registrar(f"bm25:{caminho_bm25}", functools.partial(carregar_indice_lexical, caminho_bm25)),
+            "indice_de_centros": self.registro.registrar(f"centros:{caminho_centros}", functools.partial(carregar_indice_de_centros, caminho_centros)),
+            "textos_indice": self.registro.registrar(f"pacote:{caminho_pacote}", functools.partial(carregar_pacote_de_indice, caminho_pacote, caminho_id_texto, caminho_faiss)),
+            "redis": self.registro.registrar(f"redis:{redis_host}:{redis_port}/{redis_db}", functools.partial(conectar_redis, redis_host, redis_port, redis_db))
+        }
+        # Reordenação opcional dos candidatos ("lexical" ou "cross-encoder") antes de montar o contexto
+        if reordenacao is not None:
+            self.recursos["reordenador"] = self.registro.registrar(f"reordenador:{reordenacao}:{modelo_reordenador}", functools.partial(carregar_reordenador, reordenacao, modelo_reordenador, self.contar_tokens, candidatos_reordenacao, orcamento_reordenacao_segundos, orcamento_tokens_contexto))
+
+        self.peso_vetorial = peso_vetorial
+        self.peso_lexical = peso_lexical
+
+        self.roteador = RoteadorDeIntencoes.carregar(caminho_intencoes, {
+            "resposta_fixa": self.responder_intencao_fixa,
+            "contato_centro": self.responder_contato_centro
+        })
+
+        # Tokenizers "fast" não podem ser usados por várias threads ao mesmo tempo
+        self.trava_tokenizer = Lock()
+        self.empacotador = EmpacotadorDeContexto(lambda: self.tokenizer, self.trava_tokenizer, INSTRUCOES_PROMPT, orcamento_tokens_contexto, orcamento_tokens_pergunta, self.deve_preservar)
+
+        # KV-cache do bloco fixo de instruções, calculado em segundo plano assim que o modelo carrega
+        if reusar_prefixo and suporta_cache_de_prefixo(backend):
+            self.recursos["cache_de_prefixo"] = self.registro.registrar(f"prefixo:{nome_modelo}:{backend}", self.calcular_cache_de_prefixo)
+
+        # Geração assistida opcional por um modelo de rascunho pequeno (só nos backends do transformers)
+        if modelo_rascunho is not None:
+            if backend.startswith("hf"):
+                self.recursos["decodificacao_assistida"] = self.registro.registrar(f"rascunho:{modelo_rascunho}:{nome_modelo}:{backend}", functools.partial(self.criar_decodificacao_assistida, modelo_rascunho))
+            else:
+                print(f"Modelo de rascunho ignorado: o backend '{backend}' não suporta geração assistida.")
+        # Cache de respostas exatas: LRU local na frente do Redis, que continua respondendo com o Redis fora do ar
+        self.cache_de_respostas = CacheDeRespostas(lambda: self.redis)
+
+        # Embeddings das perguntas ficam em cache sem normalização; a normalização do índice é aplicada na saída
+        self.cache_de_embeddings = CacheDeEmbeddings(
+            lambda textos: self.embedding_model.encode(textos, batch_size=len(textos), convert_to_numpy=True, show_progress_bar=False),
+            modelo_embedding,
+            obter_redis=self.cache_de_respostas.cliente_disponivel if persistir_embeddings_no_redis else None
+        )
+        self.cache_semantico = CacheSemantico(limiar_cache_semantico, capacidade_cache_semantico, tempo_expiracao_cache_semantico)
 
-import opik
-from opik.evaluation.metrics import Equals, Contains, RegexMatch, LevenshteinRatio
+        self.arquivo_log = arquivo_log
+        self.arquivo_avaliacoes = arquivo_avaliacoes
+        self.registrador = RegistradorDeEventos.para_arquivo(arquivo_log)
+        # Só uma amostra das respostas é avaliada, numa thread própria e fora da espera do usuário
+        self.avaliador = AvaliadorEmSegundoPlano(ReferenciasDeAvaliacao.carregar(caminho_referencias_avaliacao), arquivo_avaliacoes, taxa_amostragem_avaliacao)
 
-opik.configure(workspace="chatbot_vivi", use_local=True, automatic_approvals=True)
+        # Latência por etapa, agregada no processo e exposta por HTTP ou em arquivo, sem depender do opik
+        self.metricas = ColetorDeMetricas.instancia()
+        if porta_metricas is not None:
+            self.metricas.servir_http(porta_metricas)
+        if arquivo_metricas is not None:
+            self.metricas.iniciar_dump_periodico(arquivo_metricas, intervalo_metricas_segundos)
 
-metrica_e_igual_a = Equals()
-metrica_contem = Contains(case_sensitive=False)
-metrica_regex = RegexMatch(regex=r"Centro\s+de\s+Refer[eê]ncia\s+LGBTI\+?\s+Laura\s+Vermont")
-metrica_levenshtein = LevenshteinRatio()
+        self.aquecer()
 
-class RAGPipeline:
-    
-    def __init__(self, nome_modelo: str, nome_modelo_ollama_avaliador: str, caminho_faiss: str, caminho_id_texto: str, modelo_embedding: str = "sentence-transformers/all-MiniLM-L6-v2", redis_host='localhost', redis_port=6379, redis_db=0, arquivo_log="log.json"):
-        print("\nEtapa 1: Carregando tokenizer...\n")
-        self.nome_modelo = nome_modelo
 
+    def aquecer(self):
+        self.registro.aquecer(*self.recursos.values())
 
-        print("\nEtapa 2: Detectando dispositivo...\n")
-        self.nome_modelo_ollama_avaliador = nome_modelo_ollama_avaliador
-        
 
-        self.tokenizer = AutoTokenizer.from_pretrained(nome_modelo)
+    def pronto(self) -> bool:
+        return self.registro.pronto(*self.recursos.values())
 
 
-        print("\nEtapa 3: Carregando modelo principal...\n")
-        self.dispositivo = "cuda" if torch.cuda.is_available() else "cpu"
-        
-        
-        self.modelo = AutoModelForCausalLM.from_pretrained(
-            nome_modelo,
-            device_map="auto" if self.dispositivo == "cuda" else None,
-            torch_dtype=torch.float16 if self.dispositivo == "cuda" else torch.float32
-        )
-        
-        
-        self.modelo.to(self.dispositivo)
+    def estado_recursos(self) -> dict:
+        estados = self.registro.estado(*self.recursos.values())
+        return {atributo: estados[nome] for atributo, nome in self.recursos.items()}
 
-        
-        print("\nEtapa 4: Carregando modelo de embedding...\n")
-        self.embedding_model = SentenceTransformer(modelo_embedding)
 
-        
-        print("\nEtapa 5: Carregando índice FAISS...\n")
-        self.indice = faiss.read_index(caminho_faiss)
+    @property
+    def tokenizer(self):
+        return self.registro.obter(self.recursos["tokenizer"])
 
-        
-        print("\nEtapa 6: Lendo id_para_texto...\n")
-        with open(caminho_id_texto, "r", encoding="utf-8") as f:
-            self.id_para_texto = json.load(f)
+    @property
+    def modelo(self):
+        return self.registro.obter(self.recursos["modelo"])
 
+    @property
+    def dispositivo(self):
+        return self.modelo.device
 
-        print("\nEtapa 7: Conectando ao Redis...\n")
-        self.redis = redis.Redis(host=redis_host, port=redis_port, db=redis_db)
+    @property
+    def embedding_model(self):
+        return self.registro.obter(self.recursos["embedding_model"])
 
+    @property
+    def indice(self):
+        return self.registro.obter(self.recursos["indice"])
 
-        print("\nEtapa 8: Verificando arquivo de log...\n")
-        self.arquivo_log = arquivo_log
+    @property
+    def metadados_indice(self):
+        return self.registro.obter(self.recursos["metadados_indice"])
 
-        try:
-            with open(self.arquivo_log, "r", encoding="utf-8") as f:
-                pass
-        except FileNotFoundError:
-            with open(self.arquivo_log, "w", encoding="utf-8") as f:
-                json.dump([], f)
+    @property
+    def indice_lexical(self):
+        return self.registro.obter(self.recursos["indice_lexical"])
+
+    @property
+    def indice_de_centros(self):
+        return self.registro.obter(self.recursos["indice_de_centros"])
+
+    @property
+    def textos_indice(self):
+        return self.registro.obter(self.recursos["textos_indice"])
+
+    @property
+    def redis(self):
+        return self.registro.obter(self.recursos["redis"])
+
+    @property
+    def id_padding(self):
+        return self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
 
-        print("*" * 150)
-        print("\n\nRAGPipeline inicializado com sucesso.\n\n")
-        print("*" * 150)
+    @property
+    def cache_de_prefixo(self):
+        return self.registro.obter(self.recursos["cache_de_prefixo"]) if "cache_de_prefixo" in self.recursos else None
+
+    @property
+    def decodificacao_assistida(self):
+        return self.registro.obter(self.recursos["decodificacao_assistida"]) if "decodificacao_assistida" in self.recursos else None
+
+    @property
+    def reordenador(self):
+        return self.registro.obter(self.recursos["reordenador"]) if "reordenador" in self.recursos else None
 
 
     def registrar_log(self, evento: dict):
         try:
-            with open(self.arquivo_log, "r+", encoding="utf-8") as f:
-                dados = json.load(f)
-                dados.append(evento)
-                f.seek(0)
-                json.dump(dados, f, ensure_ascii=False, indent=2)
-                f.truncate()
+            self.registrador.registrar(evento)
         except Exception as e:
             pass
 
 
+    def contar_cache(self, cache: str, acerto: bool):
+        self.metricas.contar("vivi_cache_consultas_total", cache=cache, resultado="acerto" if acerto else "falha")
+
+
+    def encerrar_rastro(self, preparo: dict, caminho: str):
+        # Um evento por pergunta, em qualquer caminho, com a duração de cada etapa
+        spans = preparo["rastro"].encerrar(caminho)
+        self.registrar_log({"evento": "latencia_por_etapa", "pergunta": preparo["pergunta"], **spans, "timestamp": time.time()})
+
+
+    def responder_sem_geracao(self, preparo: dict, resposta: str, caminho: str) -> dict:
+        preparo["resposta"] = resposta
+        self.encerrar_rastro(preparo, caminho)
+        return preparo
+
+
     def cache_obter(self, pergunta: str):
-        chave = f"resposta:{hashlib.md5(pergunta.encode()).hexdigest()}"
-        resposta = self.redis.get(chave)
-        return resposta.decode("utf-8") if resposta else None
+        encontrada = self.cache_de_respostas.obter(pergunta)
+        return encontrada[0] if encontrada else None
+
+
+    def cache_salvar(self, pergunta: str, resposta: str, tempo_expiracao: int = 3600, metadados: dict = None):
+        self.cache_de_respostas.salvar(pergunta, resposta, metadados, tempo_expiracao)
+
+
+    def codificar_pergunta(self, pergunta: str):
+        # A consulta segue a mesma normalização usada na criação do índice
+        vetor = self.cache_de_embeddings.codificar(pergunta)
+        if self.metadados_indice.get("normalizado", False):
+            vetor = vetor / max(float(np.linalg.norm(vetor)), 1e-12)
+        return vetor.reshape(1, -1).astype(np.float32)
+
+
+    def contar_tokens(self, id_doc: int, texto: str) -> int:
+        return self.empacotador.contar_tokens(id_doc, texto)
+
+
+    def recuperar_documentos(self, pergunta: str, top_k: int = 3, embedding=None):
+        return [texto for _, texto in self.recuperar_trechos(pergunta, top_k, embedding)]
 
 
-    def cache_salvar(self, pergunta: str, resposta: str, tempo_expiracao: int = 3600):
-        chave = f"resposta:{hashlib.md5(pergunta.encode()).hexdigest()}"
-        self.redis.setex(chave, tempo_expiracao, resposta)
+    def recuperar_trechos(self, pergunta: str, top_k: int = 3, embedding=None, rastro=None):
+        rastro = rastro or RASTRO_NULO
+        if embedding is None:
+            with rastro.etapa("embedding"):
+                embedding = self.codificar_pergunta(pergunta)
 
+        indice_lexical = self.indice_lexical
+        reordenador = self.reordenador
+        # Com o índice BM25 disponível, busca mais candidatos em cada lista e combina por RRF
+        numero_candidatos = top_k * 5 if indice_lexical is not None else top_k
+        # Com reordenação, a recuperação entrega um conjunto mais largo e o reordenador escolhe os top_k
+        limite = max(top_k, reordenador.max_candidatos) if reordenador is not None else top_k
+        numero_candidatos = max(numero_candidatos, limite)
 
-    def recuperar_documentos(self, pergunta: str, top_k: int = 3):
-        embedding = self.embedding_model.encode([pergunta])
-        _, indices = self.indice.search(embedding, top_k)
-        trechos_recuperados = []
-        for i in indices[0]:
-            texto = self.id_para_texto.get(str(i), "")
+        with rastro.etapa("busca_vetorial"):
+            _, indices = self.indice.search(embedding, numero_candidatos)
+            ids_recuperados = [int(i) for i in indices[0] if i != -1]
+
+        if indice_lexical is not None:
+            with rastro.etapa("busca_lexical"):
+                ids_lexicais = [id_doc for id_doc, _ in indice_lexical.buscar(pergunta, numero_candidatos)]
+                fundidos = fusao_rrf([ids_recuperados, ids_lexicais], [self.peso_vetorial, self.peso_lexical])
+                ids_recuperados = [id_doc for id_doc, _ in fundidos]
+
+        textos_indice = self.textos_indice
+        candidatos = []
+        for i in ids_recuperados[:limite]:
+            texto = textos_indice.texto(i)
             if texto:
-                trechos_recuperados.append(texto)
-        return trechos_recuperados
+                candidatos.append((i, texto))
+
+        if reordenador is not None:
+            with rastro.etapa("reordenacao"):
+                candidatos, estatisticas = reordenador.reordenar(pergunta, candidatos, top_k)
+            self.registrar_log({"evento": "documentos_reordenados", "pergunta": pergunta, **estatisticas, "timestamp": time.time()})
+
+        return candidatos[:top_k]
 
 
     def deve_preservar(self, trecho):
-        padroes_preservar = [
-                            r"Centro de Referência LGBTI\+.*",
-                            r"Zona (Oeste|Leste|Sul|Norte|Centro)",
-                            r"(Rua|Avenida|Av\.|Travessa|Alameda|Praça|Estrada)\s+.*[0-9]+.*",
-                            r"Segunda a sexta-feira.*",
-                            r"\(?\d{2}\)?\s?\d{4,5}-?\d{4}",
-                            r"E-?mail:?\s?[^\s]+@[^\s]+",
-                            ]
-        
-        for padrao in padroes_preservar:
-            if re.search(padrao, trecho, re.IGNORECASE):
-                return True
-        return False
+        return PADRAO_PRESERVAR.search(trecho) is not None
 
 
     def extrair_dado_documento(self, pergunta, documentos):
@@ -137,190 +301,320 @@ class RAGPipeline:
         nome_centro_alvo = None
 
         # Busca por nome do centro
-        for doc in documentos:
-            if "laura vermont" in pergunta_lower and "laura vermont" in doc.lower():
-                nome_centro_alvo = doc
-                break
-            elif "claudia wonder" in pergunta_lower and "claudia wonder" in doc.lower():
-                nome_centro_alvo = doc
-                break
-            elif "luana barbosa" in pergunta_lower and "luana barbosa" in doc.lower():
-                nome_centro_alvo = doc
-                break
-            elif "edson neris" in pergunta_lower and "edson neris" in doc.lower():
-                nome_centro_alvo = doc
-                break
-            elif "brunna valin" in pergunta_lower and "brunna valin" in doc.lower():
-                nome_centro_alvo = doc
-                break
-
+        nome_pedido = PADRAO_NOMES_CENTROS.search(pergunta_lower)
+        if nome_pedido:
+            for doc in documentos:
+                if nome_pedido.group() in doc.lower():
+                    nome_centro_alvo = doc
+                    break
+
+        # Sem centro identificado a pergunta não é sobre um centro: segue para a geração normal
         if not nome_centro_alvo:
-            return "Desculpe, não encontrei esse centro."
+            return None
 
         # Extrair campos com base na intenção da pergunta
         if "telefone" in pergunta_lower:
-            telefones = re.findall(r"\(?\d{2}\)? ?\d{4,5}-\d{4}", nome_centro_alvo)
+            telefones = PADRAO_TELEFONE.findall(nome_centro_alvo)
             return f"Telefone: {', '.join(telefones)}" if telefones else "Telefone não encontrado."
 
         elif "e-mail" in pergunta_lower or "email" in pergunta_lower:
-            email = re.search(r"[\w\.-]+@[\w\.-]+", nome_centro_alvo)
+            email = PADRAO_EMAIL.search(nome_centro_alvo)
             return f"E-mail: {email.group()}" if email else "E-mail não encontrado."
 
         elif "endereço" in pergunta_lower or "endereco" in pergunta_lower:
-            endereco_match = re.search(r"\n([^\n]*\d+[^\n]*)\n", nome_centro_alvo)
+            endereco_match = PADRAO_ENDERECO.search(nome_centro_alvo)
             return f"Endereço: {endereco_match.group(1)}" if endereco_match else "Endereço não encontrado."
 
         elif "horário" in pergunta_lower or "funcionamento" in pergunta_lower:
-            horario_match = re.search(r"segunda.*\d+h.*\d+h", nome_centro_alvo.lower())
+            horario_match = PADRAO_HORARIO.search(nome_centro_alvo.lower())
             return f"Horário: {horario_match.group().capitalize()}" if horario_match else "Horário não encontrado."
 
         else:
             return "Que informação você gostaria de saber: telefone, e-mail, endereço ou horário?"
 
 
-    def salvar_avaliacao_em_json(self, pergunta: str, resposta: str, contexto: str, avaliacao: dict, caminho_json: str = "log_avaliacoes.json"):
+    def responder_intencao_fixa(self, pergunta: str, intencao: dict):
+        self.registrar_log({"evento": intencao["evento_log"], "pergunta": pergunta, "resposta": intencao["resposta"], "timestamp": time.time()})
+        return intencao["resposta"]
 
-        nova_avaliacao = {
-            "pergunta": pergunta,
-            "resposta": resposta,
-            "contexto": contexto,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-        }
 
-        try:
-            with open(caminho_json, "r", encoding="utf-8") as f:
-                avaliacoes_existentes = json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            avaliacoes_existentes = []
+    def responder_contato_centro(self, pergunta: str, intencao: dict):
+        # Perguntas de contato sobre um centro conhecido são respondidas direto do índice estruturado;
+        # sem centro identificado, devolve None e a pergunta segue para a recuperação
+        resposta_centro = self.indice_de_centros.responder(pergunta)
+        if resposta_centro is None:
+            return None
+        self.registrar_log({"evento": intencao["evento_log"], "pergunta": pergunta, "centro": resposta_centro["centro"], "campos": resposta_centro["campos"], "resposta": resposta_centro["resposta"], "timestamp": time.time()})
+        return resposta_centro["resposta"]
 
-        avaliacoes_existentes.append(nova_avaliacao)
 
-        with open(caminho_json, "w", encoding="utf-8") as f:
-            json.dump(avaliacoes_existentes, f, indent=2, ensure_ascii=False)
+    def preparar_geracao(self, pergunta: str, top_k: int = 3):
+        preparo = {"pergunta": pergunta, "inicio": time.time(), "resposta": None, "ids_prompt": None, "contexto": None, "linhas_removiveis": [], "embedding": None, "perfil": None, "intencao": None, "rastro": Rastro(self.metricas), "medidor": None}
+        rastro = preparo["rastro"]
 
+        self.registrar_log({"evento": "pergunta_recebida", "pergunta": pergunta, "timestamp": preparo["inicio"]})
 
-    @opik.track
-    def gerar_resposta(self, pergunta: str, top_k: int = 3, max_tokens: int = 500):
+        with rastro.etapa("roteamento"):
+            intencao, manipulador = self.roteador.rotear(pergunta)
+            pergunta_de_contato = intencao is not None and intencao["nome"] == "contato"
+            preparo["intencao"] = intencao["nome"] if intencao is not None else None
+            resposta_intencao = manipulador(pergunta, intencao) if manipulador is not None else None
 
-        inicio_tempo = time.time()
+        if resposta_intencao is not None:
+            return self.responder_sem_geracao(preparo, resposta_intencao, "intencao")
 
-        self.registrar_log({"evento": "pergunta_recebida", "pergunta": pergunta, "timestamp": inicio_tempo})
+        with rastro.etapa("cache_exato"):
+            resposta_cache = self.cache_obter(pergunta)
+        self.contar_cache("exato", bool(resposta_cache))
 
-        pergunta_lower = pergunta.lower().strip()
-        
-        if any(p in pergunta_lower for p in ["o que você é", "quem é você", "o que você faz", "quem está falando", "qual é a sua função",  "qual o seu nome", "o que você faz", "qual é a sua função"]):
-            resposta_identidade = (
-                "Eu sou a Vivi, sua assistente virtual!\n"
-                "Fui criada para oferecer apoio, acolhimento e informações úteis, especialmente para quem passou por situações difíceis. "
-                "Estou aqui para ouvir, orientar com empatia e te ajudar a encontrar o que precisa. Você não está só. 🌟"
-            )
-            self.cache_salvar(pergunta, resposta_identidade)
-            self.registrar_log({"evento": "resposta_identidade", "pergunta": pergunta, "resposta": resposta_identidade, "timestamp": time.time()})
-            return resposta_identidade
+        if resposta_cache:
+            self.registrar_log({"evento": "resposta_cache_encontrada", "pergunta": pergunta, "resposta_cache": resposta_cache, "estatisticas_cache": self.cache_de_respostas.estatisticas(), "timestamp": time.time()})
+            return self.responder_sem_geracao(preparo, f"{resposta_cache}", "cache_exato")
 
+        with rastro.etapa("embedding"):
+            embedding = self.codificar_pergunta(pergunta)
 
-        if any(p in pergunta_lower for p in ["qual a origem do seu nome", "qual o significado do seu nome", "qual é o significado do seu nome", "qual o motivo do seu nome", "seu nome é uma homenagem a alguém"]):
-            resposta_identidade_significado_nome = (
-               "Meu nome tem origem no Latim e significa 'cheio de vida', 'vivo' e 'vida'. Além de ser um nome brasileiro, ele é uma homenagem às pessoas que sobreviveram a situações de violência — um lembrete de que ainda há força, esperança e luz dentro de cada uma delas."
-            )
-            self.cache_salvar(pergunta, resposta_identidade_significado_nome)
-            self.registrar_log({"evento": "resposta_significado_nome", "pergunta": pergunta, "resposta": resposta_identidade_significado_nome, "timestamp": time.time()})
-            return resposta_identidade_significado_nome
-        
+        # Perguntas de contato ficam fora do cache semântico: "telefone do centro X" e do "centro Y" são quase idênticas no embedding
+        if not pergunta_de_contato:
+            with rastro.etapa("cache_semantico"):
+                resposta_semantica = self.cache_semantico.buscar(embedding[0])
+            self.contar_cache("semantico", bool(resposta_semantica))
+            if resposta_semantica:
+                self.registrar_log({"evento": "resposta_cache_semantico_encontrada", "pergunta": pergunta, "pergunta_original": resposta_semantica["pergunta"], "similaridade": resposta_semantica["similaridade"], "resposta_cache": resposta_semantica["resposta"], "estatisticas_cache_semantico": self.cache_semantico.estatisticas(), "timestamp": time.time()})
+                return self.responder_sem_geracao(preparo, resposta_semantica["resposta"], "cache_semantico")
 
-        if any(p in pergunta_lower for p in ["qual é a fonte", "quais são as fontes", "de onde vem", "onde encontrou", "de onde tirou isso", "você pode citar as fontes", "origem da informação", "qual a origem da informação"]):
-            resposta_fontes =(
-            "As informações aqui apresentadas têm como base conteúdos produzidos por centros de referência LGBTI+ e pela ANTRA (Associação Nacional de Travestis e Transexuais), especialmente as cartilhas elaboradas por Bruna G. Benevides (@brunabenevidex), 2ª Sargenta da Marinha do Brasil, com foco em orientações à população LGBTI no combate à LGBTIfobia e sobre violência doméstica. "
-            "O material contou com revisão técnica de Paulo Iotti (@pauloiotti), advogado, e Anderson Cavichioli (@renosplgbti), presidente da RENOSP-LGBTI e delegado de Polícia Civil; "
-            "revisão ortográfica de Isaac Porto (@iporto), consultor LGBTI para o Instituto sobre Raça, Igualdade e Direitos Humanos; "
-            "e projeto gráfico e diagramação de Raykka Rica (@distritodrag), integrante do coletivo Distrito Drag.")
+        preparo["embedding"] = embedding[0]
+        trechos = self.recuperar_trechos(pergunta, top_k, embedding, rastro)
+        documentos = [texto for _, texto in trechos]
 
-            self.cache_salvar(pergunta, resposta_fontes)
-            self.registrar_log({"evento": "qual_e_a_fonte", "pergunta": pergunta, "resposta": resposta_fontes, "timestamp": time.time()})
-            
-            return resposta_fontes
+        resposta_centro_contato = None
+        if pergunta_de_contato:
+            with rastro.etapa("pos_processamento"):
+                resposta_centro_contato = self.extrair_dado_documento(pergunta, documentos)
 
-        resposta_cache = self.cache_obter(pergunta)
+        if resposta_centro_contato is not None:
+            with rastro.etapa("registro"):
+                self.cache_salvar(pergunta, resposta_centro_contato)
+                self.registrar_log({"evento": "resposta_contato_documentos", "pergunta": pergunta, "resposta": resposta_centro_contato, "timestamp": time.time()})
 
-        if resposta_cache:
-            self.registrar_log({"evento": "resposta_cache_encontrada", "pergunta": pergunta, "resposta_cache": resposta_cache, "timestamp": time.time()})
-            return f"{resposta_cache}"
-        
-        documentos = self.recuperar_documentos(pergunta, top_k)
+            return self.responder_sem_geracao(preparo, resposta_centro_contato, "contato_documentos")
 
-        if any(p in pergunta_lower for p in ["contato", "email", "e-mail", "telefone", "horário de funcionamento"]):
-            resposta_centro_contato = self.extrair_dado_documento(pergunta, documentos)
+        self.registrar_log({"evento": "documentos_recuperados", "pergunta": pergunta, "documentos": documentos, "timestamp": time.time()})
 
-            self.cache_salvar(pergunta, resposta_centro_contato)
+        trechos_filtrados = [(id_doc, texto) for id_doc, texto in trechos if len(texto.split()) > 10]
 
-            self.registrar_log({"evento": "resposta_significado_nome", "pergunta": pergunta, "resposta": resposta_centro_contato, "timestamp": time.time()})
+        if not trechos_filtrados:
+            resposta = "Desculpe, não encontrei informações suficientes para responder sua pergunta. 😔"
+            self.registrar_log({"evento": "documentos_insuficientes", "pergunta": pergunta, "resposta": resposta, "timestamp": time.time()})
+            return self.responder_sem_geracao(preparo, resposta, "documentos_insuficientes")
 
-            return resposta_centro_contato
+        # O prompt já sai em ids de token, com o contexto cortado em fronteira de trecho ou frase
+        inicio_empacotamento = time.perf_counter()
+        with rastro.etapa("empacotamento"):
+            empacotado = self.empacotador.empacotar(pergunta, trechos_filtrados)
+        # A tokenização acontece dentro do empacotamento; o span dela é o tempo somado no tokenizer
+        rastro.registrar("tokenizacao", inicio_empacotamento, inicio_empacotamento + empacotado["segundos_tokenizacao"])
 
-        self.registrar_log({"evento": "documentos_recuperados", "pergunta": pergunta, "documentos": documentos, "timestamp": time.time()})
+        preparo["contexto"] = empacotado["contexto"]
+        preparo["linhas_removiveis"] = empacotado["linhas_removiveis"]
+        preparo["ids_prompt"] = empacotado["ids"]
+        return preparo
 
-        documentos_filtrados = [doc for doc in documentos if len(doc.split()) > 10]
 
-        if not documentos_filtrados:
-            resposta = "Desculpe, não encontrei informações suficientes para responder sua pergunta. 😔"
-            self.registrar_log({"evento": "documentos_insuficientes", "pergunta": pergunta, "resposta": resposta, "timestamp": time.time()})
-            return resposta
-        
-        contexto = "\n".join(documentos_filtrados)
-
-        tokens_contexto = self.tokenizer(contexto, return_tensors="pt", truncation=True, max_length=1024)["input_ids"][0]
-        contexto_limitado = self.tokenizer.decode(tokens_contexto, skip_special_tokens=True)
-
-        prompt = (
-            "A seguir está uma pergunta respondida por Vivi, uma assistente virtual brasileira, empática, amigável e respeitosa.\n"
-            "Ela responde com base no contexto fornecido, sem inventar informações e sem repetir trechos do contexto.\n"
-            "Caso a informação não esteja presente, ela explica educadamente que não foi possível encontrar a resposta.\n\n"
-            "A resposta deve ter no máximo 500 caracteres. Se for necessário ultrapassar esse limite, Vivi deve perguntar ao usuário se deseja mais detalhes antes de continuar.\n"
-            f"Contexto:\n{contexto_limitado}\n\n"
-            f"Pergunta:\n{pergunta}\n\n"
-            "Resposta:"
-        )
+    def finalizar_resposta(self, preparo: dict, resposta: str, streaming: bool = False):
+        contexto_limitado = preparo["contexto"]
+        rastro = preparo["rastro"]
 
-        entradas = self.tokenizer(prompt, return_tensors="pt", truncation=True, max_length=2048).to(self.dispositivo)
+        # Prefill (até o primeiro token) e decodificação, medidos pelo streamer da geração
+        if preparo["medidor"] is not None:
+            preparo["medidor"].registrar_em(rastro, self.metricas)
 
-        saida_ids = self.modelo.generate(
-            **entradas,
-            max_new_tokens=max_tokens,
-            pad_token_id=self.tokenizer.eos_token_id,
-            num_beams=3,
-            early_stopping=True,
-            do_sample=True,
-            top_p=0.9,
-            temperature=0.7,
-            repetition_penalty=2.0
-        )
+        with rastro.etapa("pos_processamento"):
+            # As linhas não preservadas do contexto já vêm calculadas (e em cache por trecho) do empacotador
+            for linha in preparo["linhas_removiveis"]:
+                if linha in resposta:
+                    resposta = resposta.replace(linha, "")
 
-        resposta_completa = self.tokenizer.decode(saida_ids[0], skip_special_tokens=True)
+            resposta_final = resposta.split("Contexto:")[0].strip()
 
-        resposta = resposta_completa.split("Resposta:")[-1].strip()
+        with rastro.etapa("registro"):
+            self.registrar_resposta(preparo, resposta_final, contexto_limitado, streaming)
 
-        for trecho in contexto_limitado.split("\n"):
-            trecho_limpo = trecho.strip()
-            if trecho_limpo and not self.deve_preservar(trecho_limpo):
-                if trecho_limpo in resposta:
-                    resposta = resposta.replace(trecho_limpo, "")
+        self.encerrar_rastro(preparo, "llm")
+        return resposta_final
 
-        resposta_final = resposta.split("Contexto:")[0].strip()
 
-        self.cache_salvar(pergunta, resposta_final)
+    def registrar_resposta(self, preparo: dict, resposta_final: str, contexto_limitado: str, streaming: bool):
+        pergunta = preparo["pergunta"]
 
-        referencia_de_resposta = "Centro de Referência LGBTI+ Laura Vermont"
-        referencia_de_resposta_02 = "O Centro de Referência LGBTI+ Laura Vermont está localizado na Avenida Nordestina, 496 – São Miguel Paulista."
-        
-        metrica_e_igual_a.score(output=resposta_final, reference=referencia_de_resposta_02)
-        metrica_contem.score(output=resposta_final, reference= referencia_de_resposta)
-        metrica_regex.score(output=resposta_final)
-        metrica_levenshtein.score(output=resposta_final, reference=referencia_de_resposta)
+        self.cache_salvar(pergunta, resposta_final, metadados={"perfil": preparo["perfil"], "backend": self.backend, "criado_em": time.time()})
+        if resposta_final and preparo["embedding"] is not None:
+            self.cache_semantico.salvar(preparo["embedding"], pergunta, resposta_final)
 
-        self.registrar_log({"evento": "resposta_gerada", "pergunta": pergunta, "resposta": resposta_final, "tempo_execucao_segundos": time.time() - inicio_tempo, "timestamp": time.time()})
+        self.registrar_log({"evento": "resposta_gerada", "pergunta": pergunta, "resposta": resposta_final, "streaming": streaming, "perfil_decodificacao": preparo["perfil"], "backend": self.backend, "tempo_execucao_segundos": time.time() - preparo["inicio"], "timestamp": time.time()})
 
-        caminho_json = "avaliacoes_ollama.json"
+        self.avaliador.enfileirar(pergunta, resposta_final, contexto_limitado, preparo["intencao"])
 
-        self.salvar_avaliacao_em_json(pergunta, resposta_final, contexto_limitado, self.nome_modelo_ollama_avaliador, caminho_json)
 
-        return resposta_final
+    @rastrear_com_opik
+    def gerar_resposta(self, pergunta: str, top_k: int = 3, max_tokens: int = None, perfil: str = None):
+
+        preparo = self.preparar_geracao(pergunta, top_k)
+
+        if preparo["resposta"] is not None:
+            return preparo["resposta"]
+
+        preparo["perfil"], configuracao = obter_perfil(perfil)
+        # O streamer do medidor separa prefill de decodificação; com beam search (que não aceita
+        # streamer) a geração fica num span só
+        if configuracao["num_beams"] == 1:
+            preparo["medidor"] = MedidorDeGeracao()
+        argumentos_geracao = self.argumentos_de_geracao([preparo["ids_prompt"]], configuracao, max_tokens, preparo["medidor"])
+
+        inicio_geracao = time.perf_counter()
+        saida_ids = self.executar_geracao(argumentos_geracao, preparo)
+        if preparo["medidor"] is None:
+            preparo["rastro"].registrar("geracao", inicio_geracao, time.perf_counter())
+
+        # Só os tokens novos: o prompt não precisa ser decodificado de volta
+        with preparo["rastro"].etapa("detokenizacao"), self.trava_tokenizer:
+            resposta = self.tokenizer.decode(saida_ids[0][argumentos_geracao["input_ids"].shape[1]:], skip_special_tokens=True).strip()
+
+        return self.finalizar_resposta(preparo, resposta)
+
+
+    def iter_resposta(self, pergunta: str, top_k: int = 3, max_tokens: int = None, perfil: str = None):
+        # Gerador que entrega a resposta aos pedaços, conforme os tokens são produzidos.
+        # O valor de retorno (StopIteration.value) é a resposta final pós-processada,
+        # a mesma que vai para o cache e para o log.
+        preparo = self.preparar_geracao(pergunta, top_k)
+
+        if preparo["resposta"] is not None:
+            yield preparo["resposta"]
+            return preparo["resposta"]
+
+        from transformers import TextIteratorStreamer
+
+        # O streamer do transformers não suporta beam search: perfis com beams caem para um perfil sem beams
+        preparo["perfil"], configuracao = obter_perfil(perfil, streaming=True)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        preparo["medidor"] = MedidorDeGeracao(streamer)
+        argumentos_geracao = self.argumentos_de_geracao([preparo["ids_prompt"]], configuracao, max_tokens, preparo["medidor"])
+
+        # Se o generate falhar, o streamer é encerrado mesmo assim (senão o consumo esperaria para
+        # sempre) e o erro é relançado para quem consome, antes de a resposta ser finalizada
+        erros = []
+
+        def gerar():
+            try:
+                self.executar_geracao(argumentos_geracao, preparo)
+            except Exception as e:
+                erros.append(e)
+                preparo["medidor"].end()
+
+        thread_geracao = Thread(target=gerar, daemon=True)
+        thread_geracao.start()
+
+        def pedacos():
+            yield from streamer
+            thread_geracao.join()
+            if erros:
+                raise erros[0]
+
+        return (yield from self.transmitir_resposta(preparo, pedacos()))
+
+
+    def transmitir_resposta(self, preparo: dict, pedacos):
+        resposta = ""
+        exibir = True
+        for pedaco in pedacos:
+            if not pedaco:
+                continue
+            resposta += pedaco
+            # Se o modelo começar a repetir o bloco de contexto, para de exibir (o texto ainda é consumido)
+            if exibir and "Contexto:" in resposta:
+                exibir = False
+            if exibir:
+                yield pedaco
+
+        return self.finalizar_resposta(preparo, resposta.strip(), streaming=True)
+
+
+    def calcular_cache_de_prefixo(self):
+        return CacheDePrefixo().preparar(self.modelo, f"{self.nome_modelo}:{self.backend}", self.empacotador.ids_prefixo())
+
+
+    def criar_decodificacao_assistida(self, modelo_rascunho: str):
+        rascunho = carregar_modelo_de_linguagem(modelo_rascunho, self.backend)
+        return DecodificacaoAssistida(self.modelo, rascunho, self.tokenizer, carregar_tokenizer(modelo_rascunho))
+
+
+    def executar_geracao(self, argumentos: dict, preparo: dict = None):
+        # Ponto único de chamada do generate: decide entre a geração normal e a assistida
+        assistida = self.decodificacao_assistida
+        if assistida is None or argumentos["input_ids"].shape[0] != 1 or argumentos.get("num_beams", 1) > 1 or not assistida.ativa():
+            return self.modelo.generate(**argumentos)
+
+        # O KV-cache do prefixo é só do modelo principal e não combina com o rascunho
+        argumentos = {chave: valor for chave, valor in argumentos.items() if chave != "past_key_values"}
+        saida_ids, metricas = assistida.gerar(argumentos)
+        if metricas is not None:
+            self.registrar_log({"evento": "geracao_assistida", "pergunta": preparo["pergunta"] if preparo else None, **metricas, "estatisticas": assistida.estatisticas(), "timestamp": time.time()})
+        return saida_ids
+
+
+    def argumentos_de_prefixo(self, ids_prompt: list) -> dict:
+        cache_de_prefixo = self.cache_de_prefixo
+        if cache_de_prefixo is None:
+            return {}
+        return cache_de_prefixo.argumentos_geracao(self.modelo, f"{self.nome_modelo}:{self.backend}", self.empacotador.ids_prefixo(), ids_prompt)
+
+
+    def tensores_de_entrada(self, lista_ids: list):
+        # Prompts já tokenizados viram um lote com padding à esquerda, como o generate espera
+        import torch
+
+        id_padding = self.id_padding
+        maior = max(len(ids) for ids in lista_ids)
+        input_ids = torch.tensor([[id_padding] * (maior - len(ids)) + list(ids) for ids in lista_ids], dtype=torch.long)
+        attention_mask = torch.tensor([[0] * (maior - len(ids)) + [1] * len(ids) for ids in lista_ids], dtype=torch.long)
+        return {"input_ids": input_ids.to(self.dispositivo), "attention_mask": attention_mask.to(self.dispositivo)}
+
+
+    def argumentos_de_geracao(self, lista_ids: list, configuracao: dict, max_tokens: int = None, streamer=None) -> dict:
+        # Argumentos do generate a partir do perfil: entradas com padding, critério de parada por
+        # caracteres e, para um único prompt sem beam search, o KV-cache do prefixo fixo
+        # (com padding à esquerda o prefixo muda de posição; com beams o cache teria de ser replicado).
+        # max_tokens pode ser uma lista, com o limite de cada prompt do lote (None usa o do perfil).
+        from transformers import StoppingCriteriaList
+
+        entradas = self.tensores_de_entrada(lista_ids)
+        criterios = [ParadaPorCaracteres(self.tokenizer, entradas["input_ids"].shape[1], configuracao["max_caracteres"], trava=self.trava_tokenizer)]
+        if isinstance(max_tokens, (list, tuple)):
+            limites = [limite if limite is not None else configuracao["max_new_tokens"] for limite in max_tokens]
+            max_tokens = max(limites)
+            if min(limites) < max_tokens:
+                criterios.append(ParadaPorTokens(entradas["input_ids"].shape[1], limites))
+        argumentos = dict(
+            **entradas,
+            **argumentos_generate(configuracao, max_tokens),
+            pad_token_id=self.id_padding,
+            stopping_criteria=StoppingCriteriaList(criterios)
+        )
+        if streamer is not None:
+            argumentos["streamer"] = streamer
+        if len(lista_ids) == 1 and configuracao["num_beams"] == 1:
+            argumentos.update(self.argumentos_de_prefixo(lista_ids[0]))
+        return argumentos
+
+
+    def gerar_em_lote(self, lista_ids: list, max_tokens: int = None, streamer=None, perfil: str = None):
+        # Gera as respostas de vários prompts (já em ids de token) numa única chamada de generate
+        _, configuracao = obter_perfil(perfil, streaming=True)
+        argumentos_geracao = self.argumentos_de_geracao(lista_ids, configuracao, max_tokens, streamer)
+
+        saida_ids = self.executar_geracao(argumentos_geracao)
+
+        novos_ids = saida_ids[:, argumentos_geracao["input_ids"].shape[1]:]
+        with self.trava_tokenizer:
+            return self.tokenizer.batch_decode(novos_ids, skip_special_tokens=True)
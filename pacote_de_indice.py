@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+
+# Formato do pacote (little-endian, seções alinhadas em 8 bytes):
+#   cabeçalho | ids (int64, ordenados) | offsets dos textos (uint64, n+1) | textos UTF-8
+#             | offsets dos assuntos (uint64, n+1) | assuntos (JSON UTF-8 por entrada)
+# O índice FAISS continua num arquivo próprio, porque o FAISS só faz mmap de um arquivo
+# inteiro; o cabeçalho guarda o SHA-256 dele para detectar pacote e índice de versões diferentes.
+ASSINATURA = b"VIVIPKG\0"
+VERSAO = 1
+FORMATO_CABECALHO = "<8sII7Q32s"
+TAMANHO_CABECALHO = struct.calcsize(FORMATO_CABECALHO)
+
+
+def _alinhar(tamanho: int) -> int:
+    return (tamanho + 7) & ~7
+
+
+def hash_de_arquivo(caminho: str) -> bytes:
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloco)
+    return sha.digest()
+
+
+def _serializar_blob(valores: list):
+    offsets = array("Q", [0])
+    partes = []
+    for valor in valores:
+        partes.append(valor)
+        offsets.append(offsets[-1] + len(valor))
+    return offsets.tobytes(), b"".join(partes)
+
+
+def montar_pacote(id_para_texto: dict, id_para_assunto: dict = None, hash_indice: bytes = b"") -> bytes:
+    id_para_assunto = id_para_assunto or {}
+    ids = sorted(int(id_str) for id_str in id_para_texto)
+
+    ids_bytes = array("q", ids).tobytes()
+    offsets_textos, blob_textos = _serializar_blob([id_para_texto[str(i)].encode("utf-8") for i in ids])
+    offsets_assuntos, blob_assuntos = _serializar_blob([json.dumps(id_para_assunto.get(str(i), {}), ensure_ascii=False).encode("utf-8") for i in ids])
+
+    secoes = [ids_bytes, offsets_textos, blob_textos, offsets_assuntos, blob_assuntos]
+    posicoes = []
+    posicao = _alinhar(TAMANHO_CABECALHO)
+    for secao in secoes:
+        posicoes.append(posicao)
+        posicao = _alinhar(posicao + len(secao))
+
+    cabecalho = struct.pack(FORMATO_CABECALHO, ASSINATURA, VERSAO, 0, len(ids), *posicoes, posicao, hash_indice.ljust(32, b"\0"))
+    conteudo = bytearray(posicao)
+    conteudo[:len(cabecalho)] = cabecalho
+    for inicio, secao in zip(posicoes, secoes):
+        conteudo[inicio:inicio + len(secao)] = secao
+    return bytes(conteudo)
+
+
+def escrever_pacote(caminho: str, id_para_texto: dict, id_para_assunto: dict = None, caminho_indice: str = None):
+    hash_indice = hash_de_arquivo(caminho_indice) if caminho_indice and os.path.exists(caminho_indice) else b""
+    temporario = caminho + ".tmp"
+    with open(temporario, "wb") as f:
+        f.write(montar_pacote(id_para_texto, id_para_assunto, hash_indice))
+    # Troca atômica: processos que já mapearam o pacote antigo continuam lendo a versão deles
+    os.replace(temporario, caminho)
+
+
+class PacoteDeIndice:
+    # Acesso somente leitura ao pacote, por id inteiro, direto sobre o mmap: nada é copiado
+    # para dicionários Python e vários processos compartilham as mesmas páginas em cache.
+    def __init__(self, buffer, caminho: str = None):
+        self.caminho = caminho
+        self.buffer = buffer
+        self.visao = memoryview(buffer)
+
+        assinatura, versao, _, total, *posicoes, fim, hash_indice = struct.unpack_from(FORMATO_CABECALHO, buffer, 0)
+        if assinatura != ASSINATURA:
+            raise ValueError(f"Arquivo não é um pacote de índice da Vivi: {caminho}")
+        if versao != VERSAO:
+            raise ValueError(f"Versão de pacote não suportada: {versao} (esperada {VERSAO})")
+
+        inicio_ids, inicio_offsets_textos, self.inicio_textos, inicio_offsets_assuntos, self.inicio_assuntos = posicoes
+        self.total = total
+        self.hash_indice = hash_indice.rstrip(b"\0")
+        self.ids = self.visao[inicio_ids:inicio_ids + 8 * total].cast("q")
+        self.offsets_textos = self.visao[inicio_offsets_textos:inicio_offsets_textos + 8 * (total + 1)].cast("Q")
+        self.offsets_assuntos = self.visao[inicio_offsets_assuntos:inicio_offsets_assuntos + 8 * (total + 1)].cast("Q")
+
+
+    @classmethod
+    def abrir(cls, caminho: str):
+        with open(caminho, "rb") as f:
+            mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapa, caminho)
+
+
+    @classmethod
+    def de_arquivos_json(cls, caminho_id_texto: str, caminho_id_assunto: str = None):
+        # Alternativa em memória para quando só existem os JSONs antigos
+        with open(caminho_id_texto, "r", encoding="utf-8") as f:
+            id_para_texto = json.load(f)
+        id_para_assunto = {}
+        if caminho_id_assunto and os.path.exists(caminho_id_assunto):
+            with open(caminho_id_assunto, "r", encoding="utf-8") as f:
+                id_para_assunto = json.load(f)
+        return cls(montar_pacote(id_para_texto, id_para_assunto), caminho_id_texto)
+
+
+    def __len__(self):
+        return self.total
+
+
+    def _posicao(self, id_doc: int):
+        posicao = bisect_left(self.ids, id_doc)
+        if posicao < self.total and self.ids[posicao] == id_doc:
+            return posicao
+        return None
+
+
+    def texto_bytes(self, id_doc: int):
+        posicao = self._posicao(int(id_doc))
+        if posicao is None:
+            return None
+        return self.visao[self.inicio_textos + self.offsets_textos[posicao]:self.inicio_textos + self.offsets_textos[posicao + 1]]
+
+
+    def texto(self, id_doc: int, padrao: str = "") -> str:
+        trecho = self.texto_bytes(id_doc)
+        return str(trecho, "utf-8") if trecho is not None else padrao
+
+
+    def assunto(self, id_doc: int) -> dict:
+        posicao = self._posicao(int(id_doc))
+        if posicao is None:
+            return {}
+        trecho = self.visao[self.inicio_assuntos + self.offsets_assuntos[posicao]:self.inicio_assuntos + self.offsets_assuntos[posicao + 1]]
+        return json.loads(str(trecho, "utf-8"))
+
+
+    def get(self, id_doc, padrao: str = ""):
+        # Compatível com o uso antigo de id_para_texto.get(str(i), "")
+        return self.texto(int(id_doc), padrao)
+
+
+    def itens(self):
+        for posicao in range(self.total):
+            yield self.ids[posicao], str(self.visao[self.inicio_textos + self.offsets_textos[posicao]:self.inicio_textos + self.offsets_textos[posicao + 1]], "utf-8")
+
+
+    def confere_com_indice(self, caminho_indice: str) -> bool:
+        return not self.hash_indice or hash_de_arquivo(caminho_indice) == self.hash_indice
+
+
+def abrir_indice_faiss_mmap(caminho: str):
+    # Mapeia o índice em vez de lê-lo para a memória; tipos de índice sem suporte a mmap são lidos normalmente
+    import faiss
+
+    flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+    try:
+        return faiss.read_index(caminho, flags)
+    except RuntimeError:
+        return faiss.read_index(caminho)
+
+
+def converter_arquivos_atuais(caminho_id_texto: str, caminho_id_assunto: str, caminho_indice: str, caminho_pacote: str):
+    with open(caminho_id_texto, "r", encoding="utf-8") as f:
+        id_para_texto = json.load(f)
+    id_para_assunto = {}
+    if os.path.exists(caminho_id_assunto):
+        with open(caminho_id_assunto, "r", encoding="utf-8") as f:
+            id_para_assunto = json.load(f)
+
+    escrever_pacote(caminho_pacote, id_para_texto, id_para_assunto, caminho_indice)
+    print(f"Pacote '{caminho_pacote}' criado com {len(id_para_texto)} trechos ({os.path.getsize(caminho_pacote) / 1024:.1f} KiB).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converte id_para_texto.json + id_para_assunto.json para o pacote mapeável em memória.")
+    parser.add_argument("--id-para-texto", default="id_para_texto.json")
+    parser.add_argument("--id-para-assunto", default="id_para_assunto.json")
+    parser.add_argument("--indice", default="faiss.index")
+    parser.add_argument("--saida", default="indice_vivi.pacote")
+    args = parser.parse_args()
+
+    converter_arquivos_atuais(args.id_para_texto, args.id_para_assunto, args.indice, args.saida)
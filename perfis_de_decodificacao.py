@@ -0,0 +1,135 @@
+import re
+from threading import Lock
+
+# Perfis de decodificação nomeados. "max_caracteres" não vai para o generate: alimenta o critério
+# de parada, já que o prompt pede respostas de até 500 caracteres (~150 tokens em português).
+PERFIS = {
+    "rapido": {
+        "num_beams": 1,
+        "do_sample": False,
+        "repetition_penalty": 1.2,
+        "max_new_tokens": 200,
+        "max_caracteres": 500
+    },
+    "amostragem": {
+        "num_beams": 1,
+        "do_sample": True,
+        "top_p": 0.9,
+        "temperature": 0.7,
+        "repetition_penalty": 1.2,
+        "max_new_tokens": 200,
+        "max_caracteres": 500
+    },
+    "qualidade": {
+        "num_beams": 3,
+        "do_sample": False,
+        "early_stopping": True,
+        "repetition_penalty": 2.0,
+        "max_new_tokens": 500,
+        "max_caracteres": 500
+    }
+}
+
+PERFIL_PADRAO = "rapido"
+
+# Beam search não funciona com streaming nem com o lote do servidor; esses caminhos caem para este perfil
+PERFIL_SEM_BEAMS = "rapido"
+
+PADRAO_FIM_DE_FRASE = re.compile(r"[.!?…](\s|$)")
+MARCADORES_DE_PARADA = ("Contexto:", "Pergunta:")
+
+
+def obter_perfil(nome: str = None, streaming: bool = False) -> tuple:
+    nome = nome or PERFIL_PADRAO
+    if nome not in PERFIS:
+        raise ValueError(f"Perfil de decodificação inválido: {nome}. Use um de {tuple(PERFIS)}.")
+    if streaming and PERFIS[nome]["num_beams"] > 1:
+        nome = PERFIL_SEM_BEAMS
+    return nome, PERFIS[nome]
+
+
+def argumentos_generate(perfil: dict, max_tokens: int = None) -> dict:
+    argumentos = {chave: valor for chave, valor in perfil.items() if chave != "max_caracteres"}
+    if max_tokens is not None:
+        argumentos["max_new_tokens"] = max_tokens
+    return argumentos
+
+
+class ParadaPorCaracteres:
+    # Critério de parada do generate: encerra cada linha do lote quando a resposta passa de
+    # max_caracteres e termina uma frase, quando passa da margem de tolerância ou quando o modelo
+    # começa a repetir os cabeçalhos do prompt. O generate só chama o objeto, então não é preciso
+    # herdar de StoppingCriteria (e importar o transformers junto com este módulo).
+    # O texto de cada linha é acumulado: a cada passo só os tokens novos são decodificados (com o
+    # token anterior como contexto, para espaços e caracteres multibyte saírem certos).
+    def __init__(self, tokenizer, tamanho_prompt: int, max_caracteres: int = 500, tolerancia: float = 0.2, trava=None):
+        self.tokenizer = tokenizer
+        self.tamanho_prompt = tamanho_prompt
+        self.max_caracteres = max_caracteres
+        self.limite_absoluto = int(max_caracteres * (1 + tolerancia))
+        self.trava = trava or Lock()
+        self.ids = []
+        self.textos = []
+        self.inicio_janela = []
+        self.lidos = []
+
+
+    def deve_parar(self, texto: str) -> bool:
+        if any(marcador in texto for marcador in MARCADORES_DE_PARADA):
+            return True
+        texto = texto.rstrip()
+        if len(texto) >= self.limite_absoluto:
+            return True
+        return len(texto) >= self.max_caracteres and PADRAO_FIM_DE_FRASE.search(texto[-2:]) is not None
+
+
+    def _reiniciar(self, linhas: int):
+        self.ids = [[] for _ in range(linhas)]
+        self.textos = ["" for _ in range(linhas)]
+        self.inicio_janela = [0 for _ in range(linhas)]
+        self.lidos = [0 for _ in range(linhas)]
+
+
+    def _avancar(self, i: int, novos_ids: list):
+        ids = self.ids[i]
+        ids.extend(novos_ids)
+        with self.trava:
+            anterior = self.tokenizer.decode(ids[self.inicio_janela[i]:self.lidos[i]], skip_special_tokens=True)
+            atual = self.tokenizer.decode(ids[self.inicio_janela[i]:], skip_special_tokens=True)
+        # Caractere multibyte incompleto: espera o próximo token
+        if atual.endswith("�"):
+            return
+        self.textos[i] += atual[len(anterior):]
+        self.inicio_janela[i] = self.lidos[i]
+        self.lidos[i] = len(ids)
+
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        linhas, tamanho = input_ids.shape
+        gerados = tamanho - self.tamanho_prompt
+        # Um novo generate com o mesmo critério (ex.: a geração refeita sem rascunho) recomeça do zero
+        if len(self.ids) != linhas or gerados < len(self.ids[0]):
+            self._reiniciar(linhas)
+
+        ja_vistos = len(self.ids[0])
+        novos = input_ids[:, self.tamanho_prompt + ja_vistos:].tolist()
+        for i in range(linhas):
+            self._avancar(i, novos[i])
+        return torch.tensor([self.deve_parar(texto) for texto in self.textos], dtype=torch.bool, device=input_ids.device)
+
+
+class ParadaPorTokens:
+    # Limite de tokens novos por linha do lote: cada pedido do servidor traz o seu max_tokens e o
+    # max_new_tokens do generate é só o maior deles, então as outras linhas param aqui
+    def __init__(self, tamanho_prompt: int, limites: list):
+        self.tamanho_prompt = tamanho_prompt
+        self.limites = limites
+
+
+    def __call__(self, input_ids, scores, **kwargs):
+        import torch
+
+        gerados = input_ids.shape[1] - self.tamanho_prompt
+        return torch.tensor([gerados >= limite for limite in self.limites], dtype=torch.bool, device=input_ids.device)
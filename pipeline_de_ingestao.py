@@ -0,0 +1,236 @@
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from leitor_de_pdfs_ANTRA import converter_pdfs_para_txt, hash_de_arquivo, salvar_manifesto
+from limpeza_e_pre_processamento_de_dados import (
+    PreProcessadorEtapa2ComoAgirEmCasosDeViolenciaDomestica,
+    PreProcessadorEtapa2OQueFazerEmCasoDeViolenciaLgbtfobica,
+    PreProcessamentoCentrosLGBTI,
+    PreProcessamentoEtapa1Limpeza,
+)
+
+PASTA_FONTES = "fonte_de_dados"
+PASTA_SAIDA = "dados_limpos_e_pre_processados"
+NOME_ESTADO = "estado_ingestao.json"
+
+# Tudo o que salvar_indice grava (parâmetro do ArmazenadorVetorialFaiss com o caminho de cada arquivo)
+ARQUIVOS_DO_INDICE = ("caminho_indice", "caminho_dados", "caminho_id_para_assunto", "caminho_embeddings", "caminho_bm25", "caminho_metadados", "caminho_pacote")
+# Módulos cujo código muda o índice gerado
+MODULOS_DO_INDICE = ("indexar_dados_e_criacao_de_vector_store.py", "fabrica_de_indices.py", "indice_lexical.py", "pacote_de_indice.py")
+
+# Cada documento é uma cadeia de etapas: a entrada de uma etapa é a saída da anterior e a primeira
+# lê a fonte (o .txt de um PDF é gerado pela extração). Documentos diferentes não dependem entre si.
+DOCUMENTOS = [
+    {"nome": "centros_LGBTI", "fonte": "centros_LGBTI.txt", "etapas": ["estruturar_centros"]},
+    {"nome": "como_agir_em_casos_de_violencia_domestica_durante_o_isolamento_social", "fonte": "como_agir_em_casos_de_violencia_domestica_durante_o_isolamento_social.pdf", "etapas": ["limpar", "estruturar_violencia_domestica"]},
+    {"nome": "o_que_fazer_em_caso_de_violencia_lgbtfobica", "fonte": "o_que_fazer_em_caso_de_violencia_lgbtfobica.txt", "etapas": ["limpar", "estruturar_violencia_lgbtfobica"]},
+]
+
+
+def estruturar_centros(entrada, saida):
+    PreProcessamentoCentrosLGBTI(entrada).executar(saida)
+
+
+def limpar(entrada, saida):
+    processador = PreProcessamentoEtapa1Limpeza(entrada)
+    processador.pasta_saida, processador.nome_limpo = os.path.split(saida)
+    processador.processar()
+
+
+def estruturar_violencia_domestica(entrada, saida):
+    processador = PreProcessadorEtapa2ComoAgirEmCasosDeViolenciaDomestica(entrada)
+    processador.pasta_saida, processador.nome_json = os.path.split(saida)
+    processador.processar()
+
+
+def estruturar_violencia_lgbtfobica(entrada, saida):
+    processador = PreProcessadorEtapa2OQueFazerEmCasoDeViolenciaLgbtfobica(entrada)
+    processador.salvar_para_json(processador.processar_para_dicionario(), saida)
+
+
+# Nome da etapa -> (função, sufixo do arquivo de saída)
+ETAPAS = {
+    "estruturar_centros": (estruturar_centros, "_limpo_e_pre_processado.json"),
+    "limpar": (limpar, "_etapa_1_limpo.txt"),
+    "estruturar_violencia_domestica": (estruturar_violencia_domestica, "_etapa_2_limpo_e_pre_processado.json"),
+    "estruturar_violencia_lgbtfobica": (estruturar_violencia_lgbtfobica, "_etapa_2_limpo_e_pre_processado.json"),
+}
+
+
+def _hash_de_codigo(modulo):
+    # Mudou o código da etapa, muda a chave: a saída antiga deixa de valer
+    return hash_de_arquivo(os.path.join(os.path.dirname(os.path.abspath(__file__)), modulo))
+
+
+def chave_da_etapa(etapa, caminhos_entrada, parametros=None, modulos=("limpeza_e_pre_processamento_de_dados.py",)):
+    resumo = hashlib.sha256()
+    resumo.update(etapa.encode("utf-8"))
+    for modulo in modulos:
+        resumo.update(_hash_de_codigo(modulo).encode("utf-8"))
+    for caminho in caminhos_entrada:
+        resumo.update(hash_de_arquivo(caminho).encode("utf-8"))
+    resumo.update(json.dumps(parametros or {}, sort_keys=True).encode("utf-8"))
+    return resumo.hexdigest()
+
+
+def em_cache(estado, saidas, chave):
+    # Em cache se a última execução teve a mesma chave e as saídas continuam lá, sem alteração
+    registro = estado.get(saidas[0])
+    if registro is None or registro["chave"] != chave:
+        return False
+    return all(os.path.exists(saida) and hash_de_arquivo(saida) == registro["saidas"].get(saida) for saida in saidas)
+
+
+def entrada_do_documento(documento, pasta_fontes):
+    caminho = os.path.join(pasta_fontes, documento["fonte"])
+    if caminho.endswith(".pdf"):
+        return os.path.splitext(caminho)[0] + ".txt"
+    return caminho
+
+
+def processar_documento(documento, pasta_fontes, pasta_saida, estado, forcar=False):
+    # Roda num processo do pool: executa as etapas do documento em ordem, pulando as que estão em
+    # cache, e devolve o tempo de cada uma e os registros novos do estado
+    relatorio = []
+    registros = {}
+    entrada = entrada_do_documento(documento, pasta_fontes)
+
+    for etapa in documento["etapas"]:
+        funcao, sufixo = ETAPAS[etapa]
+        saida = os.path.join(pasta_saida, documento["nome"] + sufixo)
+        inicio = time.perf_counter()
+        try:
+            chave = chave_da_etapa(etapa, [entrada])
+            if not forcar and em_cache(estado, [saida], chave):
+                relatorio.append({"documento": documento["nome"], "etapa": etapa, "situacao": "em cache", "segundos": time.perf_counter() - inicio})
+                entrada = saida
+                continue
+            funcao(entrada, saida)
+            segundos = time.perf_counter() - inicio
+            registros[saida] = {"chave": chave, "saidas": {saida: hash_de_arquivo(saida)}, "segundos": segundos, "executado_em": time.strftime("%Y-%m-%d %H:%M:%S")}
+            relatorio.append({"documento": documento["nome"], "etapa": etapa, "situacao": "executada", "segundos": segundos})
+        except Exception as e:
+            # As etapas seguintes do documento dependem desta e não são executadas
+            relatorio.append({"documento": documento["nome"], "etapa": etapa, "situacao": f"erro: {e}", "segundos": time.perf_counter() - inicio})
+            return relatorio, registros, None
+        entrada = saida
+
+    return relatorio, registros, entrada
+
+
+def indexar(arquivos_json, estado, forcar=False, **parametros_indice):
+    # Segmentação, embeddings e índice dependem de todos os documentos juntos. Os embeddings já são
+    # reaproveitados por hash do segmento (atualizar_indice_incremental), então só os segmentos
+    # novos ou alterados são codificados quando algum JSON muda.
+    from indexar_dados_e_criacao_de_vector_store import ArmazenadorVetorialFaiss
+
+    relatorio = []
+    registros = {}
+    padroes = inspect.signature(ArmazenadorVetorialFaiss).parameters
+    saidas = [parametros_indice.get(nome, padroes[nome].default) for nome in ARQUIVOS_DO_INDICE]
+    chave = chave_da_etapa("indexar", arquivos_json, parametros_indice, MODULOS_DO_INDICE)
+    if not forcar and em_cache(estado, saidas, chave):
+        return [{"documento": "(todos)", "etapa": "segmentar_e_indexar", "situacao": "em cache", "segundos": 0.0}], registros
+
+    inicio = time.perf_counter()
+    armazenador = ArmazenadorVetorialFaiss(arquivos_json=arquivos_json, **parametros_indice)
+    relatorio.append({"documento": "(todos)", "etapa": "carregar_modelo", "situacao": "executada", "segundos": time.perf_counter() - inicio})
+
+    # A segmentação acontece dentro de atualizar_indice_incremental (depois de carregar o índice
+    # salvo, que sobrescreve os segmentos em memória), então não é feita à parte aqui
+    inicio = time.perf_counter()
+    resumo = armazenador.atualizar_indice_incremental()
+    armazenador.salvar_indice()
+    segundos = time.perf_counter() - inicio
+    relatorio.append({"documento": "(todos)", "etapa": "segmentar_embeddings_e_indice", "situacao": f"executada ({len(armazenador.textos)} segmentos; {resumo['novos']} novos, {resumo['removidos']} removidos)", "segundos": segundos})
+
+    registros[saidas[0]] = {"chave": chave, "saidas": {saida: hash_de_arquivo(saida) for saida in saidas}, "segundos": segundos, "executado_em": time.strftime("%Y-%m-%d %H:%M:%S")}
+    return relatorio, registros
+
+
+def carregar_estado(caminho):
+    if not os.path.exists(caminho):
+        return {}
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def executar_pipeline(pasta_fontes=PASTA_FONTES, pasta_saida=PASTA_SAIDA, processos=None, forcar=False, sem_indice=False, parametros_indice=None):
+    os.makedirs(pasta_saida, exist_ok=True)
+    caminho_estado = os.path.join(pasta_saida, NOME_ESTADO)
+    estado = {} if forcar else carregar_estado(caminho_estado)
+    relatorio = []
+    inicio_total = time.perf_counter()
+
+    # Extração: o leitor de PDFs já converte em paralelo e só os PDFs novos ou alterados
+    inicio = time.perf_counter()
+    _, falhas = converter_pdfs_para_txt(pasta_fontes, processos, forcar)
+    relatorio.append({"documento": "(pdfs)", "etapa": "extrair", "situacao": f"erro: {', '.join(sorted(falhas))}" if falhas else "executada", "segundos": time.perf_counter() - inicio})
+
+    # Um documento cujo PDF não foi extraído não segue com o .txt antigo: as etapas dele ficam de fora
+    documentos = []
+    for documento in DOCUMENTOS:
+        if documento["fonte"] in falhas:
+            for etapa in documento["etapas"]:
+                relatorio.append({"documento": documento["nome"], "etapa": etapa, "situacao": "ignorada (extração falhou)", "segundos": 0.0})
+        else:
+            documentos.append(documento)
+
+    # Limpeza e estruturação: um processo por documento
+    arquivos_json = []
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        futuros = [executor.submit(processar_documento, documento, pasta_fontes, pasta_saida, estado, forcar) for documento in documentos]
+        for futuro in futuros:
+            relatorio_documento, registros, saida_final = futuro.result()
+            relatorio.extend(relatorio_documento)
+            estado.update(registros)
+            if saida_final is not None:
+                arquivos_json.append(saida_final)
+    salvar_manifesto(caminho_estado, estado)
+
+    if sem_indice:
+        print("Indexação ignorada (--sem-indice).")
+    elif len(arquivos_json) < len(DOCUMENTOS):
+        print("Algum documento falhou; o índice não foi atualizado para não perder os segmentos dele.")
+    else:
+        relatorio_indice, registros = indexar(arquivos_json, estado, forcar, **(parametros_indice or {}))
+        relatorio.extend(relatorio_indice)
+        estado.update(registros)
+        salvar_manifesto(caminho_estado, estado)
+
+    imprimir_relatorio(relatorio, time.perf_counter() - inicio_total)
+    return relatorio
+
+
+def imprimir_relatorio(relatorio, segundos_total):
+    print("\n--- Tempo por etapa ---")
+    for linha in relatorio:
+        print(f"{linha['documento'][:45]:<45} {linha['etapa']:<32} {linha['segundos']:>8.2f}s  {linha['situacao']}")
+    print(f"Total: {segundos_total:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingestão completa da Vivi: extração dos PDFs, limpeza (etapa 1), estruturação (etapa 2), segmentação, embeddings e índice FAISS. Só as etapas cujas entradas mudaram são executadas de novo.")
+    parser.add_argument("--fontes", default=PASTA_FONTES)
+    parser.add_argument("--saida", default=PASTA_SAIDA)
+    parser.add_argument("--processos", type=int, default=None, help="Número de processos (padrão: um por CPU).")
+    parser.add_argument("--forcar", action="store_true", help="Ignora o cache e executa todas as etapas.")
+    parser.add_argument("--sem-indice", action="store_true", help="Para depois da estruturação, sem gerar embeddings nem índice.")
+    parser.add_argument("--tipo-indice", choices=["flat", "hnsw", "ivfpq"], default="flat")
+    parser.add_argument("--parametros-indice", type=json.loads, default=None)
+    parser.add_argument("--armazenamento", choices=["float32", "float16", "int8"], default="float32")
+    args = parser.parse_args()
+
+    executar_pipeline(
+        args.fontes,
+        args.saida,
+        args.processos,
+        args.forcar,
+        args.sem_indice,
+        {"tipo_indice": args.tipo_indice, "parametros_indice": args.parametros_indice, "armazenamento": args.armazenamento}
+    )
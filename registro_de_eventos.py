@@ -0,0 +1,148 @@
+import atexit
+import glob
+import json
+import os
+import sys
+import time
+from collections import Counter
+from threading import Event, Lock, Thread
+
+
+class RegistradorDeEventos:
+    # Log append-only em JSONL: os eventos ficam num buffer em memória e uma thread
+    # os grava em lote. O arquivo é rotacionado por tamanho ou idade em segmentos
+    # "<nome>.<data>.jsonl", que podem ser lidos de volta com ler_eventos.
+    _instancias = {}
+    _trava_instancias = Lock()
+
+    def __init__(self, caminho: str, intervalo_flush: float = 1.0, tamanho_max_bytes: int = 50 * 1024 * 1024, idade_max_segundos: float = 24 * 3600, max_buffer: int = 1000):
+        self.caminho = caminho
+        self.intervalo_flush = intervalo_flush
+        self.tamanho_max_bytes = tamanho_max_bytes
+        self.idade_max_segundos = idade_max_segundos
+        self.max_buffer = max_buffer
+
+        self.buffer = []
+        self.trava_buffer = Lock()
+        self.trava_escrita = Lock()
+        self.pedido_flush = Event()
+        self.encerrado = False
+        self.inicio_segmento = os.path.getmtime(caminho) if os.path.exists(caminho) else time.time()
+
+        pasta = os.path.dirname(caminho)
+        if pasta:
+            os.makedirs(pasta, exist_ok=True)
+
+        self.thread = Thread(target=self._laco, name=f"registrador-{os.path.basename(caminho)}", daemon=True)
+        self.thread.start()
+        atexit.register(self.fechar)
+
+
+    @classmethod
+    def para_arquivo(cls, caminho: str, **opcoes):
+        # Um registrador por arquivo no processo, para que as sessões não disputem o mesmo arquivo
+        chave = os.path.abspath(caminho)
+        with cls._trava_instancias:
+            if chave not in cls._instancias:
+                cls._instancias[chave] = cls(caminho, **opcoes)
+            return cls._instancias[chave]
+
+
+    def registrar(self, evento: dict):
+        linha = json.dumps(evento, ensure_ascii=False, default=str)
+        with self.trava_buffer:
+            self.buffer.append(linha)
+            cheio = len(self.buffer) >= self.max_buffer
+        if cheio:
+            self.pedido_flush.set()
+
+
+    def descarregar(self):
+        with self.trava_escrita:
+            with self.trava_buffer:
+                linhas, self.buffer = self.buffer, []
+            if not linhas:
+                return
+
+            self._rotacionar_se_necessario()
+            # Uma única escrita por lote em modo append
+            with open(self.caminho, "a", encoding="utf-8") as f:
+                f.write("\n".join(linhas) + "\n")
+
+
+    def _rotacionar_se_necessario(self):
+        if not os.path.exists(self.caminho):
+            self.inicio_segmento = time.time()
+            return
+
+        muito_grande = os.path.getsize(self.caminho) >= self.tamanho_max_bytes
+        muito_antigo = time.time() - self.inicio_segmento >= self.idade_max_segundos
+        if not (muito_grande or muito_antigo):
+            return
+
+        raiz, extensao = os.path.splitext(self.caminho)
+        sufixo = time.strftime("%Y%m%d-%H%M%S") + f"-{int((time.time() % 1) * 1e6):06d}"
+        os.replace(self.caminho, f"{raiz}.{sufixo}{extensao}")
+        self.inicio_segmento = time.time()
+
+
+    def _laco(self):
+        while not self.encerrado:
+            self.pedido_flush.wait(self.intervalo_flush)
+            self.pedido_flush.clear()
+            try:
+                self.descarregar()
+            except Exception as e:
+                print(f"Erro ao gravar eventos em '{self.caminho}': {e}")
+
+
+    def fechar(self):
+        if self.encerrado:
+            return
+        self.encerrado = True
+        self.pedido_flush.set()
+        self.thread.join(timeout=5)
+        self.descarregar()
+
+
+def segmentos_do_log(caminho: str) -> list:
+    raiz, extensao = os.path.splitext(caminho)
+    segmentos = sorted(glob.glob(f"{glob.escape(raiz)}.*{extensao}"))
+    if os.path.exists(caminho):
+        segmentos.append(caminho)
+    return segmentos
+
+
+def ler_eventos(caminho: str, incluir_rotacionados: bool = True):
+    # Lê os eventos um a um, do segmento mais antigo ao atual, sem carregar os arquivos inteiros
+    segmentos = segmentos_do_log(caminho) if incluir_rotacionados else [caminho]
+    for segmento in segmentos:
+        with open(segmento, "r", encoding="utf-8") as f:
+            for linha in f:
+                linha = linha.strip()
+                if not linha:
+                    continue
+                try:
+                    yield json.loads(linha)
+                except json.JSONDecodeError:
+                    # Última linha de um processo interrompido no meio da escrita
+                    continue
+
+
+def importar_log_legado(caminho_json: str, caminho_jsonl: str):
+    # Converte um log antigo (array JSON único) para o formato JSONL
+    with open(caminho_json, "r", encoding="utf-8") as f:
+        eventos = json.load(f)
+    with open(caminho_jsonl, "a", encoding="utf-8") as f:
+        for evento in eventos:
+            f.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+    print(f"{len(eventos)} eventos importados de '{caminho_json}' para '{caminho_jsonl}'.")
+
+
+if __name__ == "__main__":
+    caminho_log = sys.argv[1] if len(sys.argv) > 1 else "log.jsonl"
+
+    contagem = Counter(evento.get("evento", "desconhecido") for evento in ler_eventos(caminho_log))
+    print(f"Eventos em '{caminho_log}' ({len(segmentos_do_log(caminho_log))} segmentos):")
+    for nome_evento, quantidade in contagem.most_common():
+        print(f"  {nome_evento}: {quantidade}")
@@ -0,0 +1,82 @@
+import time
+
+from indice_lexical import tokenizar
+
+
+class PontuadorLexical:
+    # Pontuador barato: fração dos termos da pergunta (já reduzidos ao radical) que aparecem no
+    # trecho, com desempate pela densidade desses termos. Não precisa de modelo nem de GPU.
+    def pontuar(self, pergunta: str, textos: list) -> list:
+        termos_pergunta = set(tokenizar(pergunta))
+        if not termos_pergunta:
+            return [0.0] * len(textos)
+
+        pontuacoes = []
+        for texto in textos:
+            termos_texto = tokenizar(texto)
+            presentes = termos_pergunta.intersection(termos_texto)
+            ocorrencias = sum(1 for termo in termos_texto if termo in termos_pergunta)
+            pontuacoes.append(len(presentes) / len(termos_pergunta) + ocorrencias / (len(termos_texto) + 10))
+        return pontuacoes
+
+
+class PontuadorCrossEncoder:
+    # Cross-encoder pequeno do sentence-transformers: lê pergunta e trecho juntos, então é bem mais
+    # preciso que a similaridade dos embeddings, mas custa uma passada do modelo por par.
+    def __init__(self, nome_modelo: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1", max_tokens: int = 256):
+        from sentence_transformers import CrossEncoder
+        self.modelo = CrossEncoder(nome_modelo, max_length=max_tokens)
+
+
+    def pontuar(self, pergunta: str, textos: list) -> list:
+        return [float(pontuacao) for pontuacao in self.modelo.predict([(pergunta, texto) for texto in textos], batch_size=len(textos), show_progress_bar=False)]
+
+
+class Reordenador:
+    # Reordena os candidatos da recuperação e devolve os melhores que cabem no orçamento de tokens.
+    # Os candidatos são pontuados em lotes e, se o orçamento de tempo acabar, os que faltam mantêm
+    # a ordem da recuperação, atrás dos já pontuados: a resposta nunca espera mais que o orçamento.
+    def __init__(self, pontuador, max_candidatos: int = 20, tamanho_lote: int = 8, orcamento_segundos: float = 0.2, orcamento_tokens: int = 1024, contar_tokens=None):
+        self.pontuador = pontuador
+        self.max_candidatos = max_candidatos
+        self.tamanho_lote = tamanho_lote
+        self.orcamento_segundos = orcamento_segundos
+        self.orcamento_tokens = orcamento_tokens
+        self.contar_tokens = contar_tokens or (lambda id_doc, texto: len(texto.split()))
+
+
+    def reordenar(self, pergunta: str, candidatos: list, top_n: int = 3):
+        # candidatos: lista de (id, texto) na ordem da recuperação
+        inicio = time.perf_counter()
+        candidatos = candidatos[:self.max_candidatos]
+
+        pontuacoes = []
+        for posicao in range(0, len(candidatos), self.tamanho_lote):
+            if pontuacoes and time.perf_counter() - inicio > self.orcamento_segundos:
+                break
+            lote = candidatos[posicao:posicao + self.tamanho_lote]
+            pontuacoes.extend(self.pontuador.pontuar(pergunta, [texto for _, texto in lote]))
+
+        pontuados = sorted(zip(candidatos, pontuacoes), key=lambda item: item[1], reverse=True)
+        ordenados = [candidato for candidato, _ in pontuados] + candidatos[len(pontuacoes):]
+
+        selecionados = []
+        tokens_usados = 0
+        for id_doc, texto in ordenados:
+            if len(selecionados) >= top_n:
+                break
+            tokens = self.contar_tokens(id_doc, texto)
+            # O primeiro trecho sempre entra; o empacotamento do contexto corta o excesso
+            if selecionados and tokens_usados + tokens > self.orcamento_tokens:
+                continue
+            selecionados.append((id_doc, texto))
+            tokens_usados += tokens
+
+        estatisticas = {
+            "candidatos": len(candidatos),
+            "pontuados": len(pontuacoes),
+            "selecionados": [id_doc for id_doc, _ in selecionados],
+            "tokens": tokens_usados,
+            "tempo_segundos": time.perf_counter() - inicio
+        }
+        return selecionados, estatisticas
@@ -0,0 +1,66 @@
+import json
+import re
+
+from indice_lexical import normalizar_texto
+
+
+def regex_de_trie(frases: list) -> str:
+    # Monta a alternância como uma árvore de prefixos ("qual (o|a) ...") para que a regex
+    # não teste cada frase do início: o custo depende do tamanho da pergunta, não do número de frases.
+    trie = {}
+    for frase in frases:
+        no = trie
+        for caractere in frase:
+            no = no.setdefault(caractere, {})
+        no[""] = True
+
+    def montar(no):
+        final = "" in no
+        ramos = [re.escape(caractere) + montar(filho) for caractere, filho in sorted(no.items()) if caractere]
+        if not ramos:
+            return ""
+        corpo = ramos[0] if len(ramos) == 1 else "(?:" + "|".join(ramos) + ")"
+        # Um prefixo que também é frase completa torna o resto opcional; o "?" guloso prefere a mais longa
+        return f"(?:{corpo})?" if final else corpo
+
+    return montar(trie)
+
+
+class RoteadorDeIntencoes:
+    # As frases-gatilho de cada intenção (vindas de um JSON) viram uma regex em forma de trie,
+    # compilada no carregamento. As intenções são testadas na ordem do arquivo e vale a primeira que
+    # casa: uma regex única com finditer consumiria um gatilho de menor prioridade e esconderia um de
+    # maior prioridade sobreposto a ele ("pedi o contato que voce faz").
+    def __init__(self, intencoes: list, manipuladores: dict = None):
+        self.intencoes = intencoes
+        self.manipuladores = dict(manipuladores or {})
+        self.intencao_por_gatilho = {}
+
+        for prioridade, intencao in enumerate(intencoes):
+            intencao["prioridade"] = prioridade
+            for gatilho in intencao.get("gatilhos", []):
+                self.intencao_por_gatilho.setdefault(normalizar_texto(gatilho).strip(), intencao)
+
+        self.padroes = []
+        for intencao in intencoes:
+            gatilhos = [gatilho for gatilho, dona in self.intencao_por_gatilho.items() if dona is intencao]
+            if gatilhos:
+                self.padroes.append((intencao, re.compile(regex_de_trie(gatilhos))))
+
+
+    @classmethod
+    def carregar(cls, caminho: str, manipuladores: dict = None):
+        with open(caminho, "r", encoding="utf-8") as f:
+            return cls(json.load(f)["intencoes"], manipuladores)
+
+
+    def registrar_manipulador(self, nome: str, funcao):
+        self.manipuladores[nome] = funcao
+
+
+    def rotear(self, pergunta: str):
+        pergunta_normalizada = normalizar_texto(pergunta)
+        for intencao, padrao in self.padroes:
+            if padrao.search(pergunta_normalizada):
+                return intencao, self.manipuladores.get(intencao.get("manipulador"))
+        return None, None
@@ -0,0 +1,234 @@
+import queue
+import time
+from collections import defaultdict
+from threading import Lock, Thread
+
+from backends_de_geracao import suporta_lote
+from metricas_de_latencia import MedidorDeGeracao
+from perfis_de_decodificacao import obter_perfil
+
+FIM_DO_FLUXO = object()
+
+
+def ids_de_fim(modelo, tokenizer) -> set:
+    # O generate para nos eos da generation_config (no Gemma-3, também o <end_of_turn>), que
+    # podem não incluir o eos do tokenizer e vice-versa
+    ids = set()
+    for eos in (getattr(getattr(modelo, "generation_config", None), "eos_token_id", None), tokenizer.eos_token_id):
+        if eos is not None:
+            ids.update(eos if isinstance(eos, (list, tuple)) else [eos])
+    return ids
+
+
+class StreamerEmLote:
+    # Distribui os tokens de um generate em lote para a fila de cada pedido e marca, no medidor
+    # de cada um, o início do generate, o primeiro token e o fim. Uma linha termina no primeiro
+    # token de fim ou de padding (o generate preenche com padding as linhas que o critério de
+    # parada encerrou), sem esperar a linha mais lenta do lote. O generate só chama put e end,
+    # então não é preciso herdar de BaseStreamer (e importar o transformers com este módulo).
+    def __init__(self, tokenizer, filas, medidores=None, ids_fim=None, id_padding=None, trava=None):
+        self.tokenizer = tokenizer
+        # Mesma trava do tokenizer usada pelas threads dos pedidos (tokenizers "fast" não são thread-safe)
+        self.trava = trava or Lock()
+        self.filas = filas
+        self.medidores = medidores or [MedidorDeGeracao() for _ in filas]
+        self.tokens = [[] for _ in filas]
+        self.textos_emitidos = ["" for _ in filas]
+        self.encerrados = [False for _ in filas]
+        self.prompt_recebido = False
+
+        self.ids_fim = set(ids_fim) if ids_fim is not None else ids_de_fim(None, tokenizer)
+        if id_padding is not None:
+            self.ids_fim.add(id_padding)
+
+
+    def put(self, valor):
+        # A primeira chamada traz os ids do prompt, que não devem ser transmitidos
+        if not self.prompt_recebido:
+            self.prompt_recebido = True
+            for medidor in self.medidores:
+                medidor.iniciar()
+            return
+
+        linhas = valor.reshape(len(self.filas), -1).tolist()
+        for i, novos_tokens in enumerate(linhas):
+            if self.encerrados[i]:
+                continue
+            for token in novos_tokens:
+                if token in self.ids_fim:
+                    self._encerrar(i)
+                    break
+                self.tokens[i].append(token)
+                self.medidores[i].registrar_tokens(1)
+            else:
+                self._emitir(i)
+
+
+    def end(self):
+        for i in range(len(self.filas)):
+            if not self.encerrados[i]:
+                self._encerrar(i)
+
+
+    def _emitir(self, i, final=False):
+        with self.trava:
+            texto = self.tokenizer.decode(self.tokens[i], skip_special_tokens=True)
+        # Segura caracteres multibyte incompletos até o próximo token
+        if not final and texto.endswith("�"):
+            return
+        novo_trecho = texto[len(self.textos_emitidos[i]):]
+        if novo_trecho:
+            self.textos_emitidos[i] = texto
+            self.filas[i].put(novo_trecho)
+
+
+    def _encerrar(self, i):
+        self.medidores[i].encerrar()
+        self._emitir(i, final=True)
+        self.encerrados[i] = True
+        self.filas[i].put(FIM_DO_FLUXO)
+
+
+class PedidoDeGeracao:
+    def __init__(self, ids_prompt: list, max_tokens: int, perfil: str):
+        self.ids_prompt = ids_prompt
+        self.max_tokens = max_tokens
+        self.perfil = perfil
+        self.fila = queue.Queue()
+        self.medidor = MedidorDeGeracao()
+
+
+    def pedacos(self):
+        while True:
+            pedaco = self.fila.get()
+            if pedaco is FIM_DO_FLUXO:
+                return
+            if isinstance(pedaco, Exception):
+                raise pedaco
+            yield pedaco
+
+
+class ServidorDeInferencia:
+    # Serviço único por processo: dono de um RAGPipeline, agrupa os prompts pendentes
+    # das sessões em lotes e executa um generate com padding para cada lote.
+    def __init__(self, rag, max_lote: int = 8, max_espera_segundos: float = 0.05):
+        self.rag = rag
+        self.max_lote = max_lote
+        self.max_espera_segundos = max_espera_segundos
+        self.pendentes = queue.Queue()
+        self.ativo = False
+        self.thread = None
+
+
+    def iniciar(self):
+        if self.ativo:
+            return self
+        self.ativo = True
+        self.thread = Thread(target=self._laco, name="servidor-de-inferencia", daemon=True)
+        self.thread.start()
+        return self
+
+
+    def parar(self):
+        self.ativo = False
+        self.pendentes.put(None)
+        if self.thread is not None:
+            self.thread.join()
+
+
+    def pronto(self) -> bool:
+        return self.rag.pronto()
+
+
+    def estado_recursos(self) -> dict:
+        return self.rag.estado_recursos()
+
+
+    def iter_resposta(self, pergunta: str, top_k: int = 3, max_tokens: int = None, perfil: str = None):
+        # Mesma interface de RAGPipeline.iter_resposta; a recuperação roda na thread
+        # de quem chama e só a geração passa pela fila compartilhada.
+        preparo = self.rag.preparar_geracao(pergunta, top_k)
+
+        if preparo["resposta"] is not None:
+            yield preparo["resposta"]
+            return preparo["resposta"]
+
+        # O lote não usa beam search: perfis com beams caem para um perfil sem beams
+        preparo["perfil"], _ = obter_perfil(perfil, streaming=True)
+        pedido = PedidoDeGeracao(preparo["ids_prompt"], max_tokens, preparo["perfil"])
+        preparo["medidor"] = pedido.medidor
+        self.pendentes.put(pedido)
+
+        return (yield from self.rag.transmitir_resposta(preparo, pedido.pedacos()))
+
+
+    def gerar_resposta(self, pergunta: str, top_k: int = 3, max_tokens: int = None, perfil: str = None):
+        fluxo = self.iter_resposta(pergunta, top_k, max_tokens, perfil)
+        while True:
+            try:
+                next(fluxo)
+            except StopIteration as fim:
+                return fim.value
+
+
+    def _coletar_lote(self):
+        primeiro = self.pendentes.get()
+        if primeiro is None:
+            return []
+
+        lote = [primeiro]
+        prazo = time.monotonic() + self.max_espera_segundos
+        while len(lote) < self.max_lote:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                pedido = self.pendentes.get(timeout=restante)
+            except queue.Empty:
+                break
+            if pedido is None:
+                self.ativo = False
+                break
+            lote.append(pedido)
+        return lote
+
+
+    def _laco(self):
+        while self.ativo:
+            lote = self._coletar_lote()
+            if not lote:
+                continue
+
+            # Um erro aqui (ex.: o modelo não carregou) não pode matar a thread: os pedidos do lote
+            # recebem a exceção em vez de esperar para sempre pela fila
+            try:
+                # Cada generate usa um único perfil: pedidos de perfis diferentes viram sublotes
+                por_perfil = defaultdict(list)
+                for pedido in lote:
+                    por_perfil[pedido.perfil].append(pedido)
+
+                # Backends sem geração em lote (llama.cpp) atendem um pedido por vez
+                em_lote = suporta_lote(self.rag.modelo)
+                for perfil, pedidos in por_perfil.items():
+                    for sublote in ([pedidos] if em_lote else [[pedido] for pedido in pedidos]):
+                        self._gerar_sublote(perfil, sublote)
+            except Exception as e:
+                print(f"Erro no servidor de inferência: {e}")
+                for pedido in lote:
+                    pedido.fila.put(e)
+
+
+    def _gerar_sublote(self, perfil: str, pedidos: list):
+        filas = [pedido.fila for pedido in pedidos]
+        try:
+            # Cada pedido para no seu próprio max_tokens
+            self.rag.gerar_em_lote(
+                [pedido.ids_prompt for pedido in pedidos],
+                max_tokens=[pedido.max_tokens for pedido in pedidos],
+                streamer=StreamerEmLote(self.rag.tokenizer, filas, [pedido.medidor for pedido in pedidos], ids_de_fim(self.rag.modelo, self.rag.tokenizer), self.rag.id_padding, self.rag.trava_tokenizer),
+                perfil=perfil
+            )
+        except Exception as e:
+            print(f"Erro na geração em lote: {e}")
+            for fila in filas:
+                fila.put(e)
@@ -0,0 +1,162 @@
+import argparse
+import json
+import resource
+import sys
+import time
+from difflib import SequenceMatcher
+from threading import Lock
+
+from backends_de_geracao import BACKENDS
+from carregador_de_recursos import carregar_indice_lexical, carregar_modelo_de_linguagem, carregar_pacote_de_indice, carregar_tokenizer
+from empacotador_de_contexto import EmpacotadorDeContexto
+from modelo_com_rag import INSTRUCOES_PROMPT
+from perfis_de_decodificacao import PERFIS, ParadaPorCaracteres, argumentos_generate
+
+PERGUNTAS_PADRAO = [
+    "O que é identidade de gênero?",
+    "Qual a diferença entre orientação sexual e identidade de gênero?",
+    "O que significa a sigla LGBTI+?",
+    "Como posso apoiar uma pessoa trans na minha família?",
+    "O que é nome social e como solicitar?",
+    "Onde encontro atendimento para pessoas LGBTI+ em São Paulo?",
+    "O que fazer em caso de violência LGBTfóbica?",
+    "O que é transfobia?"
+]
+
+
+def montar_prompts(perguntas, tokenizer, caminho_bm25, caminho_pacote, caminho_id_texto, top_k):
+    # A recuperação aqui é só BM25, sem embeddings: o que se compara é a geração, com prompts idênticos
+    indice_lexical = carregar_indice_lexical(caminho_bm25)
+    textos = carregar_pacote_de_indice(caminho_pacote, caminho_id_texto)
+    empacotador = EmpacotadorDeContexto(lambda: tokenizer, Lock(), INSTRUCOES_PROMPT)
+
+    prompts = []
+    for pergunta in perguntas:
+        trechos = [(id_doc, textos.texto(id_doc)) for id_doc, _ in indice_lexical.buscar(pergunta, top_k)]
+        prompts.append(empacotador.empacotar(pergunta, trechos)["ids"])
+    return prompts
+
+
+def gerar_saidas(modelo, tokenizer, prompts, perfil, max_tokens):
+    import torch
+    from transformers import StoppingCriteriaList
+
+    configuracao = PERFIS[perfil]
+    saidas = []
+    for ids_prompt in prompts:
+        input_ids = torch.tensor([ids_prompt], device=modelo.device)
+        inicio = time.perf_counter()
+        with torch.no_grad():
+            saida_ids = modelo.generate(
+                input_ids=input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                **argumentos_generate(configuracao, max_tokens),
+                pad_token_id=tokenizer.eos_token_id,
+                stopping_criteria=StoppingCriteriaList([ParadaPorCaracteres(tokenizer, len(ids_prompt), configuracao["max_caracteres"])])
+            )
+        duracao = time.perf_counter() - inicio
+        novos_ids = saida_ids[0][len(ids_prompt):].tolist()
+        saidas.append({
+            "ids": novos_ids,
+            "texto": tokenizer.decode(novos_ids, skip_special_tokens=True).strip(),
+            "segundos": duracao,
+            "tokens_por_segundo": len(novos_ids) / duracao if duracao > 0 else 0.0
+        })
+    return saidas
+
+
+def prefixo_comum(a: list, b: list) -> int:
+    tamanho = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        tamanho += 1
+    return tamanho
+
+
+def comparar(referencias, saidas):
+    # Com decodificação gulosa, backends equivalentes divergem pouco e tarde; a similaridade de
+    # caracteres captura divergências que ainda dão respostas praticamente iguais
+    comparacoes = []
+    for referencia, saida in zip(referencias, saidas):
+        comparacoes.append({
+            "identica": referencia["ids"] == saida["ids"],
+            "tokens_iniciais_iguais": prefixo_comum(referencia["ids"], saida["ids"]),
+            "similaridade": SequenceMatcher(None, referencia["texto"], saida["texto"]).ratio()
+        })
+    return comparacoes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara as respostas de um backend de geração com as saídas de referência (hf, float32, decodificação gulosa).")
+    parser.add_argument("--backend", choices=BACKENDS, default="hf")
+    parser.add_argument("--gerar-referencias", action="store_true", help="Gera as saídas de referência com o backend escolhido em vez de comparar.")
+    parser.add_argument("--referencias", default="referencias_paridade.json")
+    parser.add_argument("--modelo", default="CEIA-UFG/Gemma-3-Gaia-PT-BR-4b-it")
+    parser.add_argument("--gguf", default=None, help="Modelo GGUF para o backend llama_cpp.")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--perguntas", default=None, help="Arquivo JSON com uma lista de perguntas (padrão: lista embutida).")
+    parser.add_argument("--bm25", default="indice_bm25.json")
+    parser.add_argument("--pacote", default="indice_vivi.pacote")
+    parser.add_argument("--textos", default="id_para_texto.json")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--max-tokens", type=int, default=None)
+    parser.add_argument("--limiar-similaridade", type=float, default=0.8, help="Similaridade média mínima para considerar o backend equivalente.")
+    parser.add_argument("--saida", default=None, help="Arquivo JSON para salvar o relatório.")
+    args = parser.parse_args()
+
+    perguntas = PERGUNTAS_PADRAO
+    if args.perguntas:
+        with open(args.perguntas, "r", encoding="utf-8") as f:
+            perguntas = json.load(f)
+
+    tokenizer = carregar_tokenizer(args.modelo)
+    prompts = montar_prompts(perguntas, tokenizer, args.bm25, args.pacote, args.textos, args.top_k)
+
+    inicio = time.perf_counter()
+    modelo = carregar_modelo_de_linguagem(args.modelo, args.backend, args.gguf, args.threads)
+    tempo_carregamento = time.perf_counter() - inicio
+    # ru_maxrss vem em KiB no Linux
+    memoria_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Backend '{args.backend}' carregado em {tempo_carregamento:.1f}s, pico de memória {memoria_mb:.0f} MB.")
+
+    # Sempre o perfil guloso: amostragem tornaria a comparação aleatória
+    saidas = gerar_saidas(modelo, tokenizer, prompts, "rapido", args.max_tokens)
+
+    if args.gerar_referencias:
+        with open(args.referencias, "w", encoding="utf-8") as f:
+            json.dump({"modelo": args.modelo, "backend": args.backend, "perguntas": perguntas, "saidas": saidas}, f, ensure_ascii=False, indent=2)
+        print(f"Referências de {len(saidas)} perguntas salvas em '{args.referencias}'.")
+        sys.exit(0)
+
+    with open(args.referencias, "r", encoding="utf-8") as f:
+        referencias = json.load(f)
+    if referencias["perguntas"] != perguntas:
+        sys.exit("As perguntas diferem das usadas nas referências; gere as referências de novo.")
+
+    comparacoes = comparar(referencias["saidas"], saidas)
+    print(f"\n{'#':>2} | {'idêntica':>8} | {'tokens iguais':>13} | {'similaridade':>12} | {'tokens/s':>8} | pergunta")
+    for i, (pergunta, comparacao, saida) in enumerate(zip(perguntas, comparacoes, saidas)):
+        print(f"{i:>2} | {str(comparacao['identica']):>8} | {comparacao['tokens_iniciais_iguais']:>13} | {comparacao['similaridade']:>12.3f} | {saida['tokens_por_segundo']:>8.1f} | {pergunta}")
+
+    relatorio = {
+        "backend": args.backend,
+        "referencia": referencias["backend"],
+        "identicas": sum(c["identica"] for c in comparacoes) / len(comparacoes),
+        "similaridade_media": sum(c["similaridade"] for c in comparacoes) / len(comparacoes),
+        "tokens_por_segundo": sum(s["tokens_por_segundo"] for s in saidas) / len(saidas),
+        "tokens_por_segundo_referencia": sum(s["tokens_por_segundo"] for s in referencias["saidas"]) / len(referencias["saidas"]),
+        "memoria_pico_mb": memoria_mb,
+        "carregamento_s": tempo_carregamento,
+        "comparacoes": comparacoes
+    }
+    print(f"\nRespostas idênticas: {relatorio['identicas']:.0%} | similaridade média: {relatorio['similaridade_media']:.3f} | "
+          f"tokens/s: {relatorio['tokens_por_segundo']:.1f} (referência {relatorio['tokens_por_segundo_referencia']:.1f}) | memória: {memoria_mb:.0f} MB")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+        print(f"Relatório salvo em '{args.saida}'.")
+
+    if relatorio["similaridade_media"] < args.limiar_similaridade:
+        sys.exit(f"Backend '{args.backend}' abaixo do limiar de similaridade ({args.limiar_similaridade}).")